@@ -0,0 +1,86 @@
+"""
+Production gunicorn configuration.
+
+    python manage.py serve
+    # or: gunicorn moon_ecommerce.wsgi  (run from this directory, which picks up this file)
+
+The master imports the application once (preload_app), warms it up and
+freezes the objects it created out of the garbage collector. Workers are
+forked from it and share those memory pages copy-on-write instead of each
+importing Django, the views and the compiled templates again. Each worker
+then opens its own database connection before it takes its first request,
+and is replaced after GUNICORN_MAX_REQUESTS requests so slow leaks and
+fragmentation never build up.
+
+Every setting can be overridden from the environment or .env.
+"""
+import gc
+import logging
+import multiprocessing
+
+# Not 'config': gunicorn reads every module-level name as a setting of the same name
+from decouple import config as env
+
+logger = logging.getLogger('gunicorn.error')
+
+wsgi_app = 'moon_ecommerce.wsgi:application'
+bind = env('GUNICORN_BIND', default='127.0.0.1:8000')
+workers = env('GUNICORN_WORKERS', default=multiprocessing.cpu_count() * 2 + 1, cast=int)
+preload_app = True
+
+# Recycle workers, staggered so they don't all restart at once
+max_requests = env('GUNICORN_MAX_REQUESTS', default=2000, cast=int)
+max_requests_jitter = env('GUNICORN_MAX_REQUESTS_JITTER', default=200, cast=int)
+
+timeout = env('GUNICORN_TIMEOUT', default=30, cast=int)
+graceful_timeout = env('GUNICORN_GRACEFUL_TIMEOUT', default=30, cast=int)
+keepalive = env('GUNICORN_KEEPALIVE', default=5, cast=int)
+# Worker heartbeats on tmpfs; a disk-backed /tmp can stall them under I/O load
+worker_tmp_dir = env('GUNICORN_WORKER_TMP_DIR', default='/dev/shm')
+
+accesslog = env('GUNICORN_ACCESS_LOG', default='-')
+errorlog = '-'
+
+
+def _warm_up():
+    from store import payments, startup
+
+    templates = startup.warm_up()
+    payments.preload()
+    return len(templates)
+
+
+def when_ready(server):
+    # The master, after the preloaded app is imported and before any worker forks
+    if not server.cfg.preload_app:
+        return
+    count = _warm_up()
+    # Refcount and GC bookkeeping would otherwise write to (and so copy) every
+    # shared page in every worker; frozen objects are never scanned
+    gc.collect()
+    gc.freeze()
+    logger.info("Warmed up: URLconf resolved, %d templates compiled", count)
+
+
+def post_fork(server, worker):
+    from django.db import connections
+
+    # Sockets must never be shared with the master or sibling workers
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    # The worker's app is loaded; connect before accepting requests
+    if not worker.cfg.preload_app:
+        _warm_up()
+    from django.db import DatabaseError, connection
+
+    from store import catalog_cache
+
+    try:
+        connection.ensure_connection()
+    except DatabaseError as e:
+        # Serve anyway; the first request retries the connection
+        logger.warning("Worker %s could not connect to the database: %s", worker.pid, e)
+    # Per-worker thread evicting cached catalog data edited on other servers
+    catalog_cache.start_listener()
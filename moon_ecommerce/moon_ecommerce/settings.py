@@ -46,6 +46,12 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # Add for static file serving
+    # Pre-rendered catalog pages for anonymous visitors, before sessions and the database
+    "store.middleware.CatalogSnapshotMiddleware",
+    # Sitemaps and the product feed, straight from disk
+    "store.middleware.FeedMiddleware",
+    # Outside sessions so that session writes also pin the visitor to the primary
+    "store.routers.ReplicaStickinessMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -59,16 +65,25 @@ SESSION_ENGINE = "django.contrib.sessions.backends.db"
 
 ROOT_URLCONF = "moon_ecommerce.urls"
 
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Compile each template once per process in production
+            "loaders": TEMPLATE_LOADERS if DEBUG else [
+                ("django.template.loaders.cached.Loader", TEMPLATE_LOADERS),
+            ],
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "store.context_processors.cart",
             ],
         },
     },
@@ -88,9 +103,44 @@ DATABASES = {
         "PASSWORD": config('DB_PASSWORD'),
         "HOST": config('DB_HOST'),
         "PORT": config('DB_PORT', default='5432'),
+        # Keep connections to the remote server open between requests instead of
+        # paying the TCP + TLS + auth handshake every time; checked before reuse
+        "CONN_MAX_AGE": config('DB_CONN_MAX_AGE', default=300, cast=int),
+        "CONN_HEALTH_CHECKS": config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        "OPTIONS": {
+            "connect_timeout": config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+            # Notice dead connections (e.g. dropped by a NAT) instead of hanging
+            "keepalives": 1,
+            "keepalives_idle": 60,
+        },
     }
 }
 
+# Alternatively, a connection pool per worker process. Needs psycopg 3 and
+# psycopg-pool (pip install "psycopg[binary,pool]"). Size it so that
+# DB_POOL_MAX_SIZE x worker processes stays below Postgres max_connections.
+if config('DB_POOL', default=False, cast=bool):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0  # The pool owns connection reuse
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": config('DB_POOL_MIN_SIZE', default=2, cast=int),
+        "max_size": config('DB_POOL_MAX_SIZE', default=4, cast=int),
+        "timeout": config('DB_POOL_TIMEOUT', default=10, cast=int),
+    }
+
+# Read replicas (comma-separated hosts) for catalog pages, order history and
+# admin reports; see store/routers.py. Writes and checkout stay on the primary.
+DATABASE_REPLICAS = []
+for number, replica_host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    alias = 'replica' if number == 1 else f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": replica_host,
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ["store.routers.ReplicaRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -125,6 +175,9 @@ SQUARE_ACCESS_TOKEN = config('SQUARE_ACCESS_TOKEN')
 SQUARE_APPLICATION_ID = config('SQUARE_APPLICATION_ID')
 SQUARE_LOCATION_ID = config('SQUARE_LOCATION_ID')
 SQUARE_ENVIRONMENT = config('SQUARE_ENVIRONMENT', default='sandbox')  # 'sandbox' or 'production'
+# Webhook subscription signature key and the exact notification URL registered with Square
+SQUARE_WEBHOOK_SIGNATURE_KEY = config('SQUARE_WEBHOOK_SIGNATURE_KEY', default='')
+SQUARE_WEBHOOK_URL = config('SQUARE_WEBHOOK_URL', default='')
 
 # Authentication settings
 LOGIN_URL = '/accounts/login/'
@@ -149,13 +202,33 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Whitenoise configuration for production static file serving
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Whitenoise configuration for production static file serving: hashed,
+# compressed file names (from collectstatic) so stylesheets can be cached
+# forever by browsers. Development serves the files as they are.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+            else "whitenoise.storage.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Pre-rendered catalog pages (manage.py build_static_catalog) served to anonymous visitors
+CATALOG_SNAPSHOTS = config('CATALOG_SNAPSHOTS', default=False, cast=bool)
+CATALOG_SNAPSHOT_ROOT = config('CATALOG_SNAPSHOT_ROOT', default=str(BASE_DIR / 'catalog_snapshot'))
+
+# Sitemaps and the product feed (manage.py build_feeds), served as static gzip files
+SITE_URL = config('SITE_URL', default='https://moonwake.tyler.ag')
+FEEDS_ROOT = config('FEEDS_ROOT', default=str(BASE_DIR / 'feeds'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,306 @@
+"""
+Sales analytics rollups.
+
+Orders are folded into the rollups as they change: update_orders() applies an
+order's totals as increments when it is placed, takes them out again when
+it is cancelled or refunded, and flags each order with in_rollups so a
+retry never counts it twice. New orders, webhook status updates and admin
+status changes call it.
+
+refresh_day() recomputes the rollup rows for one calendar day (UTC) from
+that day's orders, live and archived. It is idempotent and used by
+`manage.py backfill_sales_rollups` to rebuild history, or a day whose orders
+had their amounts or items edited.
+
+Both take the same per-day advisory lock, so they never interleave on a day.
+
+The report helpers below read only the rollup tables, except the
+variation-level ones at the end, which query the indexed OrderItemOption
+snapshot of each item's variation choices.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, prefetch_related_objects
+from django.utils import timezone
+
+from .models import (
+    ArchivedOrder, Jewelry, Order, OrderItem, OrderItemOption, ProductVariation, DailySales, HourlySales,
+    DailyProductSales, DailyVariationSales,
+)
+
+# First key of the per-day advisory lock taken by refresh_day and update_orders
+ROLLUP_LOCK_NAMESPACE = 7301
+
+# Orders that do not count towards revenue
+EXCLUDED_STATUSES = ['cancelled', 'refunded']
+
+LINE_TOTAL = ExpressionWrapper(F('price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def day_bounds(day):
+    start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+    return start, start + datetime.timedelta(days=1)
+
+
+def _lock_day(day):
+    """Serialize rollup writes for one day until the transaction ends (Postgres; the development SQLite has one writer)"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [ROLLUP_LOCK_NAMESPACE, day.toordinal()])
+
+
+def update_orders(order_ids):
+    """
+    Bring the rollups in step with the current status of these orders: add
+    the ones that count and are not in them yet, take out the cancelled or
+    refunded ones that are. Orders already in step are left alone.
+    """
+    orders = Order.objects.filter(pk__in=order_ids)
+    for day in order_days(orders):
+        start, end = day_bounds(day)
+        with transaction.atomic():
+            _lock_day(day)
+            # The row locks make a concurrent status change wait until the flags below are written
+            changed = [
+                order for order in orders.filter(created_at__gte=start, created_at__lt=end).select_for_update()
+                if order.in_rollups == (order.status in EXCLUDED_STATUSES)
+            ]
+            if not changed:
+                continue
+            prefetch_related_objects(changed, 'items')
+            adding = [order for order in changed if not order.in_rollups]
+            removing = [order for order in changed if order.in_rollups]
+            totals = _Totals()
+            totals.add(adding)
+            totals.add(removing, sign=-1)
+            totals.apply()
+            Order.objects.filter(pk__in=[order.pk for order in adding]).update(in_rollups=True)
+            Order.objects.filter(pk__in=[order.pk for order in removing]).update(in_rollups=False)
+
+
+def refresh_day(day):
+    """Rebuild every rollup row for `day` from its live and archived orders"""
+    with transaction.atomic():
+        # A concurrent refresh or update waits here, then sees what committed meanwhile
+        _lock_day(day)
+        _rebuild_day(day)
+
+
+class _Totals:
+    """Rollup rows for a set of orders, keyed like the rollup tables' unique columns"""
+    def __init__(self):
+        self.days = {}        # date -> [orders, items_sold, revenue]
+        self.hours = {}       # hour -> [orders, items_sold, revenue]
+        self.products = {}    # (date, jewelry_id) -> [quantity, revenue]
+        self.variations = {}  # (date, product_variation_id, jewelry_id) -> [quantity, revenue]
+
+    def add(self, orders, sign=1):
+        """Count Order objects with their items (live, or rebuilt from the archive); sign=-1 subtracts them"""
+        for order in orders:
+            created_at = order.created_at.astimezone(datetime.timezone.utc)
+            day, hour = created_at.date(), created_at.replace(minute=0, second=0, microsecond=0)
+            items = list(order.items.all())
+            items_sold = sum(item.quantity for item in items)
+            for totals in (self.days.setdefault(day, [0, 0, 0]), self.hours.setdefault(hour, [0, 0, 0])):
+                totals[0] += sign
+                totals[1] += sign * items_sold
+                totals[2] += sign * order.total_amount
+            for item in items:
+                rows = [self.products.setdefault((day, item.jewelry_id), [0, 0])]
+                if item.product_variation_id:
+                    rows.append(self.variations.setdefault((day, item.product_variation_id, item.jewelry_id), [0, 0]))
+                for row in rows:
+                    row[0] += sign * item.quantity
+                    row[1] += sign * item.total_price
+
+    def apply(self):
+        """Add these totals to the stored rows as increments; rows left with nothing sold are deleted"""
+        categories = dict(
+            Jewelry.objects.filter(pk__in={jewelry_id for _, jewelry_id in self.products})
+            .values_list('pk', 'category_id')
+        )
+        for date, (orders, items_sold, revenue) in self.days.items():
+            _increment(DailySales, {'date': date}, orders=orders, items_sold=items_sold, revenue=revenue)
+        for hour, (orders, items_sold, revenue) in self.hours.items():
+            _increment(HourlySales, {'hour': hour}, orders=orders, items_sold=items_sold, revenue=revenue)
+        for (date, jewelry_id), (quantity, revenue) in self.products.items():
+            _increment(
+                DailyProductSales, {'date': date, 'jewelry_id': jewelry_id},
+                {'category_id': categories.get(jewelry_id)}, quantity=quantity, revenue=revenue,
+            )
+        for (date, variation_id, jewelry_id), (quantity, revenue) in self.variations.items():
+            _increment(
+                DailyVariationSales, {'date': date, 'product_variation_id': variation_id},
+                {'jewelry_id': jewelry_id}, quantity=quantity, revenue=revenue,
+            )
+        DailySales.objects.filter(date__in=self.days, orders__lte=0).delete()
+        HourlySales.objects.filter(hour__in=self.hours, orders__lte=0).delete()
+        DailyProductSales.objects.filter(date__in={date for date, _ in self.products}, quantity__lte=0).delete()
+        DailyVariationSales.objects.filter(date__in={key[0] for key in self.variations}, quantity__lte=0).delete()
+
+    def replace(self, day):
+        """Write the rows for `day`, replacing whatever was stored"""
+        start, end = day_bounds(day)
+        DailySales.objects.filter(date=day).delete()
+        HourlySales.objects.filter(hour__gte=start, hour__lt=end).delete()
+        DailyProductSales.objects.filter(date=day).delete()
+        DailyVariationSales.objects.filter(date=day).delete()
+
+        # Archived items can point at products deleted since; those only count in the day totals
+        categories = dict(
+            Jewelry.objects.filter(pk__in={jewelry_id for _, jewelry_id in self.products})
+            .values_list('pk', 'category_id')
+        )
+        variations = set(
+            ProductVariation.objects.filter(pk__in={key[1] for key in self.variations}).values_list('pk', flat=True)
+        )
+        DailySales.objects.bulk_create([
+            DailySales(date=date, orders=orders, items_sold=items_sold, revenue=revenue)
+            for date, (orders, items_sold, revenue) in self.days.items()
+        ])
+        HourlySales.objects.bulk_create([
+            HourlySales(hour=hour, orders=orders, items_sold=items_sold, revenue=revenue)
+            for hour, (orders, items_sold, revenue) in self.hours.items()
+        ])
+        DailyProductSales.objects.bulk_create([
+            DailyProductSales(
+                date=date, jewelry_id=jewelry_id, category_id=categories[jewelry_id], quantity=quantity, revenue=revenue,
+            )
+            for (date, jewelry_id), (quantity, revenue) in self.products.items()
+            if jewelry_id in categories
+        ])
+        DailyVariationSales.objects.bulk_create([
+            DailyVariationSales(
+                date=date, product_variation_id=variation_id, jewelry_id=jewelry_id, quantity=quantity, revenue=revenue,
+            )
+            for (date, variation_id, jewelry_id), (quantity, revenue) in self.variations.items()
+            if variation_id in variations
+        ])
+
+
+def _increment(model, keys, defaults=None, **deltas):
+    """Add `deltas` to the row matching `keys`, creating it if missing (the day's lock is held)"""
+    if not any(deltas.values()):
+        return
+    updated = model.objects.filter(**keys).update(**{name: F(name) + delta for name, delta in deltas.items()})
+    if not updated and min(deltas.values()) >= 0:
+        model.objects.create(**keys, **(defaults or {}), **deltas)
+
+
+def _rebuild_day(day):
+    start, end = day_bounds(day)
+    # Locked so no status changes between counting an order and flagging it
+    orders = list(
+        Order.objects.filter(created_at__gte=start, created_at__lt=end).select_for_update().prefetch_related('items')
+    )
+    counted = [order for order in orders if order.status not in EXCLUDED_STATUSES]
+    totals = _Totals()
+    totals.add(counted)
+    # Archived orders still count on the day they were placed
+    totals.add(
+        archived.as_order() for archived in
+        ArchivedOrder.objects.filter(created_at__gte=start, created_at__lt=end).exclude(status__in=EXCLUDED_STATUSES)
+    )
+    totals.replace(day)
+    Order.objects.filter(pk__in=[order.pk for order in counted if not order.in_rollups]).update(in_rollups=True)
+    Order.objects.filter(
+        pk__in=[order.pk for order in orders if order.in_rollups and order.status in EXCLUDED_STATUSES]
+    ).update(in_rollups=False)
+
+
+def refresh_days(days):
+    for day in sorted(set(days)):
+        refresh_day(day)
+
+
+def order_days(orders):
+    """Distinct UTC days the given order queryset was created on"""
+    return list(orders.dates('created_at', 'day'))
+
+
+# Reports (rollup tables only)
+
+def default_range(days=30):
+    end = timezone.now().date()
+    return end - datetime.timedelta(days=days - 1), end
+
+
+def revenue_by_day(start, end):
+    return DailySales.objects.filter(date__range=(start, end)).order_by('date')
+
+
+def summary(start, end):
+    return DailySales.objects.filter(date__range=(start, end)).aggregate(
+        orders=Sum('orders'), items_sold=Sum('items_sold'), revenue=Sum('revenue')
+    )
+
+
+def top_products(start, end, limit=10):
+    return (
+        DailyProductSales.objects.filter(date__range=(start, end))
+        .values('jewelry_id', 'jewelry__name')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:limit]
+    )
+
+
+def top_variations(start, end, limit=10):
+    return (
+        DailyVariationSales.objects.filter(date__range=(start, end))
+        .values('product_variation_id', 'product_variation__sku', 'jewelry__name')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by('-revenue')[:limit]
+    )
+
+
+def category_mix(start, end):
+    return (
+        DailyProductSales.objects.filter(date__range=(start, end))
+        .values('category__name')
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+        .order_by('-revenue')
+    )
+
+
+# Variation-level sales (order items joined to their indexed option snapshot)
+
+def items_with_choices(start, end, choices=None, jewelry=None):
+    """
+    Counted order items created between the `start` and `end` days
+    (inclusive) whose variation matched every {type: value} in `choices`,
+    e.g. {'Size': '7', 'Stone': 'Ruby'}.
+    """
+    items = OrderItem.objects.filter(
+        order__created_at__gte=day_bounds(start)[0], order__created_at__lt=day_bounds(end)[1],
+    ).exclude(order__status__in=EXCLUDED_STATUSES)
+    if jewelry is not None:
+        items = items.filter(jewelry=jewelry)
+    for variation_type, value in (choices or {}).items():
+        # One indexed subquery per choice: the item needs all of them
+        items = items.filter(
+            pk__in=OrderItemOption.objects.filter(variation_type=variation_type, value=value).values('order_item')
+        )
+    return items
+
+
+def variation_sales(start, end, choices=None, jewelry=None):
+    """Units and revenue of items matching `choices`, e.g. Size 7 Ruby rings this quarter"""
+    totals = items_with_choices(start, end, choices, jewelry).aggregate(
+        units=Sum('quantity'), revenue=Sum(LINE_TOTAL)
+    )
+    return {'quantity': totals['units'] or 0, 'revenue': totals['revenue'] or 0}
+
+
+def variation_breakdown(start, end, variation_type, choices=None, jewelry=None):
+    """Units and revenue per value of one variation type, e.g. per Size"""
+    items = items_with_choices(start, end, choices, jewelry)
+    return (
+        OrderItemOption.objects.filter(variation_type=variation_type, order_item__in=items)
+        .values('value')
+        .annotate(
+            quantity=Sum('order_item__quantity'),
+            revenue=Sum(F('order_item__price') * F('order_item__quantity'), output_field=LINE_TOTAL.output_field),
+        )
+        .order_by('-quantity', 'value')
+    )
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class StoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "store"
+
+    def ready(self):
+        # Register background tasks in every process (web and worker)
+        from . import tasks  # noqa: F401
+        # Per-process connection counters
+        from . import db  # noqa: F401
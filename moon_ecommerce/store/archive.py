@@ -0,0 +1,80 @@
+"""
+Cold archive for old orders.
+
+`manage.py archive_orders` moves closed orders (and their items) older than
+the retention window out of the hot Order/OrderItem tables into
+ArchivedOrder, one compact row per order. Order history, the order
+confirmation page, the admin and order exports read both tables, so
+archived orders stay visible to customers and staff.
+
+analytics.refresh_day counts archived orders on the day they were placed,
+so rebuilding the rollups of a day gives the same totals after archiving.
+"""
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, CheckoutSession, Order
+
+# Orders that can no longer change
+CLOSED_STATUSES = ['completed', 'cancelled', 'refunded']
+# Square accepts refunds for a year after payment and disputes can come as late.
+# Webhooks only update live orders, so an order must not be archived while
+# either can still arrive.
+MIN_MONTHS = 13
+
+
+def cutoff(months, now=None):
+    """Orders created before this moment are old enough to archive"""
+    return (now or timezone.now()) - datetime.timedelta(days=months * 30)
+
+
+def archivable(before):
+    return Order.objects.filter(status__in=CLOSED_STATUSES, created_at__lt=before)
+
+
+def archive_orders(before, batch_size=500):
+    """Move closed orders created before `before` to the archive. Returns the count moved."""
+    if before > cutoff(MIN_MONTHS):
+        raise ValueError(f"Orders younger than {MIN_MONTHS} months can still be refunded or disputed")
+    moved = 0
+    while True:
+        with transaction.atomic():
+            orders = list(
+                archivable(before).order_by('created_at')
+                .select_for_update(skip_locked=True, of=('self',))
+                .select_related('shipping_address', 'billing_address')
+                .prefetch_related('items__jewelry')[:batch_size]
+            )
+            if not orders:
+                return moved
+            ArchivedOrder.objects.bulk_create([ArchivedOrder.from_order(order) for order in orders])
+            # Items cascade; inventory movements keep their rows with order set to NULL
+            Order.objects.filter(pk__in=[order.pk for order in orders]).delete()
+            # A spent checkout token must never look open again (for_cart reuses open ones)
+            CheckoutSession.objects.filter(
+                pk__in=[order.checkout_session_id for order in orders if order.checkout_session_id]
+            ).delete()
+        moved += len(orders)
+
+
+def orders_for(user):
+    """A user's live and archived orders, newest first, as Order objects"""
+    live = list(
+        Order.objects.filter(user=user).select_related('shipping_address').prefetch_related('items__jewelry')
+    )
+    archived = [archived.as_order() for archived in ArchivedOrder.objects.filter(user=user)]
+    return sorted(live + archived, key=lambda order: order.created_at, reverse=True)
+
+
+def find_order(order_id, user):
+    """A user's order by id, from the live table or the archive; None if neither has it"""
+    order = (
+        Order.objects.filter(id=order_id, user=user).select_related('shipping_address')
+        .prefetch_related('items__jewelry').first()
+    )
+    if order is None:
+        archived = ArchivedOrder.objects.filter(id=order_id, user=user).first()
+        order = archived.as_order() if archived else None
+    return order
@@ -0,0 +1,74 @@
+"""
+Set-based bulk edits used by the admin actions.
+
+Each operation is a single UPDATE with F() expressions, no per-row save()
+or signals. Dependent data is refreshed once per batch afterwards, and
+bulk_updated is sent once with the affected primary keys.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Value
+from django.db.models.functions import Now, Round
+
+from . import inventory, tasks
+from .models import ProductVariation
+from .signals import bulk_updated
+
+
+def _apply(queryset, **changes):
+    model = queryset.model
+    pks = list(queryset.values_list('pk', flat=True))
+    if not pks:
+        return 0, pks
+    updated = model.objects.filter(pk__in=pks).update(**changes)
+    bulk_updated.send(sender=model, pks=pks)
+    return updated, pks
+
+
+def set_order_status(queryset, status):
+    """Set the status of many orders and bring the sales rollups in step with one task"""
+    updated, pks = _apply(queryset, status=status, updated_at=Now())
+    if pks:
+        tasks.enqueue('update_sales_rollups', order_ids=pks)
+    return updated
+
+
+def record_stock(queryset, kind, amount, note=''):
+    """
+    Append one ledger movement per selected item and move the stock counters
+    in a single UPDATE (never below zero). Used for adjustments and receipts.
+    """
+    model = queryset.model
+    pks = list(queryset.values_list('pk', flat=True))
+    if not pks:
+        return 0
+    recorded = inventory.record_for_queryset(model.objects.filter(pk__in=pks), kind, amount, note)
+    bulk_updated.send(sender=model, pks=pks)
+    return recorded
+
+
+def adjust_stock(queryset, amount):
+    """Add (or subtract, for negative amounts) stock as ledger adjustments"""
+    return record_stock(queryset, 'adjustment', amount, note='Bulk admin adjustment')
+
+
+def receive_stock(queryset, amount):
+    """Book a receipt of `amount` units for every selected item"""
+    return record_stock(queryset, 'receipt', amount, note='Bulk admin receipt')
+
+
+def reprice(queryset, percent):
+    """Change Jewelry prices by a percentage, rounded to cents"""
+    factor = Value(1 + Decimal(percent) / 100, output_field=DecimalField(max_digits=12, decimal_places=6))
+    return _apply(
+        queryset,
+        price=Round(F('price') * factor, 2, output_field=DecimalField(max_digits=10, decimal_places=2)),
+        updated_at=Now(),
+    )[0]
+
+
+def set_active(queryset, active):
+    """Activate/deactivate Jewelry or make variations (un)available"""
+    if queryset.model is ProductVariation:
+        return _apply(queryset, is_available=active, updated_at=Now())[0]
+    return _apply(queryset, is_active=active, updated_at=Now())[0]
@@ -0,0 +1,240 @@
+"""
+Per-process catalog cache, kept coherent across app servers.
+
+Product page data is cached in each worker's memory, tagged with the rows
+it was built from ('jewelry:12', 'category:3', 'variationoption:7').
+Signal handlers in models.py publish the tags of every saved or deleted
+Jewelry, Category, VariationType, VariationOption and ProductVariation;
+bulk price and stock edits publish theirs explicitly.
+
+Publishing runs `pg_notify` on the writing connection, so Postgres delivers
+the message to every listener when (and only if) the transaction commits.
+Each worker process runs a listener thread with its own connection to the
+primary that LISTENs on CHANNEL and evicts the tagged entries. The writing
+process also evicts its own entries on commit, so an admin sees their edit
+on the next request.
+
+The local tier is only used while the listener is connected. When it is
+not (other database vendors such as SQLite, or while reconnecting after an
+error) reads go straight to the database, and entries are dropped whenever
+the listener (re)connects, since messages may have been missed meanwhile.
+Entries also expire after CATALOG_CACHE_TIMEOUT seconds.
+"""
+import copy
+import logging
+import os
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.utils import load_backend
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'store_catalog_invalidate'
+CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+MAX_ENTRIES = getattr(settings, 'CATALOG_CACHE_MAX_ENTRIES', 5000)
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD = 7000
+# Longest single wait for notifications
+POLL_SECONDS = 5
+
+_lock = threading.Lock()
+_entries = {}  # key -> (expires, tags, value)
+_keys_by_tag = {}
+# Bumped by every eviction; a value built while it changed may be stale and is not stored
+_epoch = 0
+_listening = threading.Event()
+_listener = None
+
+
+def tag(model_or_instance, pk=None):
+    """'jewelry:12' for a Jewelry instance, or for (Jewelry, 12)"""
+    if pk is None:
+        pk = model_or_instance.pk
+    return f"{model_or_instance._meta.model_name}:{pk}"
+
+
+def _index_tags(tags):
+    # 'jewelry:12' is also filed under 'jewelry', which evicts every product's entries
+    return set(tags) | {name.partition(':')[0] for name in tags}
+
+
+# Local tier
+
+def enabled():
+    """Whether the local tier is in use in this process (starts the listener on first call)"""
+    start_listener()
+    return _listening.is_set()
+
+
+def get_or_set(key, build, timeout=None):
+    """
+    The cached value for `key`, or build() -> (value, tags) stored under the
+    given tags. Without a connected listener, build() runs every time.
+    """
+    if not enabled():
+        return build()[0]
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[2]
+        epoch = _epoch
+    value, tags = build()
+    with _lock:
+        if epoch == _epoch:
+            _store(key, value, tags, now + (CACHE_TIMEOUT if timeout is None else timeout))
+    return value
+
+
+def _store(key, value, tags, expires):
+    _discard(key)
+    while len(_entries) >= MAX_ENTRIES:
+        _discard(next(iter(_entries)))  # Oldest first
+    tags = _index_tags(tags)
+    _entries[key] = (expires, tags, value)
+    for name in tags:
+        _keys_by_tag.setdefault(name, set()).add(key)
+
+
+def _discard(key):
+    entry = _entries.pop(key, None)
+    if entry is not None:
+        for name in entry[1]:
+            keys = _keys_by_tag.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del _keys_by_tag[name]
+
+
+def evict(tags):
+    """Drop this process's entries built from any of `tags`"""
+    global _epoch
+    with _lock:
+        _epoch += 1
+        for name in tags:
+            for key in list(_keys_by_tag.get(name, ())):
+                _discard(key)
+
+
+def clear():
+    global _epoch
+    with _lock:
+        _epoch += 1
+        _entries.clear()
+        _keys_by_tag.clear()
+
+
+# Publishing
+
+def _payloads(tags):
+    payload = []
+    size = 0
+    for name in tags:
+        if payload and size + len(name) + 1 > MAX_PAYLOAD:
+            yield ' '.join(payload)
+            payload, size = [], 0
+        payload.append(name)
+        size += len(name) + 1
+    if payload:
+        yield ' '.join(payload)
+
+
+def publish(*tags, using=DEFAULT_DB_ALIAS):
+    """Evict `tags` on every node once the current transaction commits"""
+    tags = sorted(set(tags))
+    if not tags:
+        return
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        # Transactional: listeners only hear it if the transaction commits
+        with connection.cursor() as cursor:
+            for payload in _payloads(tags):
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+    transaction.on_commit(lambda: evict(tags), using=using)
+
+
+# Listening
+
+def _listener_connection():
+    """A private connection to the primary (NOTIFY is not replicated), outside any pool"""
+    settings_dict = copy.deepcopy(connections.settings[DEFAULT_DB_ALIAS])
+    settings_dict['OPTIONS'].pop('pool', None)  # Never hold a pooled connection forever
+    backend = load_backend(settings_dict['ENGINE'])
+    return backend.DatabaseWrapper(settings_dict, DEFAULT_DB_ALIAS)
+
+
+def _notifications(raw, timeout):
+    """Payloads received on `raw` (a psycopg connection) within `timeout` seconds"""
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+    if is_psycopg3:
+        for notify in raw.notifies(timeout=timeout):
+            yield notify.payload
+        return
+    if not raw.notifies and select.select([raw], [], [], timeout)[0]:
+        raw.poll()
+    while raw.notifies:
+        yield raw.notifies.pop(0).payload
+
+
+class Listener(threading.Thread):
+    """Evicts local entries on NOTIFY; reconnects with backoff if the connection drops"""
+    def __init__(self):
+        super().__init__(name='catalog-cache-listener', daemon=True)
+
+    def run(self):
+        delay = 1
+        while True:
+            wrapper = _listener_connection()
+            try:
+                wrapper.ensure_connection()
+                with wrapper.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                clear()  # Anything cached before now may have missed messages
+                _listening.set()
+                delay = 1
+                # A dead connection raises here; TCP keepalives (DATABASES OPTIONS) notice dropped ones
+                while True:
+                    for payload in _notifications(wrapper.connection, POLL_SECONDS):
+                        evict(payload.split())
+            except Exception:
+                logger.warning("Catalog cache listener lost its connection; retrying in %ss", delay, exc_info=True)
+            finally:
+                _listening.clear()
+                try:
+                    wrapper.close()
+                except Exception:
+                    pass
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+
+def start_listener():
+    """Start this process's listener thread if the database supports LISTEN. Idempotent."""
+    global _listener
+    if _listener is not None or connections[DEFAULT_DB_ALIAS].vendor != 'postgresql':
+        return _listener
+    with _lock:
+        if _listener is None:
+            _listener = Listener()
+            _listener.start()
+    return _listener
+
+
+def _after_fork():
+    # Threads do not survive fork: a forked worker starts its own listener and an empty cache
+    global _lock, _listening, _listener, _epoch
+    _lock = threading.Lock()
+    _listening = threading.Event()
+    _listener = None
+    _entries.clear()
+    _keys_by_tag.clear()
+    _epoch = 0
+
+
+os.register_at_fork(after_in_child=_after_fork)
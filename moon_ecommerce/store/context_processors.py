@@ -0,0 +1,65 @@
+"""
+Template context shared by every page.
+
+The cart badge reads a small summary (item count and subtotal) kept in the
+session, so rendering the nav costs no cart query. The cart views rewrite the
+summary after every change. The value is lazy: pages that do not use it do
+not touch the session either, which keeps them cacheable, and fully cached
+pages fetch the badge from `cart/summary/` instead (see cart_badge.html).
+"""
+from decimal import Decimal
+
+from django.utils.functional import SimpleLazyObject
+
+from .models import Cart
+
+SESSION_KEY = 'cart_summary'
+
+EMPTY_SUMMARY = {'count': 0, 'subtotal': Decimal('0.00')}
+
+
+def _owner(request):
+    # A cart belongs to the user, or to the session for anonymous visitors
+    return request.user.pk if request.user.is_authenticated else None
+
+
+def summarize(cart):
+    """Item count and subtotal for a cart (one query)"""
+    items = cart.cartitem_set.select_related('jewelry', 'product_variation') if cart else []
+    return {
+        'count': sum(item.quantity for item in items),
+        'subtotal': sum((item.total_price for item in items), Decimal('0.00')),
+    }
+
+
+def remember_cart(request, cart):
+    """Store the summary after the cart changed"""
+    summary = summarize(cart)
+    request.session[SESSION_KEY] = {
+        'owner': _owner(request), 'count': summary['count'], 'subtotal': str(summary['subtotal']),
+    }
+    return summary
+
+
+def cart_summary(request):
+    """The stored summary, recomputed only if missing or for another owner (e.g. after login)"""
+    stored = request.session.get(SESSION_KEY)
+    if stored and stored.get('owner') == _owner(request):
+        return {'count': stored['count'], 'subtotal': Decimal(stored['subtotal'])}
+
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).first()
+    elif request.session.session_key:
+        cart = Cart.objects.filter(session_key=request.session.session_key).first()
+    else:
+        # No session yet, so no cart; do not start a session just for the badge
+        return dict(EMPTY_SUMMARY)
+    return remember_cart(request, cart)
+
+
+def cart(request):
+    return {
+        'cart_summary': SimpleLazyObject(lambda: cart_summary(request)),
+        # Set by http_caching.cacheable_page on pages served from shared caches
+        'defer_cart_badge': getattr(request, 'defer_cart_badge', False),
+    }
@@ -0,0 +1,82 @@
+"""
+Database connection statistics and the connection-setup benchmark.
+
+Connections are reused across requests (CONN_MAX_AGE with health checks)
+or, with DB_POOL=True, taken from a psycopg connection pool. See the
+DATABASES setting. The counters here are per process.
+"""
+import statistics
+import threading
+import time
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+_lock = threading.Lock()
+_opened = {}
+
+
+@receiver(connection_created)
+def count_new_connection(sender, connection, **kwargs):
+    with _lock:
+        _opened[connection.alias] = _opened.get(connection.alias, 0) + 1
+
+
+def connection_stats(alias='default'):
+    """Reuse settings, connections opened by this process and pool statistics if pooled"""
+    connection = connections[alias]
+    settings_dict = connection.settings_dict
+    stats = {
+        'alias': alias,
+        'vendor': connection.vendor,
+        'conn_max_age': settings_dict['CONN_MAX_AGE'],
+        'health_checks': settings_dict['CONN_HEALTH_CHECKS'],
+        'opened_by_process': _opened.get(alias, 0),
+        'connected': connection.connection is not None,
+    }
+    pool = getattr(connection, 'pool', None)
+    if pool is not None:
+        # psycopg_pool: pool_size, pool_available, requests_waiting, connections_ms, ...
+        stats['pool'] = pool.get_stats()
+    return stats
+
+
+def _percentiles(timings):
+    ordered = sorted(timings)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return statistics.median(ordered), p99
+
+
+def benchmark(alias='default', iterations=200):
+    """
+    Time a trivial query the way a request runs it, first opening a new
+    connection every time (no reuse), then on one reused connection.
+    Uses private connection objects, so the caller's connection is untouched.
+    Returns {'fresh': (p50_ms, p99_ms), 'reused': (p50_ms, p99_ms)}.
+    """
+    def query(connection):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+
+    fresh = []
+    for _ in range(iterations):
+        connection = connections.create_connection(alias)
+        started = time.perf_counter()
+        query(connection)
+        fresh.append((time.perf_counter() - started) * 1000)
+        connection.close()
+
+    reused = []
+    connection = connections.create_connection(alias)
+    query(connection)  # Opened once, as a persistent connection would be
+    try:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            query(connection)
+            reused.append((time.perf_counter() - started) * 1000)
+    finally:
+        connection.close()
+
+    return {'fresh': _percentiles(fresh), 'reused': _percentiles(reused)}
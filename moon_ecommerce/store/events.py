@@ -0,0 +1,97 @@
+"""
+Events page data and RSVPs.
+
+Event.rsvp_count is changed only by conditional UPDATEs, so capacity holds
+under concurrent RSVPs without counting rows or locking the event.
+
+The events page data is cached until the next event starts (when it moves
+from upcoming to past). Its cache key includes the latest Event.updated_at
+and the number of events, read with one aggregate query, so an edit,
+deletion or RSVP made through any app server changes the key everywhere,
+whatever cache backend each process uses.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import Event, EventRSVP
+
+PAST_EVENTS_PER_PAGE = 12
+# Upper bound on how long the page data is cached when no event is upcoming
+CACHE_TIMEOUT = getattr(settings, 'EVENTS_CACHE_TIMEOUT', 3600)
+
+
+def _version():
+    """Changes whenever an event is saved, deleted or RSVP'd to (RSVP updates bump updated_at)"""
+    state = Event.objects.order_by().aggregate(updated=Max('updated_at'), count=Count('pk'))
+    updated = state['updated'].timestamp() if state['updated'] else 0
+    return f"{state['count']}-{updated}"
+
+
+def listing(page_number=1, now=None):
+    """
+    Upcoming events and one page of the past-events archive, as plain data.
+    Served from the cache until the next event boundary.
+    """
+    now = now or timezone.now()
+    try:
+        page_number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        page_number = 1
+    key = f"events:{_version()}:page:{page_number}"
+    data = cache.get(key)
+    if data is not None:
+        return data
+
+    # Both filters lead with is_active, date to use event_active_date_idx
+    active = Event.objects.filter(is_active=True)
+    upcoming = list(active.filter(date__gte=now).order_by('date'))
+    page = Paginator(active.filter(date__lt=now).order_by('-date'), PAST_EVENTS_PER_PAGE).get_page(page_number)
+    data = {
+        'upcoming_events': upcoming,
+        'past_events': list(page.object_list),
+        'page_number': page.number,
+        'num_pages': page.paginator.num_pages,
+    }
+
+    timeout = CACHE_TIMEOUT
+    if upcoming:
+        # The first upcoming event turns into a past event at its start time
+        timeout = min(timeout, max((upcoming[0].date - now).total_seconds(), 1))
+    cache.set(key, data, timeout)
+    return data
+
+
+def rsvp(event, user):
+    """Reserve a place for `user`. Raises ValidationError if that is not possible."""
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                EventRSVP.objects.create(event=event, user=user)
+        except IntegrityError:
+            raise ValidationError(f"You have already RSVP'd to {event.title}.")
+        reserved = (
+            Event.objects.filter(pk=event.pk, is_active=True, date__gte=timezone.now())
+            .filter(Q(max_attendees__isnull=True) | Q(rsvp_count__lt=F('max_attendees')))
+            .update(rsvp_count=F('rsvp_count') + 1, updated_at=Now())
+        )
+        if not reserved:
+            # Rolls back the RSVP row as well
+            if event.is_past:
+                raise ValidationError(f"{event.title} has already taken place.")
+            raise ValidationError(f"Sorry, {event.title} is fully booked.")
+
+
+def cancel_rsvp(event, user):
+    """Give the place back. Returns False if the user had no RSVP."""
+    with transaction.atomic():
+        deleted, _ = EventRSVP.objects.filter(event=event, user=user).delete()
+        if not deleted:
+            return False
+        Event.objects.filter(pk=event.pk, rsvp_count__gt=0).update(rsvp_count=F('rsvp_count') - 1, updated_at=Now())
+    return True
@@ -0,0 +1,162 @@
+"""
+Streaming order exports for fulfilment and accounting.
+
+Orders are read with QuerySet.iterator(chunk_size=...), which uses a
+server-side cursor on Postgres and prefetches items one chunk at a time, so
+memory stays flat regardless of how many orders are exported. Output is
+produced line by line for StreamingHttpResponse or a file.
+
+Archived orders (see store/archive.py) are exported too: pass an
+ArchivedOrder queryset as `archived` and its rows are merged into the live
+ones in created_at order, rebuilt with ArchivedOrder.as_order().
+"""
+import csv
+import heapq
+import json
+from itertools import islice
+
+from .analytics import day_bounds
+from .models import ArchivedOrder, Jewelry, Order, ProductVariation
+
+CHUNK_SIZE = 500
+
+ORDER_COLUMNS = [
+    'order_id', 'created_at', 'status', 'username', 'full_name', 'email', 'phone',
+    'shipping_street', 'shipping_city', 'shipping_state', 'shipping_zip', 'shipping_country',
+    'billing_street', 'billing_city', 'billing_state', 'billing_zip', 'billing_country',
+    'total_amount', 'square_payment_id',
+]
+ITEM_COLUMNS = ['item_id', 'jewelry_id', 'jewelry_name', 'sku', 'variation', 'quantity', 'unit_price', 'line_total']
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer streaming"""
+    def write(self, value):
+        return value
+
+
+def filter_orders(queryset=None, start=None, end=None, status=None):
+    """Restrict orders (or an ArchivedOrder queryset) by creation date (inclusive days) and status"""
+    orders = queryset if queryset is not None else Order.objects.all()
+    # Plain datetime ranges so an index on created_at can be used
+    if start:
+        orders = orders.filter(created_at__gte=day_bounds(start)[0])
+    if end:
+        orders = orders.filter(created_at__lt=day_bounds(end)[1])
+    if status:
+        orders = orders.filter(status=status)
+    return orders
+
+
+def filter_archived_orders(start=None, end=None, status=None):
+    """The archived orders filter_orders() would select from the live table"""
+    return filter_orders(ArchivedOrder.objects.all(), start, end, status)
+
+
+def iter_orders(orders, chunk_size=CHUNK_SIZE, archived=None):
+    orders = (
+        orders.select_related('user', 'shipping_address', 'billing_address')
+        .prefetch_related('items__jewelry', 'items__product_variation')
+        .order_by('created_at', 'id')
+    )
+    orders = orders.iterator(chunk_size=chunk_size)
+    if archived is None:
+        return orders
+    return heapq.merge(
+        orders, iter_archived_orders(archived, chunk_size), key=lambda order: (order.created_at, order.id)
+    )
+
+
+def iter_archived_orders(archived, chunk_size=CHUNK_SIZE):
+    """Archived orders as Order objects, oldest first, with current SKUs looked up once per chunk"""
+    rows = archived.select_related('user').order_by('created_at', 'id').iterator(chunk_size=chunk_size)
+    while chunk := [row.as_order() for row in islice(rows, chunk_size)]:
+        items = [item for order in chunk for item in order.items.all()]
+        # Products may have been deleted since; their lines export without a SKU
+        variations = ProductVariation.objects.only('sku').in_bulk(
+            {item.product_variation_id for item in items if item.product_variation_id}
+        )
+        skus = dict(Jewelry.objects.filter(pk__in={item.jewelry_id for item in items}).values_list('pk', 'sku'))
+        for item in items:
+            item.product_variation = variations.get(item.product_variation_id)
+            item.jewelry.sku = skus.get(item.jewelry_id)
+        yield from chunk
+
+
+def address_fields(prefix, address):
+    # Flat columns named as before addresses became shared rows
+    return {
+        f'{prefix}_street': address.street,
+        f'{prefix}_city': address.city,
+        f'{prefix}_state': address.state,
+        f'{prefix}_zip': address.zip_code,
+        f'{prefix}_country': address.country,
+    }
+
+
+def order_fields(order):
+    return {
+        'order_id': order.id,
+        'created_at': order.created_at.isoformat(),
+        'status': order.status,
+        'username': order.user.username,
+        'full_name': order.full_name,
+        'email': order.email,
+        'phone': order.phone,
+        **address_fields('shipping', order.shipping_address),
+        **address_fields('billing', order.billing_address),
+        'total_amount': str(order.total_amount),
+        'square_payment_id': order.square_payment_id or '',
+    }
+
+
+def item_fields(item):
+    # The variation snapshot taken at order time, not the current variation
+    options = (item.variation_data or {}).get('variation_options', [])
+    return {
+        'item_id': item.id,
+        'jewelry_id': item.jewelry_id,
+        'jewelry_name': item.jewelry.name,
+        'sku': (item.product_variation.sku if item.product_variation else item.jewelry.sku) or '',
+        'variation': '; '.join(f"{option['type']}: {option['value']}" for option in options),
+        'quantity': item.quantity,
+        'unit_price': str(item.price),
+        'line_total': str(item.total_price),
+    }
+
+
+def stream_csv(orders, chunk_size=CHUNK_SIZE, archived=None):
+    """Yield CSV lines, one row per order item (orders without items get one row)"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(ORDER_COLUMNS + ITEM_COLUMNS)
+    for order in iter_orders(orders, chunk_size, archived):
+        fields = order_fields(order)
+        row = [fields[column] for column in ORDER_COLUMNS]
+        items = list(order.items.all())
+        if not items:
+            yield writer.writerow(row)
+        for item in items:
+            item_row = item_fields(item)
+            yield writer.writerow(row + [item_row[column] for column in ITEM_COLUMNS])
+
+
+def stream_jsonl(orders, chunk_size=CHUNK_SIZE, archived=None):
+    """Yield one JSON document per order, with its items nested"""
+    for order in iter_orders(orders, chunk_size, archived):
+        document = order_fields(order)
+        document['items'] = [
+            {**item_fields(item), 'variation_data': item.variation_data}
+            for item in order.items.all()
+        ]
+        yield json.dumps(document) + '\n'
+
+
+def stream(orders, fmt='csv', chunk_size=CHUNK_SIZE, archived=None):
+    if fmt == 'jsonl':
+        return stream_jsonl(orders, chunk_size, archived)
+    return stream_csv(orders, chunk_size, archived)
@@ -0,0 +1,251 @@
+"""
+Sitemaps and the shopping product feed, written as static gzip files.
+
+`manage.py build_feeds` (cron) writes under FEEDS_ROOT:
+
+    sitemap.xml.gz               sitemap index
+    sitemap-pages.xml.gz         home, shop, events, custom orders
+    sitemap-products-<n>.xml.gz  active products with SITEMAP_PAGE_SIZE consecutive ids each
+    product-feed.xml.gz          Google Shopping RSS feed, one item per available variation
+
+store.middleware.FeedMiddleware serves them at /sitemap.xml,
+/sitemap-products-1.xml, /product-feed.xml, ... without reaching a view.
+
+Products are streamed with QuerySet.iterator() and only() the columns
+written, so memory stays flat however large the catalog is. Rebuilds are
+incremental: as with catalog snapshots, the manifest records the
+updated_at/count state each file was written from, and only files whose
+state changed are rewritten.
+"""
+import gzip
+import io
+import json
+import os
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Prefetch
+from django.urls import reverse
+
+from .http_caching import catalog_state, combine, events_state
+from .models import Jewelry, ProductVariation
+
+MANIFEST_NAME = 'manifest.json'
+# The sitemap protocol allows 50,000 URLs per file
+SITEMAP_PAGE_SIZE = getattr(settings, 'SITEMAP_PAGE_SIZE', 10000)
+CHUNK_SIZE = 500
+
+SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def feeds_root():
+    return Path(getattr(settings, 'FEEDS_ROOT', settings.BASE_DIR / 'feeds'))
+
+
+def url_for(name):
+    """Public URL of a feed file: sitemap-products-1.xml.gz -> /sitemap-products-1.xml"""
+    return '/' + name.removesuffix('.gz')
+
+
+def load_manifest(root):
+    try:
+        with open(Path(root) / MANIFEST_NAME) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _state_key(state):
+    updated, count = state
+    return [updated.isoformat() if updated else None, count]
+
+
+class _GzipWriter:
+    """Text file written as deterministic gzip, moved into place on close"""
+    def __init__(self, target):
+        self.target = Path(target)
+        self.target.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.target.with_name(self.target.name + '.tmp')
+
+    def __enter__(self):
+        self.raw = open(self.tmp, 'wb')
+        self.text = io.TextIOWrapper(gzip.GzipFile(fileobj=self.raw, mode='wb', mtime=0), encoding='utf-8')
+        return self.text
+
+    def __exit__(self, exc_type, exc, tb):
+        self.text.close()
+        self.raw.close()
+        if exc_type is None:
+            os.replace(self.tmp, self.target)
+        else:
+            self.tmp.unlink(missing_ok=True)
+
+
+def _lastmod(moment):
+    return f"<lastmod>{moment.date().isoformat()}</lastmod>" if moment else ''
+
+
+# Sitemap files
+
+def product_pages():
+    """{page number: (latest updated_at, active product count)} in one grouped query"""
+    rows = (
+        Jewelry.objects.filter(is_active=True)
+        .annotate(page=(F('pk') - 1) / SITEMAP_PAGE_SIZE + 1)
+        .values('page')
+        .annotate(updated=Max('updated_at'), count=Count('pk'))
+        .order_by('page')
+    )
+    return {row['page']: (row['updated'], row['count']) for row in rows}
+
+
+def write_product_sitemap(target, page, base_url):
+    products = (
+        Jewelry.objects.filter(
+            is_active=True, pk__gt=(page - 1) * SITEMAP_PAGE_SIZE, pk__lte=page * SITEMAP_PAGE_SIZE
+        )
+        .only('pk', 'updated_at')
+        .order_by('pk')
+    )
+    with _GzipWriter(target) as out:
+        out.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n')
+        for jewelry in products.iterator(chunk_size=CHUNK_SIZE):
+            location = escape(base_url + reverse('product_detail', args=[jewelry.pk]))
+            out.write(f"<url><loc>{location}</loc>{_lastmod(jewelry.updated_at)}</url>\n")
+        out.write('</urlset>\n')
+
+
+def write_pages_sitemap(target, base_url, state):
+    with _GzipWriter(target) as out:
+        out.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n')
+        for name in ('home', 'product_list', 'events', 'custom_orders'):
+            out.write(f"<url><loc>{escape(base_url + reverse(name))}</loc>{_lastmod(state[0])}</url>\n")
+        out.write('</urlset>\n')
+
+
+def write_sitemap_index(target, base_url, entries):
+    with _GzipWriter(target) as out:
+        out.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n')
+        for name, updated in entries:
+            out.write(f"<sitemap><loc>{escape(base_url + url_for(name))}</loc>{_lastmod(updated)}</sitemap>\n")
+        out.write('</sitemapindex>\n')
+
+
+# Product feed
+
+def _feed_item(out, base_url, jewelry, variation=None):
+    source = variation or jewelry
+    image = (variation.image if variation and variation.image else None) or jewelry.image
+    title = jewelry.name
+    if variation is not None:
+        options = ', '.join(option.value for option in variation.variation_options.all())
+        title = f"{jewelry.name} - {options}" if options else jewelry.name
+    regular_price = variation.total_price if variation else jewelry.price
+    fields = [
+        ('g:id', source.sku or (f"{jewelry.pk}-{variation.pk}" if variation else str(jewelry.pk))),
+        ('g:title', title),
+        ('g:description', jewelry.description),
+        ('g:link', base_url + reverse('product_detail', args=[jewelry.pk])),
+        ('g:price', f"{regular_price:.2f} USD"),
+        ('g:availability', 'in_stock' if source.stock_quantity > 0 else 'out_of_stock'),
+        ('g:condition', 'new'),
+    ]
+    if source.on_sale:
+        fields.append(('g:sale_price', f"{source.current_price:.2f} USD"))
+    if image:
+        fields.append(('g:image_link', base_url + image.url))
+    if jewelry.category_id:
+        fields.append(('g:product_type', jewelry.category.name))
+    if variation is not None:
+        fields.append(('g:item_group_id', str(jewelry.pk)))
+    out.write('<item>')
+    out.write(''.join(f"<{tag}>{escape(str(value))}</{tag}>" for tag, value in fields))
+    out.write('</item>\n')
+
+
+def write_product_feed(target, base_url):
+    variations = (
+        ProductVariation.objects.filter(is_available=True)
+        .only(
+            'pk', 'jewelry_id', 'sku', 'price_adjustment', 'effective_price', 'stock_quantity', 'image',
+        )
+        .prefetch_related('variation_options')
+        .order_by('pk')
+    )
+    products = (
+        Jewelry.objects.filter(is_active=True)
+        .select_related('category')
+        .only(
+            'pk', 'name', 'description', 'price', 'effective_price', 'stock_quantity', 'sku', 'image',
+            'category__name',
+        )
+        .prefetch_related(Prefetch('product_variations', queryset=variations, to_attr='feed_variations'))
+        .order_by('pk')
+    )
+    with _GzipWriter(target) as out:
+        out.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<rss version="2.0" xmlns:g="http://base.google.com/ns/1.0"><channel>\n'
+            f"<title>Moon Jewelry</title><link>{escape(base_url + '/')}</link>"
+            "<description>Moon Jewelry products</description>\n"
+        )
+        # Prefetches run per chunk, so only CHUNK_SIZE products' variations are held at once
+        for jewelry in products.iterator(chunk_size=CHUNK_SIZE):
+            if jewelry.feed_variations:
+                for variation in jewelry.feed_variations:
+                    _feed_item(out, base_url, jewelry, variation)
+            else:
+                _feed_item(out, base_url, jewelry)
+        out.write('</channel></rss>\n')
+
+
+def build(root=None, base_url=None, full=False):
+    """
+    Rewrite the files whose data changed (every file with `full`) and drop
+    sitemap pages that no longer have products. `base_url` is the public
+    site URL (SITE_URL). Returns (written, removed) file names.
+    """
+    root = Path(root or feeds_root())
+    base_url = (base_url or settings.SITE_URL).rstrip('/')
+    manifest = load_manifest(root)
+    files = {}
+    written = []
+
+    def refresh(name, state, write, force=False):
+        key = [base_url, *_state_key(state)]
+        entry = manifest.get(name)
+        if full or force or not entry or entry['state'] != key or not (root / name).exists():
+            write(root / name)
+            written.append(name)
+        files[name] = {'state': key, 'updated': state[0].isoformat() if state[0] else None}
+
+    catalog = catalog_state(None)
+    pages_state = combine(catalog, events_state(None))
+    refresh('sitemap-pages.xml.gz', pages_state, lambda target: write_pages_sitemap(target, base_url, pages_state))
+    sitemaps = [('sitemap-pages.xml.gz', pages_state[0])]
+    for page, state in product_pages().items():
+        name = f'sitemap-products-{page}.xml.gz'
+        refresh(name, state, lambda target, page=page: write_product_sitemap(target, page, base_url))
+        sitemaps.append((name, state[0]))
+
+    refresh('product-feed.xml.gz', catalog, lambda target: write_product_feed(target, base_url))
+
+    stale = set(manifest) - set(files) - {'sitemap.xml.gz'}
+    # The index lists every sitemap with its lastmod; rewrite it when any of them changed
+    moments = [updated for _, updated in sitemaps if updated]
+    index_state = (max(moments) if moments else None, len(sitemaps))
+    refresh(
+        'sitemap.xml.gz', index_state, lambda target: write_sitemap_index(target, base_url, sitemaps),
+        force=bool(stale) or any(name.startswith('sitemap-') for name in written),
+    )
+
+    removed = []
+    for name in sorted(stale):
+        (root / name).unlink(missing_ok=True)
+        removed.append(name)
+
+    tmp = root / (MANIFEST_NAME + '.tmp')
+    tmp.write_text(json.dumps(files, indent=1))
+    os.replace(tmp, root / MANIFEST_NAME)
+    return written, removed
@@ -0,0 +1,123 @@
+"""
+HTTP caching for public catalog pages.
+
+@cacheable_page(validators) derives an ETag and Last-Modified from the
+latest updated_at (and row count, so deletions show up) of the rows a page
+displays. Conditional requests that still match get a 304 without the view
+running. Anonymous responses are public and may be served stale while the
+browser or CDN revalidates. Signed-in visitors get private responses, since
+the nav differs per user.
+
+The cart badge on these pages is fetched separately (defer_cart_badge), so
+the cached HTML is the same for every anonymous visitor.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from .models import Event, Jewelry, ProductVariation, RelatedProduct
+
+MAX_AGE = getattr(settings, 'CATALOG_CACHE_MAX_AGE', 60)
+STALE_WHILE_REVALIDATE = getattr(settings, 'CATALOG_STALE_WHILE_REVALIDATE', 300)
+
+
+def _freshness(queryset):
+    """(latest updated_at, row count) of a queryset, in one query"""
+    state = queryset.order_by().aggregate(updated=Max('updated_at'), count=Count('pk'))
+    return state['updated'], state['count']
+
+
+def combine(*states):
+    """Merge several (updated, count) states into one"""
+    moments = [updated for updated, _ in states if updated is not None]
+    return (max(moments) if moments else None), sum(count for _, count in states)
+
+
+# Validators for the views below
+
+def catalog_state(request):
+    return combine(_freshness(Jewelry.objects.all()), _freshness(ProductVariation.objects.all()))
+
+
+def product_state(request, pk):
+    related = RelatedProduct.objects.filter(jewelry_id=pk)
+    # The product and the recommended products whose cards the page shows, in one query
+    jewelry = (
+        Jewelry.objects.filter(Q(pk=pk) | Q(pk__in=related.values('related_id')))
+        .order_by().aggregate(updated=Max('updated_at'), count=Count('pk'), found=Count('pk', filter=Q(pk=pk)))
+    )
+    if not jewelry['found']:
+        return None  # Let the view raise its 404
+    return combine(
+        (jewelry['updated'], jewelry['count']),
+        _freshness(ProductVariation.objects.filter(jewelry_id=pk)),
+        _freshness(related),
+    )
+
+
+def events_state(request):
+    now = timezone.now()
+    active = Event.objects.filter(is_active=True)
+    updated, count = _freshness(active)
+    # An event moving from upcoming to past changes the page without any row changing
+    started = active.filter(date__lte=now).aggregate(latest=Max('date'))['latest']
+    return combine((updated, count), (started, 0))
+
+
+def cacheable_page(validators=None, max_age=None, stale_while_revalidate=None):
+    """
+    Add Cache-Control/Vary to a page and, with `validators`, ETag and
+    Last-Modified plus 304 handling. `validators(request, *args, **kwargs)`
+    returns (updated, count) or None when the page has nothing to validate.
+    """
+    max_age = MAX_AGE if max_age is None else max_age
+    stale_while_revalidate = STALE_WHILE_REVALIDATE if stale_while_revalidate is None else stale_while_revalidate
+
+    def decorator(view):
+        def state(request, *args, **kwargs):
+            # condition() asks for the ETag and Last-Modified separately; query once
+            if not hasattr(request, '_page_state'):
+                request._page_state = validators(request, *args, **kwargs) if validators else None
+            return request._page_state
+
+        def etag(request, *args, **kwargs):
+            page_state = state(request, *args, **kwargs)
+            if page_state is None:
+                return None
+            updated, count = page_state
+            variant = f"user-{request.user.pk}" if request.user.is_authenticated else 'anon'
+            key = f"{request.get_full_path()}:{updated.isoformat() if updated else ''}:{count}:{variant}"
+            return hashlib.md5(key.encode()).hexdigest()
+
+        def last_modified(request, *args, **kwargs):
+            page_state = state(request, *args, **kwargs)
+            return page_state[0] if page_state else None
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            request.defer_cart_badge = True
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            messages = getattr(request, '_messages', None)
+            if messages is not None and messages.used:
+                # Flash messages were rendered into this response; never reuse it
+                patch_cache_control(response, private=True, no_store=True)
+            elif request.user.is_authenticated:
+                patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+            else:
+                patch_cache_control(
+                    response, public=True, max_age=max_age, stale_while_revalidate=stale_while_revalidate
+                )
+            # Signed-in and anonymous visitors see different navs
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapped
+    return decorator
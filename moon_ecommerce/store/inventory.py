@@ -0,0 +1,185 @@
+"""
+Inventory ledger.
+
+Stock changes are appended to InventoryMovement and mirrored onto the
+stock_quantity counters with set-based UPDATEs. take_snapshot() periodically
+stores every item's level, so current_levels() only has to add up the
+movements recorded since the last snapshot, however long the ledger grows.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .models import InventoryMovement, InventorySnapshot, Jewelry, Order, ProductVariation
+
+LOW_STOCK_THRESHOLD = getattr(settings, 'LOW_STOCK_THRESHOLD', 3)
+
+
+def _update_counters(deltas):
+    """Apply {(jewelry_id, variation_id): delta} to the stock counters, grouped by delta"""
+    by_delta = {}
+    for (jewelry_id, variation_id), delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, ([], []))[1 if variation_id else 0].append(variation_id or jewelry_id)
+    for delta, (jewelry_ids, variation_ids) in by_delta.items():
+        stock = F('stock_quantity') + delta
+        if jewelry_ids:
+            Jewelry.objects.filter(pk__in=jewelry_ids).update(stock_quantity=stock, updated_at=Now())
+        if variation_ids:
+            ProductVariation.objects.filter(pk__in=variation_ids).update(stock_quantity=stock, updated_at=Now())
+
+
+def _locked_levels(keys):
+    """Current counters of the (jewelry_id, variation_id) items, locked until the transaction ends"""
+    jewelry_ids = sorted({jewelry_id for jewelry_id, variation_id in keys if not variation_id})
+    variation_ids = sorted({variation_id for _, variation_id in keys if variation_id})
+    levels = {
+        (pk, None): stock
+        for pk, stock in Jewelry.objects.select_for_update().filter(pk__in=jewelry_ids)
+        .order_by('pk').values_list('pk', 'stock_quantity')
+    }
+    levels.update(
+        ((jewelry_id, pk), stock)
+        for pk, jewelry_id, stock in ProductVariation.objects.select_for_update().filter(pk__in=variation_ids)
+        .order_by('pk').values_list('pk', 'jewelry_id', 'stock_quantity')
+    )
+    return levels
+
+
+def record(movements):
+    """
+    Append unsaved InventoryMovement objects and update the counters.
+
+    Counters never go below zero: a movement taking more than is in stock
+    is recorded with the quantity actually removed (the shortfall goes in
+    its note), so the ledger always adds up to the counters.
+    """
+    deltas = {}
+    with transaction.atomic():
+        levels = _locked_levels({(movement.jewelry_id, movement.product_variation_id) for movement in movements})
+        for movement in movements:
+            key = (movement.jewelry_id, movement.product_variation_id)
+            level = levels.get(key)
+            if level is not None:
+                applied = max(movement.quantity, -level)
+                if applied != movement.quantity:
+                    shortfall = f"requested {movement.quantity:+d}, {level} in stock"
+                    movement.note = f"{movement.note} ({shortfall})"[:255] if movement.note else shortfall
+                    movement.quantity = applied
+                levels[key] = level + applied
+            deltas[key] = deltas.get(key, 0) + movement.quantity
+        InventoryMovement.objects.bulk_create(movements, batch_size=500)
+        _update_counters(deltas)
+    return len(movements)
+
+
+def record_for_queryset(queryset, kind, quantity, note=''):
+    """The same movement for every selected Jewelry or ProductVariation (bulk receipts/adjustments)"""
+    if queryset.model is ProductVariation:
+        items = [(jewelry_id, pk) for pk, jewelry_id in queryset.values_list('pk', 'jewelry_id')]
+    else:
+        items = [(pk, None) for pk in queryset.values_list('pk', flat=True)]
+    return record([
+        InventoryMovement(jewelry_id=jewelry_id, product_variation_id=variation_id, kind=kind, quantity=quantity, note=note)
+        for jewelry_id, variation_id in items
+    ])
+
+
+def receive(lines, note=''):
+    """Bulk receipt entry: `lines` is an iterable of (jewelry_id, variation_id or None, quantity)"""
+    return record([
+        InventoryMovement(jewelry_id=jewelry_id, product_variation_id=variation_id, kind='receipt', quantity=quantity, note=note)
+        for jewelry_id, variation_id, quantity in lines
+        if quantity
+    ])
+
+
+def record_sale(order):
+    """Record the stock leaving for an order, once"""
+    with transaction.atomic():
+        # A re-claimed or concurrent task for the same order waits here, then sees the sale
+        if not list(Order.objects.select_for_update().filter(pk=order.pk).values_list('pk', flat=True)):
+            return 0  # Archived meanwhile
+        if InventoryMovement.objects.filter(order=order, kind='sale').exists():
+            return 0
+        return record([
+            InventoryMovement(
+                jewelry_id=item.jewelry_id, product_variation_id=item.product_variation_id,
+                kind='sale', quantity=-item.quantity, order=order, note=f"Order #{order.id}",
+            )
+            for item in order.items.all()
+        ])
+
+
+def current_levels(upto=None):
+    """
+    {(jewelry_id, variation_id): level} from the latest snapshot plus the
+    movements after it (optionally only up to movement id `upto`).
+    """
+    cursor = InventorySnapshot.objects.aggregate(cursor=Max('movement_cursor'))['cursor']
+    levels = {}
+    if cursor is not None:
+        for jewelry_id, variation_id, quantity in InventorySnapshot.objects.filter(
+            movement_cursor=cursor
+        ).values_list('jewelry_id', 'product_variation_id', 'quantity'):
+            levels[(jewelry_id, variation_id)] = quantity
+
+    # Primary key range scan: only movements since the snapshot
+    recent = InventoryMovement.objects.filter(pk__gt=cursor or 0)
+    if upto is not None:
+        recent = recent.filter(pk__lte=upto)
+    for row in recent.order_by().values('jewelry_id', 'product_variation_id').annotate(delta=Sum('quantity')):
+        key = (row['jewelry_id'], row['product_variation_id'])
+        levels[key] = levels.get(key, 0) + row['delta']
+    return levels
+
+
+def take_snapshot(settle_seconds=60):
+    """
+    Store every item's current level. Returns the number of rows written.
+
+    Movements from the last `settle_seconds` are left for the next snapshot,
+    so rows from transactions still in flight are not skipped by the cursor.
+    """
+    settled = timezone.now() - timedelta(seconds=settle_seconds)
+    with transaction.atomic():
+        cursor = InventoryMovement.objects.filter(created_at__lte=settled).aggregate(cursor=Max('id'))['cursor']
+        latest = InventorySnapshot.objects.aggregate(cursor=Max('movement_cursor'))['cursor']
+        if cursor is None or cursor == latest:
+            return 0  # Nothing moved since the last snapshot
+        snapshots = [
+            InventorySnapshot(jewelry_id=jewelry_id, product_variation_id=variation_id, quantity=level, movement_cursor=cursor)
+            for (jewelry_id, variation_id), level in current_levels(upto=cursor).items()
+        ]
+        InventorySnapshot.objects.bulk_create(snapshots, batch_size=500)
+    return len(snapshots)
+
+
+def low_stock(threshold=LOW_STOCK_THRESHOLD):
+    """Active items at or below `threshold` according to the ledger, lowest first"""
+    levels = current_levels()
+    report = []
+    simple_products = (
+        Jewelry.objects.filter(is_active=True)
+        .annotate(variation_count=Count('product_variations'))
+        .filter(variation_count=0)
+        .only('id', 'name', 'sku')
+    )
+    for jewelry in simple_products:
+        level = levels.get((jewelry.pk, None), 0)
+        if level <= threshold:
+            report.append({'jewelry': jewelry, 'variation': None, 'level': level})
+    variations = (
+        ProductVariation.objects.filter(is_available=True, jewelry__is_active=True)
+        .select_related('jewelry')
+        .only('id', 'sku', 'jewelry__id', 'jewelry__name', 'jewelry__sku')
+    )
+    for variation in variations:
+        level = levels.get((variation.jewelry_id, variation.pk), 0)
+        if level <= threshold:
+            report.append({'jewelry': variation.jewelry, 'variation': variation, 'level': level})
+    return sorted(report, key=lambda row: row['level'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store import promotions
+
+
+class Command(BaseCommand):
+    help = "Recompute effective prices from running promotions and schedule the next boundary"
+
+    def handle(self, *args, **options):
+        changed = promotions.refresh_prices()
+        boundary = promotions.schedule_next_refresh()
+        self.stdout.write(self.style.SUCCESS(f"Updated {changed} effective price(s)"))
+        if boundary:
+            self.stdout.write(f"Next promotion boundary: {boundary:%Y-%m-%d %H:%M %Z}")
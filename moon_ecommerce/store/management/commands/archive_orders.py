@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import archive
+
+
+class Command(BaseCommand):
+    help = "Move closed orders older than N months from the order tables to the archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=18, help='Keep orders younger than this live')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the orders that would move')
+
+    def handle(self, *args, **options):
+        months = options['months']
+        if months < archive.MIN_MONTHS:
+            raise CommandError(f"--months must be at least {archive.MIN_MONTHS}; younger orders can still change")
+        before = archive.cutoff(months)
+        if options['dry_run']:
+            count = archive.archivable(before).count()
+            self.stdout.write(f"{count} closed order(s) created before {before:%Y-%m-%d} would be archived")
+            return
+        moved = archive.archive_orders(before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} order(s) created before {before:%Y-%m-%d}"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from store.models import OrderItem, OrderItemOption
+
+
+class Command(BaseCommand):
+    help = "Create the indexed variation option rows for order items placed before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pending = (
+            OrderItem.objects.filter(variation_data__isnull=False, options__isnull=True)
+            .only('id', 'variation_data').order_by('id')
+        )
+        last_id = 0
+        items = created = 0
+        while True:
+            batch = list(pending.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            rows = [row for item in batch for row in item.snapshot_options()]
+            created += len(OrderItemOption.objects.bulk_create(rows, ignore_conflicts=True))
+            items += len(batch)
+            last_id = batch[-1].id
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {created} option(s) for {items} order item(s)"))
@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from store import analytics
+from store.models import ArchivedOrder, Order, DailySales
+
+
+class Command(BaseCommand):
+    help = "Rebuild the sales analytics rollup tables from existing orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        archived = ArchivedOrder.objects.all()
+        rollups = DailySales.objects.all()
+        if options['start']:
+            orders = orders.filter(created_at__gte=analytics.day_bounds(options['start'])[0])
+            archived = archived.filter(created_at__gte=analytics.day_bounds(options['start'])[0])
+            rollups = rollups.filter(date__gte=options['start'])
+        if options['end']:
+            orders = orders.filter(created_at__lt=analytics.day_bounds(options['end'])[1])
+            archived = archived.filter(created_at__lt=analytics.day_bounds(options['end'])[1])
+            rollups = rollups.filter(date__lte=options['end'])
+
+        # Days with orders, plus days whose stale rollups need clearing
+        days = sorted(
+            set(analytics.order_days(orders)) | set(analytics.order_days(archived))
+            | set(rollups.values_list('date', flat=True))
+        )
+        for day in days:
+            analytics.refresh_day(day)
+            self.stdout.write(f"Rebuilt {day}")
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {len(days)} day(s)"))
@@ -0,0 +1,75 @@
+import statistics
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from store import events
+from store.models import Jewelry, Order, ProductVariation
+
+
+def catalog_contexts(limit):
+    """(page, template, context) for the public pages, built once from the database"""
+    jewelry_items = list(Jewelry.objects.all()[:limit])
+    yield 'home', 'store/home.html', {}
+    yield 'product_list', 'store/product_list.html', {'jewelry_items': jewelry_items}
+    jewelry = Jewelry.objects.filter(variation_types__isnull=False).first() or (jewelry_items or [None])[0]
+    if jewelry is not None:
+        variations = list(
+            ProductVariation.objects.filter(jewelry=jewelry, is_available=True).prefetch_related('variation_options')
+        )
+        variations_by_type = {}
+        for variation in variations:
+            for option in variation.variation_options.all():
+                variations_by_type.setdefault(option.variation_type, set()).add(option)
+        yield 'product_detail', 'store/product_detail.html', {
+            'jewelry': jewelry, 'variations_by_type': variations_by_type, 'product_variations': variations,
+        }
+    yield 'events', 'store/events.html', {**events.listing(), 'rsvped_event_ids': set()}
+    yield 'custom_orders', 'store/custom_orders.html', {}
+
+
+class Command(BaseCommand):
+    help = "Time template rendering per page (context built once, so only rendering is measured)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--products', type=int, default=24, help='Products on the product list page')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+
+        def request_for(user):
+            request = RequestFactory().get('/')
+            request.user = user
+            request.session = session_store()
+            request.defer_cart_badge = True
+            return request
+
+        pages = [(page, template, context, AnonymousUser()) for page, template, context in catalog_contexts(options['products'])]
+        order = Order.objects.select_related('user', 'shipping_address').prefetch_related('items__jewelry').first()
+        if order is not None:
+            pages.append(('order_confirmation', 'store/order_confirmation.html', {'order': order}, order.user))
+
+        self.stdout.write(f"{'page':<20} {'median ms':>10} {'p95 ms':>8} {'KiB':>6} {'queries':>8}")
+        for page, template, context, user in pages:
+            request = request_for(user)
+            html = render_to_string(template, context, request)  # Warm-up: load and compile
+            timings = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    render_to_string(template, context, request)
+                    timings.append((time.perf_counter() - started) * 1000)
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            self.stdout.write(
+                f"{page:<20} {statistics.median(timings):>10.2f} {p95:>8.2f} "
+                f"{len(html.encode()) / 1024:>6.1f} {len(queries) / iterations:>8.1f}"
+            )
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from store import feeds
+
+
+class Command(BaseCommand):
+    help = "Write the sitemaps and the product feed as gzip files (only files whose data changed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rewrite every file')
+        parser.add_argument('--root', default=None, help='Output directory (default: FEEDS_ROOT)')
+        parser.add_argument('--base-url', default=None, help='Public site URL (default: SITE_URL)')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'] or settings.SITE_URL
+        if not base_url.startswith(('https://', 'http://')):
+            raise CommandError("Set SITE_URL (or pass --base-url) to the public site URL, e.g. https://example.com")
+        written, removed = feeds.build(root=options['root'], base_url=base_url, full=options['full'])
+        for name in written:
+            self.stdout.write(f"Wrote {name}")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(written)} file(s), removed {len(removed)} stale file(s)"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from store import snapshots
+
+
+class Command(BaseCommand):
+    help = "Pre-render the public catalog pages for anonymous visitors (only pages whose data changed)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-render every page, e.g. after a deploy')
+        parser.add_argument('--root', default=None, help='Output directory (default: CATALOG_SNAPSHOT_ROOT)')
+
+    def handle(self, *args, **options):
+        rendered, removed = snapshots.build(root=options['root'], full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} page(s), removed {removed} stale snapshot(s)"))
@@ -0,0 +1,31 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from store import exports
+from store.models import Order
+
+
+class Command(BaseCommand):
+    help = "Stream orders (archived ones included) with their items as CSV or JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--start', type=datetime.date.fromisoformat, help='First order day (YYYY-MM-DD)')
+        parser.add_argument('--end', type=datetime.date.fromisoformat, help='Last order day (YYYY-MM-DD)')
+        parser.add_argument('--status', choices=[code for code, _ in Order.STATUS_CHOICES])
+        parser.add_argument('--output', '-o', help='Write to this file instead of stdout')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('start', 'end', 'status')}
+        orders = exports.filter_orders(**filters)
+        archived = exports.filter_archived_orders(**filters)
+        lines = exports.stream(orders, options['format'], options['chunk_size'], archived)
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as out:
+                out.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store import payments, startup
+
+
+class Command(BaseCommand):
+    help = "Profile the imports of web worker startup or `manage.py check` and list the slowest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', nargs='?', choices=sorted(startup.TARGETS), default='wsgi')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--sort', choices=['cumulative', 'self'], default='cumulative',
+            help='cumulative includes the imports a module triggers; self is its own code only',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            profile = startup.profile(options['target'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f"{'self ms':>8} {'cumul ms':>9}  module")
+        for item in profile.slowest(options['limit'], key=options['sort']):
+            self.stdout.write(
+                f"{item.self_us / 1000:>8.1f} {item.cumulative_us / 1000:>9.1f}  {'  ' * item.depth}{item.module}"
+            )
+        self.stdout.write(
+            f"\n{len(profile.imports)} modules, {profile.total_ms:.0f} ms importing, "
+            f"{profile.wall_ms:.0f} ms until the process exited"
+        )
+        lazy = sorted(module for module in payments.LAZY_MODULES if module in profile.modules())
+        if lazy:
+            self.stdout.write(self.style.WARNING(f"Imported at startup but meant to load lazily: {', '.join(lazy)}"))
+        if options['target'] == 'wsgi':
+            style = self.style.SUCCESS if profile.total_ms <= startup.STARTUP_BUDGET_MS else self.style.ERROR
+            self.stdout.write(style(f"Budget: {startup.STARTUP_BUDGET_MS} ms"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from store import inventory
+
+
+class Command(BaseCommand):
+    help = "List active items at or below a stock threshold, according to the inventory ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=inventory.LOW_STOCK_THRESHOLD)
+
+    def handle(self, *args, **options):
+        report = inventory.low_stock(options['threshold'])
+        for row in report:
+            variation = row['variation']
+            sku = (variation.sku if variation else row['jewelry'].sku) or '-'
+            self.stdout.write(f"{row['level']:>5}  {sku:<30}  {variation or row['jewelry']}")
+        self.stdout.write(self.style.SUCCESS(f"{len(report)} item(s) at or below {options['threshold']}"))
@@ -0,0 +1,38 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import inventory
+from store.models import Jewelry, ProductVariation
+
+
+class Command(BaseCommand):
+    help = "Book a stock receipt from a CSV file with 'sku,quantity' rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--note', default='', help='Note stored on every movement (e.g. supplier invoice)')
+
+    def handle(self, *args, **options):
+        with open(options['csv_file'], newline='') as f:
+            rows = [(row['sku'].strip(), int(row['quantity'])) for row in csv.DictReader(f)]
+
+        # Resolve all SKUs with two queries, variations first
+        skus = [sku for sku, _ in rows]
+        variations = {
+            sku: (jewelry_id, pk)
+            for pk, jewelry_id, sku in ProductVariation.objects.filter(sku__in=skus).values_list('pk', 'jewelry_id', 'sku')
+        }
+        products = dict(Jewelry.objects.filter(sku__in=skus).values_list('sku', 'pk'))
+
+        lines = []
+        for sku, quantity in rows:
+            if sku in variations:
+                lines.append((*variations[sku], quantity))
+            elif sku in products:
+                lines.append((products[sku], None, quantity))
+            else:
+                raise CommandError(f"Unknown SKU: {sku}")
+
+        recorded = inventory.receive(lines, note=options['note'])
+        self.stdout.write(self.style.SUCCESS(f"Recorded {recorded} receipt movement(s)"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from store import recommendations
+
+
+class Command(BaseCommand):
+    help = "Count co-purchases in new orders and refresh the related products shown on product pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recount every order, including archived ones')
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K, help='Neighbours kept per product')
+        parser.add_argument(
+            '--settle-seconds', type=int, default=60,
+            help='Leave orders newer than this for the next run'
+        )
+
+    def handle(self, *args, **options):
+        run = recommendations.refresh(
+            full=options['full'], top_k=options['top_k'], settle_seconds=options['settle_seconds']
+        )
+        if run is None:
+            self.stdout.write("No new orders since the last run")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Counted {run.orders_counted} order(s) through order #{run.order_cursor}"
+            ))
@@ -0,0 +1,41 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import webhooks
+
+FIXTURE_DIR = Path(__file__).resolve().parents[2] / 'fixtures' / 'square_webhooks'
+
+
+class Command(BaseCommand):
+    help = "Replay recorded Square webhook events into the inbox and apply them to orders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Event JSON files or directories (default: store/fixtures/square_webhooks)'
+        )
+        parser.add_argument('--no-process', action='store_true', help='Only record the events in the inbox')
+
+    def handle(self, *args, **options):
+        files = []
+        for path in map(Path, options['paths'] or [FIXTURE_DIR]):
+            if path.is_dir():
+                files.extend(sorted(path.glob('*.json')))
+            elif path.exists():
+                files.append(path)
+            else:
+                raise CommandError(f"No such file or directory: {path}")
+
+        recorded = 0
+        for file in files:
+            data = json.loads(file.read_text())
+            for payload in data if isinstance(data, list) else [data]:
+                webhooks.record_event(payload)
+                recorded += 1
+        self.stdout.write(f"Recorded {recorded} event(s) from {len(files)} file(s)")
+
+        if not options['no_process']:
+            processed = webhooks.process_pending_events()
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} event(s)"))
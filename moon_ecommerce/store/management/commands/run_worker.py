@@ -0,0 +1,66 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store import tasks
+
+
+def _worker_main(options):
+    # Let the parent handle Ctrl+C and shut the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    tasks.work(
+        poll_interval=options['poll_interval'],
+        limit=options['batch_size'],
+        visibility_timeout=options['visibility_timeout'],
+        once=options['once'],
+    )
+
+
+class Command(BaseCommand):
+    help = "Run background task workers for the database-backed task queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=10, help='Tasks claimed per poll')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument(
+            '--visibility-timeout', type=int, default=tasks.VISIBILITY_TIMEOUT,
+            help='Seconds before a task claimed by a dead worker is retried'
+        )
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        if processes == 1:
+            self.stdout.write("Starting 1 worker")
+            tasks.work(
+                poll_interval=options['poll_interval'],
+                limit=options['batch_size'],
+                visibility_timeout=options['visibility_timeout'],
+                once=options['once'],
+            )
+            return
+
+        # Children must not inherit the parent's database connections
+        connections.close_all()
+        self.stdout.write(f"Starting {processes} workers")
+        # Forked children start with Django set up; spawn and forkserver (the defaults on
+        # macOS and, from Python 3.14, Linux) would start a bare interpreter
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_worker_main, args=(options,), daemon=True)
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers")
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,28 @@
+import os
+import sys
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Run the production server (gunicorn with gunicorn.conf.py: preloaded, warmed-up, recycled workers)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', help='Address to listen on, e.g. 0.0.0.0:8000 (default GUNICORN_BIND)')
+        parser.add_argument('--workers', type=int, help='Worker processes (default GUNICORN_WORKERS)')
+
+    def handle(self, *args, **options):
+        if find_spec('gunicorn') is None:
+            raise CommandError("gunicorn is not installed (pip install -r requirements.txt)")
+        module, _, name = settings.WSGI_APPLICATION.rpartition('.')
+        argv = [sys.executable, '-m', 'gunicorn', '--config', str(settings.BASE_DIR / 'gunicorn.conf.py')]
+        if options['bind']:
+            argv += ['--bind', options['bind']]
+        if options['workers']:
+            argv += ['--workers', str(options['workers'])]
+        argv.append(f'{module}:{name}')
+        os.chdir(settings.BASE_DIR)
+        # Replace this process so gunicorn receives the supervisor's signals directly
+        os.execv(sys.executable, argv)
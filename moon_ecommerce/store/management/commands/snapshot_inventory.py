@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from store import inventory
+
+
+class Command(BaseCommand):
+    help = "Snapshot current stock levels so reports only sum recent ledger movements"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settle-seconds', type=int, default=60,
+            help='Leave movements newer than this for the next snapshot'
+        )
+
+    def handle(self, *args, **options):
+        written = inventory.take_snapshot(settle_seconds=options['settle_seconds'])
+        if written:
+            self.stdout.write(self.style.SUCCESS(f"Snapshotted {written} item(s)"))
+        else:
+            self.stdout.write("No movements since the last snapshot")
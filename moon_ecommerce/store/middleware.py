@@ -0,0 +1,130 @@
+"""
+Serve pre-rendered catalog pages (see store/snapshots.py) and the sitemap
+and product feed files (store/feeds.py) from disk, before sessions,
+authentication or the database are involved.
+"""
+import gzip
+import os
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import feeds, snapshots
+from .http_caching import MAX_AGE, STALE_WHILE_REVALIDATE
+
+
+class CatalogSnapshotMiddleware:
+    """
+    Answer anonymous GET/HEAD requests for snapshotted pages from disk.
+
+    A request falls through to the live view when it carries a session or
+    messages cookie (signed in, has a cart, or has a flash message), has a
+    query string, or the page has no snapshot.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'CATALOG_SNAPSHOTS', False)
+        self.root = snapshots.snapshot_root()
+        self._manifest = {}
+        self._manifest_mtime = None
+
+    def manifest(self):
+        # Reloaded whenever build_static_catalog rewrites it
+        try:
+            mtime = os.stat(self.root / snapshots.MANIFEST_NAME).st_mtime
+        except FileNotFoundError:
+            return {}
+        if mtime != self._manifest_mtime:
+            self._manifest = snapshots.load_manifest(self.root)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def is_anonymous(self, request):
+        cookies = request.COOKIES
+        return settings.SESSION_COOKIE_NAME not in cookies and 'messages' not in cookies
+
+    def __call__(self, request):
+        if (
+            self.enabled
+            and request.method in ('GET', 'HEAD')
+            and not request.META.get('QUERY_STRING')
+            and self.is_anonymous(request)
+        ):
+            entry = self.manifest().get(request.path)
+            if entry:
+                response = self.serve(request, entry)
+                if response is not None:
+                    return response
+        return self.get_response(request)
+
+    def serve(self, request, entry):
+        etag = f'"{entry["etag"]}"'
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        else:
+            target = snapshots.file_for(request.path, self.root)
+            gzipped = re.search(r'\bgzip\b', request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            if gzipped:
+                target = target.with_name('index.html.gz')
+            try:
+                with open(target, 'rb') as f:
+                    body = f.read()
+            except FileNotFoundError:
+                return None
+            response = HttpResponse(body, content_type='text/html; charset=utf-8')
+            if gzipped:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=MAX_AGE, stale_while_revalidate=STALE_WHILE_REVALIDATE)
+        patch_vary_headers(response, ['Cookie', 'Accept-Encoding'])
+        response['X-Catalog-Snapshot'] = '1'
+        return response
+
+
+class FeedMiddleware:
+    """
+    Answer GET/HEAD requests for /sitemap.xml, /sitemap-*.xml and
+    /product-feed.xml from the gzip files written by build_feeds. Clients
+    that do not accept gzip get the file decompressed.
+    """
+    PATH = re.compile(r'^/(?P<name>sitemap(?:-[\w-]+)?|product-feed)\.xml$')
+    # Crawlers fetch these a few times a day; the files change at most once per build_feeds run
+    MAX_AGE = 3600
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.root = feeds.feeds_root()
+
+    def __call__(self, request):
+        match = self.PATH.match(request.path)
+        if match and request.method in ('GET', 'HEAD'):
+            response = self.serve(request, self.root / f"{match['name']}.xml.gz")
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, target):
+        try:
+            stat = os.stat(target)
+        except FileNotFoundError:
+            return None
+        compressed = bool(re.search(r'\bgzip\b', request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        # The two content-codings are different representations and need different strong validators
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"" if compressed else "-identity"}"'
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        else:
+            with open(target, 'rb') as f:
+                body = f.read()
+            response = HttpResponse(content_type='application/xml; charset=utf-8')
+            if compressed:
+                response['Content-Encoding'] = 'gzip'
+            else:
+                body = gzip.decompress(body)
+            response.content = body
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=self.MAX_AGE)
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:17
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """Fold duplicate cart lines into the oldest one before adding the constraints"""
+    CartItem = apps.get_model('store', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('cart_id', 'jewelry_id', 'product_variation_id')
+        .annotate(lines=Count('id'), keep_id=Min('id'), total_quantity=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for group in duplicates:
+        lines = CartItem.objects.filter(
+            cart_id=group['cart_id'],
+            jewelry_id=group['jewelry_id'],
+            product_variation_id=group['product_variation_id'],
+        )
+        lines.filter(pk=group['keep_id']).update(quantity=group['total_quantity'])
+        lines.exclude(pk=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_event'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='cartitem',
+            unique_together=set(),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='pending', max_length=20),
+        ),
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('product_variation__isnull', False)), fields=('cart', 'jewelry', 'product_variation'), name='unique_cart_item_with_variation'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('product_variation__isnull', True)), fields=('cart', 'jewelry'), name='unique_cart_item_without_variation'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:28
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def initialize_effective_prices(apps, schema_editor):
+    """No promotions exist yet, so effective prices start at list price"""
+    Jewelry = apps.get_model('store', 'Jewelry')
+    ProductVariation = apps.get_model('store', 'ProductVariation')
+    Jewelry.objects.update(effective_price=F('price'))
+    base_price = Jewelry.objects.filter(pk=OuterRef('jewelry_id')).values('price')[:1]
+    ProductVariation.objects.update(effective_price=Subquery(base_price) + F('price_adjustment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jewelry',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='productvariation',
+            name='effective_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('discount_type', models.CharField(choices=[('percent', 'Percent off'), ('fixed', 'Fixed amount off')], default='percent', max_length=10)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('categories', models.ManyToManyField(blank=True, related_name='promotions', to='store.category')),
+                ('products', models.ManyToManyField(blank=True, related_name='promotions', to='store.jewelry')),
+                ('variations', models.ManyToManyField(blank=True, related_name='promotions', to='store.productvariation')),
+            ],
+            options={
+                'ordering': ['-starts_at'],
+                'indexes': [models.Index(fields=['is_active', 'starts_at', 'ends_at'], name='promotion_window_idx')],
+            },
+        ),
+        migrations.RunPython(initialize_effective_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    """Seed the ledger with the existing stock counters"""
+    Jewelry = apps.get_model('store', 'Jewelry')
+    ProductVariation = apps.get_model('store', 'ProductVariation')
+    InventoryMovement = apps.get_model('store', 'InventoryMovement')
+    movements = [
+        InventoryMovement(jewelry_id=pk, kind='adjustment', quantity=stock, note='Opening balance')
+        for pk, stock in Jewelry.objects.filter(stock_quantity__gt=0).values_list('pk', 'stock_quantity')
+    ] + [
+        InventoryMovement(
+            jewelry_id=jewelry_id, product_variation_id=pk, kind='adjustment', quantity=stock, note='Opening balance'
+        )
+        for pk, jewelry_id, stock in ProductVariation.objects.filter(stock_quantity__gt=0).values_list('pk', 'jewelry_id', 'stock_quantity')
+    ]
+    InventoryMovement.objects.bulk_create(movements, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_promotions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('movement_cursor', models.BigIntegerField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('jewelry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='store.jewelry')),
+                ('product_variation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='store.productvariation')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receipt', 'Receipt'), ('sale', 'Sale'), ('adjustment', 'Adjustment'), ('return', 'Return')], max_length=20)),
+                ('quantity', models.IntegerField(help_text='Positive adds stock, negative removes it')),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('jewelry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_movements', to='store.jewelry')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='inventory_movements', to='store.order')),
+                ('product_variation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inventory_movements', to='store.productvariation')),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['jewelry', 'product_variation'], name='movement_item_idx'), models.Index(fields=['order', 'kind'], name='movement_order_kind_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
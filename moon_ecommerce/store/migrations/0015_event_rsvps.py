@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_inventory_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventRSVP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'RSVP',
+                'verbose_name_plural': 'RSVPs',
+            },
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='rsvp_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['is_active', 'date'], name='event_active_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='eventrsvp',
+            name='event',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rsvps', to='store.event'),
+        ),
+        migrations.AddField(
+            model_name='eventrsvp',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='event_rsvps', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='eventrsvp',
+            unique_together={('event', 'user')},
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_event_rsvps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productvariation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
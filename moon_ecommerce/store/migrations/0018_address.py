@@ -0,0 +1,49 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Address',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('street', models.CharField(max_length=255)),
+                ('city', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=100)),
+                ('zip_code', models.CharField(max_length=20)),
+                ('country', models.CharField(default='USA', max_length=100)),
+                ('digest', models.CharField(editable=False, max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Addresses',
+            },
+        ),
+        # Nullable until 0019 has filled them in
+        migrations.AddField(
+            model_name='order',
+            name='shipping_address',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='store.address'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='billing_address',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='store.address'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='shipping_address',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='store.address'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='billing_address',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='store.address'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+"""
+Move the inline address columns of orders and profiles into shared Address
+rows, one row per distinct address. Kept separate from the schema changes
+around it: Postgres refuses to ALTER a table with pending FK trigger events
+from the updates made here.
+"""
+import hashlib
+
+from django.db import migrations
+
+FIELDS = ('street', 'city', 'state', 'zip_code', 'country')
+# Old column suffix for each Address field
+COLUMNS = {'street': 'street', 'city': 'city', 'state': 'state', 'zip_code': 'zip', 'country': 'country'}
+BATCH_SIZE = 1000
+
+
+# Frozen copies of Address.clean_values/digest_for, so later model changes cannot alter this migration
+
+def clean_values(values):
+    cleaned = {field: ' '.join((values.get(field) or '').split()) for field in FIELDS}
+    cleaned['country'] = cleaned['country'] or 'USA'
+    return cleaned
+
+
+def digest_for(cleaned):
+    key = '\x1f'.join(cleaned[field].casefold() for field in FIELDS)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def inline_values(row, prefix):
+    return {field: getattr(row, f'{prefix}_{column}') for field, column in COLUMNS.items()}
+
+
+class AddressCache:
+    """digest -> Address id, creating rows in batches"""
+    def __init__(self, Address):
+        self.Address = Address
+        self.ids = dict(Address.objects.values_list('digest', 'id'))
+
+    def id_for(self, values, required=True):
+        if not required and not any((values.get(field) or '').strip() for field in FIELDS if field != 'country'):
+            return None
+        cleaned = clean_values(values)
+        digest = digest_for(cleaned)
+        if digest not in self.ids:
+            self.ids[digest] = self.Address.objects.create(digest=digest, **cleaned).id
+        return self.ids[digest]
+
+
+def link_rows(queryset, cache, required):
+    batch = []
+    for row in queryset.iterator(chunk_size=BATCH_SIZE):
+        row.shipping_address_id = cache.id_for(inline_values(row, 'shipping'), required)
+        row.billing_address_id = cache.id_for(inline_values(row, 'billing'), required)
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            queryset.model.objects.bulk_update(batch, ['shipping_address', 'billing_address'])
+            batch = []
+    if batch:
+        queryset.model.objects.bulk_update(batch, ['shipping_address', 'billing_address'])
+
+
+def forwards(apps, schema_editor):
+    cache = AddressCache(apps.get_model('store', 'Address'))
+    link_rows(apps.get_model('store', 'Order').objects.all(), cache, required=True)
+    link_rows(apps.get_model('store', 'UserProfile').objects.all(), cache, required=False)
+
+    # Archived orders keep their addresses as nested dicts
+    ArchivedOrder = apps.get_model('store', 'ArchivedOrder')
+    for archived in ArchivedOrder.objects.iterator(chunk_size=BATCH_SIZE):
+        data = archived.data
+        for prefix in ('shipping', 'billing'):
+            data[f'{prefix}_address'] = clean_values(
+                {field: data.pop(f'{prefix}_{column}', '') for field, column in COLUMNS.items()}
+            )
+        archived.save(update_fields=['data'])
+
+
+def backwards(apps, schema_editor):
+    Address = apps.get_model('store', 'Address')
+    for model_name in ('Order', 'UserProfile'):
+        model = apps.get_model('store', model_name)
+        rows = model.objects.all()
+        addresses = Address.objects.in_bulk()
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            for prefix in ('shipping', 'billing'):
+                address = addresses.get(getattr(row, f'{prefix}_address_id'))
+                for field, column in COLUMNS.items():
+                    setattr(row, f'{prefix}_{column}', getattr(address, field) if address else None)
+            row.save()
+
+    ArchivedOrder = apps.get_model('store', 'ArchivedOrder')
+    for archived in ArchivedOrder.objects.iterator(chunk_size=BATCH_SIZE):
+        data = archived.data
+        for prefix in ('shipping', 'billing'):
+            address = data.pop(f'{prefix}_address', {})
+            for field, column in COLUMNS.items():
+                data[f'{prefix}_{column}'] = address.get(field, '')
+        archived.save(update_fields=['data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_address'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,143 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_deduplicate_addresses'),
+    ]
+
+    operations = [
+        # Defaults only so that unapplying can re-add the columns to existing rows
+        migrations.AlterField(
+            model_name='order',
+            name='shipping_street',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='shipping_city',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='shipping_state',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='shipping_zip',
+            field=models.CharField(default='', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='billing_street',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='billing_city',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='billing_state',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='billing_zip',
+            field=models.CharField(default='', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='shipping_address',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='store.address'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='billing_address',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='store.address'),
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='shipping_street',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='shipping_city',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='shipping_state',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='shipping_zip',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='shipping_country',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='billing_street',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='billing_city',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='billing_state',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='billing_zip',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='billing_country',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='shipping_street',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='shipping_city',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='shipping_state',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='shipping_zip',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='shipping_country',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='billing_street',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='billing_city',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='billing_state',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='billing_zip',
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='billing_country',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_remove_inline_addresses'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderItemOption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('variation_type', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=100)),
+                ('order_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='options', to='store.orderitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['variation_type', 'value', 'order_item'], name='order_item_option_idx')],
+                'unique_together': {('order_item', 'variation_type')},
+            },
+        ),
+    ]
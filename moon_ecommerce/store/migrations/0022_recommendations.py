@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-19 16:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0021_order_item_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommenderRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_cursor', models.BigIntegerField(db_index=True)),
+                ('orders_counted', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('jewelry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.jewelry')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.jewelry')),
+            ],
+            options={
+                'unique_together': {('jewelry', 'other')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.PositiveIntegerField(help_text='Orders containing both products')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('jewelry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_products', to='store.jewelry')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.jewelry')),
+            ],
+            options={
+                'ordering': ['jewelry', 'rank'],
+                'unique_together': {('jewelry', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutsession',
+            name='failed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+def flag_counted_orders(apps, schema_editor):
+    """The rollups were rebuilt per day from every order that counts, so those are in them"""
+    Order = apps.get_model('store', 'Order')
+    Order.objects.exclude(status__in=['cancelled', 'refunded']).update(in_rollups=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_checkoutsession_failed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='in_rollups',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(flag_counted_orders, migrations.RunPython.noop),
+    ]
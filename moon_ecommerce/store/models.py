@@ -1,29 +1,155 @@
-from django.db import models
+from django.db import connections, models, router
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
-from django.db.models.signals import post_save, m2m_changed
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
+from . import catalog_cache
+from .signals import bulk_updated
+import hashlib
+import uuid
+from decimal import Decimal
 
-class UserProfile(models.Model):
+class DirtyFieldsMixin:
+    """
+    Remember the values a row was loaded with so saves can be limited to the
+    fields that actually changed.
+    """
+    # Fields that never count as a change on their own
+    dirty_fields_ignore = ('id', 'created_at', 'updated_at')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_dirty_fields(self):
+        """Return the names of fields whose value differs from the database"""
+        loaded = getattr(self, '_loaded_values', None)
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.name in self.dirty_fields_ignore:
+                continue
+            if loaded is None or field.attname not in loaded:
+                dirty.append(field.name)
+            elif getattr(self, field.attname) != loaded[field.attname]:
+                dirty.append(field.name)
+        return dirty
+
+    def is_dirty(self):
+        return bool(self.get_dirty_fields())
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # What was written is now the database state, also for rows just created
+        update_fields = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_values', None) or {}
+        for f in self._meta.concrete_fields:
+            if update_fields is None or f.name in update_fields or f.attname in update_fields:
+                loaded[f.attname] = getattr(self, f.attname)
+        self._loaded_values = loaded
+
+    def save_changes(self):
+        """
+        Save only the modified fields with update_fields.
+        Returns True if a write was issued, False if nothing changed.
+        """
+        if self._state.adding or getattr(self, '_loaded_values', None) is None:
+            self.save()
+            return True
+        dirty = self.get_dirty_fields()
+        if not dirty:
+            return False
+        if any(f.name == 'updated_at' for f in self._meta.concrete_fields):
+            dirty.append('updated_at')
+        self.save(update_fields=dirty)
+        return True
+
+class AddressManager(models.Manager):
+    def resolve(self, *addresses, known=()):
+        """
+        Address rows for several dicts of address values, in order, creating
+        the missing ones. Matching is by digest, so all lookups share one
+        query, and addresses in `known` (e.g. the profile's, already loaded)
+        are reused without one. Blank addresses resolve to None.
+        """
+        digests = [self.model.digest_for(values) if self.model.has_values(values) else None for values in addresses]
+        found = {address.digest: address for address in known if address is not None}
+        missing = {digest for digest in digests if digest and digest not in found}
+        if missing:
+            found.update((address.digest, address) for address in self.filter(digest__in=missing))
+        for values, digest in zip(addresses, digests):
+            if digest and digest not in found:
+                found[digest], _ = self.get_or_create(digest=digest, defaults=self.model.clean_values(values))
+        return [found[digest] if digest else None for digest in digests]
+
+class Address(models.Model):
+    """
+    Immutable postal address shared by orders and profiles. `digest` hashes
+    the normalized fields, so a repeat customer's address is stored once
+    however many orders use it. Rows are never edited; different values
+    resolve to a different row (Address.objects.resolve).
+    """
+    FIELDS = ('street', 'city', 'state', 'zip_code', 'country')
+
+    street = models.CharField(max_length=255)
+    city = models.CharField(max_length=100)
+    state = models.CharField(max_length=100)
+    zip_code = models.CharField(max_length=20)
+    country = models.CharField(max_length=100, default='USA')
+    digest = models.CharField(max_length=64, unique=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = AddressManager()
+
+    def __str__(self):
+        return f"{self.street}, {self.city}, {self.state} {self.zip_code}, {self.country}"
+
+    @classmethod
+    def clean_values(cls, values):
+        """Values with surrounding and repeated whitespace removed"""
+        cleaned = {field: ' '.join((values.get(field) or '').split()) for field in cls.FIELDS}
+        cleaned['country'] = cleaned['country'] or 'USA'
+        return cleaned
+
+    @classmethod
+    def has_values(cls, values):
+        return any((values.get(field) or '').strip() for field in cls.FIELDS if field != 'country')
+
+    @classmethod
+    def digest_for(cls, values):
+        cleaned = cls.clean_values(values)
+        # Case-insensitive, so "portland" and "Portland" are one address
+        key = '\x1f'.join(cleaned[field].casefold() for field in cls.FIELDS)
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def formatted(self):
+        return f"{self.street}\n{self.city}, {self.state} {self.zip_code}\n{self.country}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Addresses are immutable; resolve the new values to another row instead.")
+        for field, value in self.clean_values(self.as_dict()).items():
+            setattr(self, field, value)
+        self.digest = self.digest_for(self.as_dict())
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name_plural = "Addresses"
+
+class UserProfile(DirtyFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
 
     # Personal Information
     full_name = models.CharField(max_length=200, blank=True, null=True)
     phone = models.CharField(max_length=20, blank=True, null=True)
 
-    # Shipping Address
-    shipping_street = models.CharField(max_length=255, blank=True, null=True)
-    shipping_city = models.CharField(max_length=100, blank=True, null=True)
-    shipping_state = models.CharField(max_length=100, blank=True, null=True)
-    shipping_zip = models.CharField(max_length=20, blank=True, null=True)
-    shipping_country = models.CharField(max_length=100, default='USA', blank=True, null=True)
-
-    # Billing Address
-    billing_street = models.CharField(max_length=255, blank=True, null=True)
-    billing_city = models.CharField(max_length=100, blank=True, null=True)
-    billing_state = models.CharField(max_length=100, blank=True, null=True)
-    billing_zip = models.CharField(max_length=20, blank=True, null=True)
-    billing_country = models.CharField(max_length=100, default='USA', blank=True, null=True)
+    shipping_address = models.ForeignKey(Address, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
+    billing_address = models.ForeignKey(Address, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
 
     # Preferences
     same_billing_shipping = models.BooleanField(default=True, help_text="Use shipping address for billing")
@@ -36,17 +162,17 @@ class UserProfile(models.Model):
 
     def get_full_shipping_address(self):
         """Return formatted shipping address"""
-        if not all([self.shipping_street, self.shipping_city, self.shipping_state, self.shipping_zip]):
+        if self.shipping_address is None:
             return None
-        return f"{self.shipping_street}\n{self.shipping_city}, {self.shipping_state} {self.shipping_zip}\n{self.shipping_country}"
+        return self.shipping_address.formatted()
 
     def get_full_billing_address(self):
         """Return formatted billing address"""
         if self.same_billing_shipping:
             return self.get_full_shipping_address()
-        if not all([self.billing_street, self.billing_city, self.billing_state, self.billing_zip]):
+        if self.billing_address is None:
             return None
-        return f"{self.billing_street}\n{self.billing_city}, {self.billing_state} {self.billing_zip}\n{self.billing_country}"
+        return self.billing_address.formatted()
 
     class Meta:
         verbose_name = "User Profile"
@@ -60,9 +186,11 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    # Only save profile for existing users (not during creation)
-    if not kwargs.get('created', False) and hasattr(instance, 'profile'):
-        instance.profile.save()
+    # Only save a profile that was loaded on this user and actually modified.
+    # Plain User saves (e.g. the last_login update on every login) cost nothing.
+    if kwargs.get('created', False) or not User.profile.is_cached(instance):
+        return
+    instance.profile.save_changes()
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -107,6 +235,8 @@ class Jewelry(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Price after any running promotion, maintained by store/promotions.py
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, editable=False)
     image = models.ImageField(upload_to='jewelry_images/', blank=True, null=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='jewelry_items')
     variation_types = models.ManyToManyField(VariationType, blank=True, related_name='jewelry_items')
@@ -128,15 +258,27 @@ class Jewelry(models.Model):
         """Get all possible variation combinations for this jewelry item"""
         return self.product_variations.filter(is_available=True)
 
+    @property
+    def current_price(self):
+        """Price customers pay right now (precomputed, no promotion lookups)"""
+        return self.effective_price if self.effective_price is not None else self.price
+
+    @property
+    def on_sale(self):
+        return self.current_price < self.price
+
 class ProductVariation(models.Model):
     jewelry = models.ForeignKey(Jewelry, on_delete=models.CASCADE, related_name='product_variations')
     variation_options = models.ManyToManyField(VariationOption, related_name='product_variations')
     sku = models.CharField(max_length=100, unique=True, blank=True, null=True)
     price_adjustment = models.DecimalField(max_digits=10, decimal_places=2, default=0)  # Additional cost for this variation
+    # Unit price (base + adjustment) after any running promotion, maintained by store/promotions.py
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, editable=False)
     stock_quantity = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='variation_images/', blank=True, null=True)
     is_available = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         options = ", ".join([str(option) for option in self.variation_options.all()])
@@ -147,6 +289,15 @@ class ProductVariation(models.Model):
         """Calculate total price including base price + adjustment"""
         return self.jewelry.price + self.price_adjustment
 
+    @property
+    def current_price(self):
+        """Unit price customers pay right now (precomputed, no promotion lookups)"""
+        return self.effective_price if self.effective_price is not None else self.total_price
+
+    @property
+    def on_sale(self):
+        return self.current_price < self.total_price
+
     def save(self, *args, **kwargs):
         # Save the instance first so it has a primary key
         super().save(*args, **kwargs)
@@ -170,6 +321,103 @@ def handle_variation_options_changed(sender, instance, action, **kwargs):
                 # Use update() to avoid triggering save() method and potential recursion
                 ProductVariation.objects.filter(pk=instance.pk).update(sku=new_sku)
 
+# Evict cached catalog data on every app server (store/catalog_cache.py)
+@receiver(post_save, sender=Jewelry)
+@receiver(post_delete, sender=Jewelry)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=VariationOption)
+@receiver(post_delete, sender=VariationOption)
+def publish_catalog_change(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        catalog_cache.publish(catalog_cache.tag(instance), using=using)
+
+@receiver(post_save, sender=ProductVariation)
+@receiver(post_delete, sender=ProductVariation)
+def publish_variation_change(sender, instance, using, raw=False, **kwargs):
+    # Variations and their prices are part of the product's data
+    if not raw:
+        catalog_cache.publish(catalog_cache.tag(Jewelry, instance.jewelry_id), using=using)
+
+@receiver(post_save, sender=VariationType)
+@receiver(post_delete, sender=VariationType)
+def publish_variation_type_change(sender, instance, using, signal, raw=False, created=False, **kwargs):
+    # Type names head the option lists of every product page that offers them
+    if raw or created:
+        return
+    if signal is post_delete:
+        # Its links to products are deleted before it, so which products had it is no longer known
+        catalog_cache.publish('jewelry', using=using)
+    else:
+        jewelry_ids = instance.jewelry_items.values_list('pk', flat=True)
+        catalog_cache.publish(*(catalog_cache.tag(Jewelry, pk) for pk in jewelry_ids), using=using)
+
+@receiver(m2m_changed, sender=Jewelry.variation_types.through)
+@receiver(m2m_changed, sender=ProductVariation.variation_options.through)
+def publish_catalog_links_change(sender, instance, action, model, pk_set, using, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Jewelry):
+        jewelry_ids = [instance.pk]
+    elif isinstance(instance, ProductVariation):
+        jewelry_ids = [instance.jewelry_id]
+    elif pk_set is None:
+        # Cleared from the variation type or option side, which does not say which products had it
+        catalog_cache.publish('jewelry', using=using)
+        return
+    elif model is Jewelry:
+        jewelry_ids = pk_set
+    else:
+        jewelry_ids = set(ProductVariation.objects.filter(pk__in=pk_set).values_list('jewelry_id', flat=True))
+    catalog_cache.publish(*(catalog_cache.tag(Jewelry, pk) for pk in jewelry_ids), using=using)
+
+@receiver(bulk_updated, sender=Jewelry)
+@receiver(bulk_updated, sender=ProductVariation)
+def publish_bulk_catalog_change(sender, pks, **kwargs):
+    if sender is ProductVariation:
+        pks = set(ProductVariation.objects.filter(pk__in=pks).values_list('jewelry_id', flat=True))
+    catalog_cache.publish(*(catalog_cache.tag(Jewelry, pk) for pk in pks))
+
+class Promotion(models.Model):
+    """
+    A time-windowed discount on products, whole categories or single
+    variations. Promotions are never evaluated per request: store/promotions.py
+    materializes the resulting effective_price columns at window boundaries.
+    """
+    DISCOUNT_CHOICES = [
+        ('percent', 'Percent off'),
+        ('fixed', 'Fixed amount off'),
+    ]
+
+    name = models.CharField(max_length=200)
+    discount_type = models.CharField(max_length=10, choices=DISCOUNT_CHOICES, default='percent')
+    value = models.DecimalField(max_digits=10, decimal_places=2)  # Percent (e.g. 20) or dollars off
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    is_active = models.BooleanField(default=True)
+    products = models.ManyToManyField(Jewelry, blank=True, related_name='promotions')
+    categories = models.ManyToManyField(Category, blank=True, related_name='promotions')
+    variations = models.ManyToManyField(ProductVariation, blank=True, related_name='promotions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+    def apply(self, price):
+        """Discounted price for a list price, never below zero"""
+        if self.discount_type == 'percent':
+            discounted = price * (100 - self.value) / 100
+        else:
+            discounted = price - self.value
+        return max(discounted, Decimal('0')).quantize(Decimal('0.01'))
+
+    class Meta:
+        ordering = ['-starts_at']
+        indexes = [
+            models.Index(fields=['is_active', 'starts_at', 'ends_at'], name='promotion_window_idx'),
+        ]
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True)
@@ -183,12 +431,45 @@ class Cart(models.Model):
     def total_price(self):
         return sum(item.total_price for item in self.cartitem_set.all())
 
+class CartItemManager(models.Manager):
+    def add_item(self, cart, jewelry, product_variation=None, quantity=1):
+        """
+        Add a line to the cart, or bump the quantity of the existing line.
+
+        Runs as a single INSERT ... ON CONFLICT statement against the partial
+        unique constraints below, so concurrent adds can never create
+        duplicate lines and no SELECT is needed first.
+        """
+        # A write: never send it to a replica the read routing may pick
+        connection = connections[self._db or router.db_for_write(self.model, instance=cart)]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        if product_variation is None:
+            conflict = "(cart_id, jewelry_id) WHERE product_variation_id IS NULL"
+        else:
+            conflict = "(cart_id, jewelry_id, product_variation_id) WHERE product_variation_id IS NOT NULL"
+        sql = (
+            f"INSERT INTO {table} (cart_id, jewelry_id, product_variation_id, quantity) "
+            f"VALUES (%s, %s, %s, %s) "
+            f"ON CONFLICT {conflict} "
+            f"DO UPDATE SET quantity = {table}.quantity + EXCLUDED.quantity"
+        )
+        params = [
+            cart.pk,
+            jewelry.pk,
+            product_variation.pk if product_variation else None,
+            quantity,
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
     jewelry = models.ForeignKey(Jewelry, on_delete=models.CASCADE)
     product_variation = models.ForeignKey(ProductVariation, on_delete=models.CASCADE, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemManager()
+
     def __str__(self):
         variation_info = f" ({self.product_variation})" if self.product_variation else ""
         return f"{self.quantity} x {self.jewelry.name}{variation_info} in cart"
@@ -197,15 +478,62 @@ class CartItem(models.Model):
     def unit_price(self):
         """Get the price for a single unit of this cart item"""
         if self.product_variation:
-            return self.product_variation.total_price
-        return self.jewelry.price
+            return self.product_variation.current_price
+        return self.jewelry.current_price
 
     @property
     def total_price(self):
         return self.unit_price * self.quantity
 
     class Meta:
-        unique_together = ['cart', 'jewelry', 'product_variation']  # Prevent duplicate items
+        # NULLs compare distinct, so a plain unique_together would let duplicate
+        # variation-less lines through. One partial constraint per case instead.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cart', 'jewelry', 'product_variation'],
+                condition=models.Q(product_variation__isnull=False),
+                name='unique_cart_item_with_variation',
+            ),
+            models.UniqueConstraint(
+                fields=['cart', 'jewelry'],
+                condition=models.Q(product_variation__isnull=True),
+                name='unique_cart_item_without_variation',
+            ),
+        ]
+
+class CheckoutSession(models.Model):
+    """
+    One attempt to pay for a cart. The token is issued when the checkout page
+    renders, sent back with the payment form and reused as the Square
+    idempotency key, so retries and double submits map to a single payment
+    and a single Order.
+    """
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='checkout_sessions')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)  # Cart total the token was issued for
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when Square declined or errored; the retry needs a new idempotency key
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Checkout {self.token} for {self.user.username}"
+
+    @classmethod
+    def for_cart(cls, user, cart):
+        """Reuse the user's open session for this cart total, or issue a new one"""
+        amount = cart.total_price
+        session = (
+            cls.objects.filter(user=user, amount=amount, order__isnull=True, failed_at__isnull=True)
+            .order_by('-created_at')
+            .first()
+        )
+        if session is None:
+            session = cls.objects.create(user=user, amount=amount)
+        return session
+
+    def mark_failed(self):
+        self.failed_at = timezone.now()
+        CheckoutSession.objects.filter(pk=self.pk).update(failed_at=self.failed_at)
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -214,6 +542,8 @@ class Order(models.Model):
         ('shipped', 'Shipped'),
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
+        ('refunded', 'Refunded'),
+        ('disputed', 'Disputed'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
@@ -223,26 +553,23 @@ class Order(models.Model):
     email = models.EmailField()
     phone = models.CharField(max_length=20)
 
-    # Shipping Address
-    shipping_street = models.CharField(max_length=255)
-    shipping_city = models.CharField(max_length=100)
-    shipping_state = models.CharField(max_length=100)
-    shipping_zip = models.CharField(max_length=20)
-    shipping_country = models.CharField(max_length=100, default='USA')
-
-    # Billing Address
-    billing_street = models.CharField(max_length=255)
-    billing_city = models.CharField(max_length=100)
-    billing_state = models.CharField(max_length=100)
-    billing_zip = models.CharField(max_length=20)
-    billing_country = models.CharField(max_length=100, default='USA')
+    shipping_address = models.ForeignKey(Address, on_delete=models.PROTECT, related_name='+')
+    billing_address = models.ForeignKey(Address, on_delete=models.PROTECT, related_name='+')
 
     # Order Details
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
 
     # Square Payment Info
-    square_payment_id = models.CharField(max_length=255, blank=True, null=True)
+    square_payment_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+
+    # One order per checkout token (OneToOne adds the unique constraint)
+    checkout_session = models.OneToOneField(
+        CheckoutSession, on_delete=models.PROTECT, null=True, blank=True, related_name='order'
+    )
+
+    # Whether the sales rollups include this order (store/analytics.py)
+    in_rollups = models.BooleanField(default=False, editable=False)
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -253,6 +580,10 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -276,9 +607,9 @@ class OrderItem(models.Model):
         # Auto-set price if not provided
         if self.price is None:
             if self.product_variation:
-                self.price = self.product_variation.total_price
+                self.price = self.product_variation.current_price
             else:
-                self.price = self.jewelry.price
+                self.price = self.jewelry.current_price
 
         # Store variation data as JSON for historical reference
         if self.product_variation and not self.variation_data:
@@ -289,7 +620,122 @@ class OrderItem(models.Model):
                 ],
                 'price_adjustment': str(self.product_variation.price_adjustment)
             }
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if adding and self.variation_data:
+            OrderItemOption.objects.bulk_create(self.snapshot_options(), ignore_conflicts=True)
+
+    def snapshot_options(self):
+        """Unsaved OrderItemOption rows for the choices recorded in variation_data"""
+        return [
+            OrderItemOption(order_item=self, variation_type=choice['type'], value=choice['value'])
+            for choice in (self.variation_data or {}).get('variation_options', [])
+            if choice.get('type') and choice.get('value') is not None
+        ]
+
+class OrderItemOption(models.Model):
+    """
+    One variation choice of an order item (e.g. Size: 7), as recorded in
+    variation_data when the order was placed. Kept as indexed columns so
+    variation-level sales are plain SQL (see analytics.variation_sales).
+    """
+    order_item = models.ForeignKey(OrderItem, on_delete=models.CASCADE, related_name='options')
+    variation_type = models.CharField(max_length=100)
+    value = models.CharField(max_length=100)
+
+    def __str__(self):
+        return f"{self.variation_type}: {self.value}"
+
+    class Meta:
+        unique_together = ['order_item', 'variation_type']
+        indexes = [
+            # Covers the lookups in analytics.items_with_choices
+            models.Index(fields=['variation_type', 'value', 'order_item'], name='order_item_option_idx'),
+        ]
+
+class ArchivedOrder(models.Model):
+    """
+    Cold storage for closed orders past the retention window (see
+    store/archive.py). One row per order keeps the id, owner, status, total
+    and dates as columns for lookups; everything else, items included, is
+    kept in `data`. as_order() rebuilds a read-only Order for templates.
+    """
+    id = models.BigIntegerField(primary_key=True)  # The original Order id
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    full_name = models.CharField(max_length=200)
+    email = models.EmailField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    square_payment_id = models.CharField(max_length=255, blank=True, null=True, db_index=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField()
+
+    # Order fields restored from `data`
+    DATA_FIELDS = ['phone', 'updated_at']
+
+    def __str__(self):
+        return f"Archived order #{self.id} - ${self.total_amount}"
+
+    @classmethod
+    def from_order(cls, order):
+        """Archive row for an Order fetched with its addresses and items__jewelry"""
+        data = {name: getattr(order, name) for name in cls.DATA_FIELDS}
+        data['updated_at'] = order.updated_at.isoformat()
+        data['shipping_address'] = order.shipping_address.as_dict()
+        data['billing_address'] = order.billing_address.as_dict()
+        data['items'] = [
+            {
+                'jewelry_id': item.jewelry_id,
+                'name': item.jewelry.name,
+                'product_variation_id': item.product_variation_id,
+                'variation_data': item.variation_data,
+                'quantity': item.quantity,
+                'price': str(item.price),
+            }
+            for item in order.items.all()
+        ]
+        return cls(
+            id=order.id, user_id=order.user_id, full_name=order.full_name, email=order.email,
+            status=order.status, total_amount=order.total_amount,
+            square_payment_id=order.square_payment_id, created_at=order.created_at, data=data,
+        )
+
+    def as_order(self):
+        """An unsaved Order (with items) that renders like the original; never save it"""
+        fields = {name: self.data.get(name) for name in self.DATA_FIELDS if name != 'updated_at'}
+        order = Order(
+            id=self.id, user_id=self.user_id, full_name=self.full_name, email=self.email,
+            status=self.status, total_amount=self.total_amount,
+            square_payment_id=self.square_payment_id, created_at=self.created_at, **fields,
+            shipping_address=Address(**self.data['shipping_address']),
+            billing_address=Address(**self.data['billing_address']),
+        )
+        order.updated_at = models.DateTimeField().to_python(self.data.get('updated_at'))
+        order.is_archived = True
+        if ArchivedOrder.user.is_cached(self):
+            order.user = self.user  # Loaded with select_related('user')
+        items = [
+            OrderItem(
+                order=order,
+                jewelry=Jewelry(id=line['jewelry_id'], name=line['name']),
+                product_variation_id=line['product_variation_id'],
+                variation_data=line['variation_data'],
+                quantity=line['quantity'],
+                price=Decimal(line['price']),
+            )
+            for line in self.data.get('items', [])
+        ]
+        # Served by order.items.all() without a query
+        order._prefetched_objects_cache = {'items': items}
+        return order
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archived_order_user_idx'),
+            models.Index(fields=['created_at'], name='archived_order_created_idx'),
+        ]
 
 class Event(models.Model):
     title = models.CharField(max_length=200)
@@ -299,6 +745,8 @@ class Event(models.Model):
     image = models.ImageField(upload_to='event_images/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
     max_attendees = models.PositiveIntegerField(blank=True, null=True)
+    # Maintained by store/events.py with conditional UPDATEs, never counted per page view
+    rsvp_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -307,6 +755,9 @@ class Event(models.Model):
 
     class Meta:
         ordering = ['date']
+        indexes = [
+            models.Index(fields=['is_active', 'date'], name='event_active_date_idx'),
+        ]
 
     @property
     def is_upcoming(self):
@@ -316,4 +767,220 @@ class Event(models.Model):
     @property
     def is_past(self):
         from django.utils import timezone
-        return self.date < timezone.now()
\ No newline at end of file
+        return self.date < timezone.now()
+
+    @property
+    def spots_left(self):
+        if self.max_attendees is None:
+            return None
+        return max(self.max_attendees - self.rsvp_count, 0)
+
+    @property
+    def is_full(self):
+        return self.spots_left == 0
+
+
+class EventRSVP(models.Model):
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='rsvps')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='event_rsvps')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('event', 'user')
+        verbose_name = 'RSVP'
+        verbose_name_plural = 'RSVPs'
+
+    def __str__(self):
+        return f"{self.user.username} - {self.event.title}"
+
+class Task(models.Model):
+    """
+    A unit of background work stored in the database and run by
+    `manage.py run_worker`. See store/tasks.py.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)  # Registered task name
+    payload = models.JSONField(default=dict, blank=True)  # Keyword arguments for the task
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField()  # Not picked up before this time (used for backoff)
+    locked_until = models.DateTimeField(blank=True, null=True)  # Visibility timeout of a running task
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_run_after_idx'),
+        ]
+
+
+class WebhookEvent(models.Model):
+    """
+    Inbox of Square webhook notifications. The endpoint only appends here;
+    store/webhooks.py applies the events to orders in batches.
+    """
+    event_id = models.CharField(max_length=255, unique=True)  # Square redelivers with the same id
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
+
+    class Meta:
+        ordering = ['received_at']
+
+# Sales analytics rollups, maintained by store/analytics.py. Reports and the
+# admin dashboard read only these tables, never Order/OrderItem.
+
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Sales for {self.date}"
+
+    class Meta:
+        ordering = ['-date']
+        verbose_name = "Daily Sales"
+        verbose_name_plural = "Sales Dashboard"
+
+class HourlySales(models.Model):
+    hour = models.DateTimeField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Sales for {self.hour:%Y-%m-%d %H:00}"
+
+    class Meta:
+        ordering = ['-hour']
+        verbose_name_plural = "Hourly Sales"
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    jewelry = models.ForeignKey(Jewelry, on_delete=models.CASCADE, related_name='daily_sales')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)  # Category at the time of rollup
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'jewelry']
+        verbose_name_plural = "Daily Product Sales"
+
+class DailyVariationSales(models.Model):
+    date = models.DateField()
+    product_variation = models.ForeignKey(ProductVariation, on_delete=models.CASCADE, related_name='daily_sales')
+    jewelry = models.ForeignKey(Jewelry, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ['date', 'product_variation']
+        verbose_name_plural = "Daily Variation Sales"
+
+class InventoryMovement(models.Model):
+    """
+    Append-only stock ledger. Every change to stock is a signed movement;
+    stock_quantity on Jewelry/ProductVariation is a cached counter kept in
+    step by store/inventory.py.
+    """
+    KIND_CHOICES = [
+        ('receipt', 'Receipt'),
+        ('sale', 'Sale'),
+        ('adjustment', 'Adjustment'),
+        ('return', 'Return'),
+    ]
+
+    jewelry = models.ForeignKey(Jewelry, on_delete=models.CASCADE, related_name='inventory_movements')
+    product_variation = models.ForeignKey(ProductVariation, on_delete=models.CASCADE, null=True, blank=True, related_name='inventory_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField(help_text="Positive adds stock, negative removes it")
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='inventory_movements')
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.quantity:+d} {self.jewelry.name}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Inventory movements are append-only; record a new adjustment instead.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Inventory movements are append-only; record a new adjustment instead.")
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['jewelry', 'product_variation'], name='movement_item_idx'),
+            models.Index(fields=['order', 'kind'], name='movement_order_kind_idx'),
+        ]
+
+class InventorySnapshot(models.Model):
+    """
+    Stock level of one item as of `movement_cursor` (the highest movement id
+    included). Current level = latest snapshot + movements after the cursor.
+    """
+    jewelry = models.ForeignKey(Jewelry, on_delete=models.CASCADE, related_name='inventory_snapshots')
+    product_variation = models.ForeignKey(ProductVariation, on_delete=models.CASCADE, null=True, blank=True, related_name='inventory_snapshots')
+    quantity = models.IntegerField()
+    movement_cursor = models.BigIntegerField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.jewelry.name}: {self.quantity} (through movement #{self.movement_cursor})"
+
+class CoPurchase(models.Model):
+    """
+    Sparse co-occurrence matrix: the number of counted orders containing
+    both products. Stored in both directions. Maintained by
+    store/recommendations.py.
+    """
+    jewelry = models.ForeignKey(Jewelry, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Jewelry, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['jewelry', 'other']
+
+class RelatedProduct(models.Model):
+    """Top-K co-purchased products per product, read by the product page in one lookup"""
+    jewelry = models.ForeignKey(Jewelry, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Jewelry, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.PositiveIntegerField(help_text="Orders containing both products")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.jewelry.name} -> {self.related.name} (#{self.rank})"
+
+    class Meta:
+        ordering = ['jewelry', 'rank']
+        unique_together = ['jewelry', 'rank']
+
+class RecommenderRun(models.Model):
+    """One recommendations refresh; order_cursor is the highest order id counted"""
+    order_cursor = models.BigIntegerField(db_index=True)
+    orders_counted = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Recommendations through order #{self.order_cursor}"
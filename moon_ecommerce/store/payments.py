@@ -0,0 +1,65 @@
+"""
+Square payment gateway.
+
+The Square SDK (with pydantic and httpx) takes longer to import than the
+rest of the store, and only checkout needs it. It is imported the first
+time a payment is created, not when views.py loads, so web workers,
+management commands and the test suite start without it.
+`manage.py importtime` shows what startup does import.
+
+Under gunicorn, preload() imports it once in the master process instead,
+and the forked workers share those pages.
+"""
+import sys
+
+from django.conf import settings
+
+# Modules importing the application must not load; see tests.StartupImportTests
+LAZY_MODULES = ('square', 'httpx', 'pydantic')
+
+# Square error categories meaning the card was refused and nothing was charged
+DECLINE_CATEGORIES = ('PAYMENT_METHOD_ERROR',)
+
+
+def preload():
+    """Import the SDK now rather than on the first payment"""
+    from square import Square  # noqa: F401
+
+
+def client():
+    """A Square client for the configured environment"""
+    from square import Square
+    from square.environment import SquareEnvironment
+
+    environment = SquareEnvironment.SANDBOX
+    if settings.SQUARE_ENVIRONMENT == 'production':
+        environment = SquareEnvironment.PRODUCTION
+    return Square(environment=environment, token=settings.SQUARE_ACCESS_TOKEN)
+
+
+def create_payment(source_id, idempotency_key, amount):
+    """Charge `amount` (Decimal, USD) to a Web Payments SDK card token. Returns Square's response."""
+    return client().payments.create(
+        source_id=source_id,
+        idempotency_key=idempotency_key,
+        amount_money={
+            "amount": int(amount * 100),  # Square uses cents
+            "currency": "USD"
+        },
+        location_id=settings.SQUARE_LOCATION_ID,
+    )
+
+
+def is_declined(error):
+    """
+    Whether an exception from create_payment() is a definite decline. Timeouts,
+    dropped connections and server errors are not: the card may have been
+    charged, and only a retry with the same idempotency key can tell.
+    """
+    if 'square' not in sys.modules:
+        return False  # The SDK never loaded, so it cannot have raised
+    from square.core.api_error import ApiError
+
+    return isinstance(error, ApiError) and any(
+        getattr(item, 'category', None) in DECLINE_CATEGORIES for item in error.errors
+    )
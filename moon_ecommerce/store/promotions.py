@@ -0,0 +1,165 @@
+"""
+Scheduled price and sale engine.
+
+refresh_prices() evaluates the running promotions once and writes the
+resulting effective_price of every affected Jewelry and ProductVariation.
+Catalog, cart and checkout only read those columns.
+
+Prices are refreshed:
+- at every promotion window boundary (apply_promotions reschedules itself
+  on the task queue for the next start/end time),
+- whenever a promotion is saved or deleted,
+- for a single product when it or one of its variations is saved, and once
+  per batch after bulk admin edits.
+"""
+import logging
+
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import catalog_cache
+from .models import Jewelry, ProductVariation, Promotion, Task
+from .signals import bulk_updated
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def running_promotions(now=None):
+    now = now or timezone.now()
+    return list(
+        Promotion.objects.filter(is_active=True, starts_at__lte=now, ends_at__gt=now)
+        .prefetch_related('products', 'categories', 'variations')
+    )
+
+
+def index_promotions(promotions):
+    """Map target ids to the promotions that apply to them"""
+    by_jewelry, by_category, by_variation = {}, {}, {}
+    for promotion in promotions:
+        for jewelry in promotion.products.all():
+            by_jewelry.setdefault(jewelry.pk, []).append(promotion)
+        for category in promotion.categories.all():
+            by_category.setdefault(category.pk, []).append(promotion)
+        for variation in promotion.variations.all():
+            by_variation.setdefault(variation.pk, []).append(promotion)
+    return by_jewelry, by_category, by_variation
+
+
+def best_price(price, promotions):
+    """Lowest price any of the promotions gives (promotions do not stack)"""
+    return min([price] + [promotion.apply(price) for promotion in promotions])
+
+
+def refresh_prices(jewelry_ids=None, now=None):
+    """
+    Recompute effective prices for all products, or only `jewelry_ids`.
+    Only rows whose price actually changes are written. Returns that count.
+    """
+    now = now or timezone.now()
+    by_jewelry, by_category, by_variation = index_promotions(running_promotions(now))
+
+    jewelry_qs = Jewelry.objects.only('id', 'price', 'category_id', 'effective_price', 'updated_at')
+    variation_qs = ProductVariation.objects.select_related('jewelry').only(
+        'id', 'price_adjustment', 'effective_price', 'updated_at', 'jewelry__id', 'jewelry__price', 'jewelry__category_id'
+    )
+    if jewelry_ids is not None:
+        jewelry_qs = jewelry_qs.filter(pk__in=jewelry_ids)
+        variation_qs = variation_qs.filter(jewelry_id__in=jewelry_ids)
+
+    changed_jewelry = []
+    for jewelry in jewelry_qs.iterator(chunk_size=BATCH_SIZE):
+        promotions = by_jewelry.get(jewelry.pk, []) + by_category.get(jewelry.category_id, [])
+        price = best_price(jewelry.price, promotions)
+        if price != jewelry.effective_price:
+            jewelry.effective_price = price
+            jewelry.updated_at = now  # Cached catalog pages key off updated_at
+            changed_jewelry.append(jewelry)
+    Jewelry.objects.bulk_update(changed_jewelry, ['effective_price', 'updated_at'], batch_size=BATCH_SIZE)
+
+    changed_variations = []
+    for variation in variation_qs.iterator(chunk_size=BATCH_SIZE):
+        jewelry = variation.jewelry
+        promotions = (
+            by_variation.get(variation.pk, [])
+            + by_jewelry.get(jewelry.pk, [])
+            + by_category.get(jewelry.category_id, [])
+        )
+        price = best_price(jewelry.price + variation.price_adjustment, promotions)
+        if price != variation.effective_price:
+            variation.effective_price = price
+            variation.updated_at = now
+            changed_variations.append(variation)
+    ProductVariation.objects.bulk_update(changed_variations, ['effective_price', 'updated_at'], batch_size=BATCH_SIZE)
+
+    # bulk_update() sends no signals
+    changed_ids = {jewelry.pk for jewelry in changed_jewelry} | {variation.jewelry_id for variation in changed_variations}
+    catalog_cache.publish(*(catalog_cache.tag(Jewelry, pk) for pk in changed_ids))
+    return len(changed_jewelry) + len(changed_variations)
+
+
+def next_boundary(now=None):
+    """The next time a promotion starts or ends, or None"""
+    now = now or timezone.now()
+    upcoming = Promotion.objects.filter(is_active=True).filter(Q(starts_at__gt=now) | Q(ends_at__gt=now))
+    boundaries = [
+        moment
+        for starts_at, ends_at in upcoming.values_list('starts_at', 'ends_at')
+        for moment in (starts_at, ends_at)
+        if moment > now
+    ]
+    return min(boundaries, default=None)
+
+
+def schedule_next_refresh(now=None):
+    """Queue apply_promotions for the next window boundary, once"""
+    from . import tasks
+
+    now = now or timezone.now()
+    boundary = next_boundary(now)
+    if boundary is None:
+        return None
+    already_scheduled = Task.objects.filter(
+        name='apply_promotions', status='queued', run_after__gte=now, run_after__lte=boundary
+    ).exists()
+    if not already_scheduled:
+        tasks.enqueue('apply_promotions', delay=(boundary - now).total_seconds())
+    return boundary
+
+
+# Keep effective prices in sync with edits
+
+@receiver(post_save, sender=Jewelry)
+@receiver(post_save, sender=ProductVariation)
+def refresh_saved_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    jewelry_id = instance.pk if sender is Jewelry else instance.jewelry_id
+    refresh_prices(jewelry_ids=[jewelry_id])
+
+
+@receiver(bulk_updated, sender=Jewelry)
+def refresh_bulk_updated_products(sender, pks, **kwargs):
+    refresh_prices(jewelry_ids=pks)
+
+
+def _promotion_changed():
+    from . import tasks
+    tasks.enqueue('apply_promotions')
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def promotion_saved(sender, instance, **kwargs):
+    _promotion_changed()
+
+
+@receiver(m2m_changed, sender=Promotion.products.through)
+@receiver(m2m_changed, sender=Promotion.categories.through)
+@receiver(m2m_changed, sender=Promotion.variations.through)
+def promotion_targets_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _promotion_changed()
@@ -0,0 +1,144 @@
+"""
+"Customers also bought" recommendations, precomputed offline.
+
+`manage.py refresh_recommendations` (cron) keeps a sparse co-occurrence
+matrix in CoPurchase: for each pair of products, the number of orders that
+contained both. Each run reads only the orders placed since the previous
+run (RecommenderRun.order_cursor), adds their pair counts to the matrix and
+rewrites the top-K neighbours (RelatedProduct) of the products they touched.
+The product page reads its recommendations with one indexed lookup.
+
+Cancelled and refunded orders are skipped when counted. A later
+cancellation is only reflected by a full rebuild (--full), which also
+counts archived orders.
+"""
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations, groupby
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import catalog_cache
+from .analytics import EXCLUDED_STATUSES
+from .models import ArchivedOrder, CoPurchase, Jewelry, Order, OrderItem, RecommenderRun, RelatedProduct
+
+TOP_K = 8
+# Baskets this large (bulk or wholesale orders) add n² pairs and little signal
+MAX_BASKET = 50
+
+
+def order_baskets(after, upto):
+    """Set of product ids per counted order with after < id <= upto"""
+    rows = (
+        OrderItem.objects.filter(order_id__gt=after, order_id__lte=upto)
+        .exclude(order__status__in=EXCLUDED_STATUSES)
+        .values_list('order_id', 'jewelry_id')
+        .order_by('order_id')
+        .iterator(chunk_size=2000)
+    )
+    for _, lines in groupby(rows, key=lambda row: row[0]):
+        yield {jewelry_id for _, jewelry_id in lines}
+
+
+def archived_baskets():
+    orders = ArchivedOrder.objects.exclude(status__in=EXCLUDED_STATUSES).values_list('data', flat=True)
+    for data in orders.iterator(chunk_size=500):
+        yield {line['jewelry_id'] for line in data.get('items', [])}
+
+
+def count_pairs(baskets):
+    """Co-occurrence counts {(a, b): orders}, both directions. Returns (pairs, baskets counted)."""
+    pairs = Counter()
+    counted = 0
+    for basket in baskets:
+        counted += 1
+        if len(basket) > MAX_BASKET:
+            continue
+        for a, b in combinations(sorted(basket), 2):
+            pairs[a, b] += 1
+            pairs[b, a] += 1
+    return pairs, counted
+
+
+def _merge(pairs):
+    """Add `pairs` to the stored matrix. Returns the full stored rows of every product touched."""
+    touched = {a for a, _ in pairs}
+    stored = {
+        (jewelry_id, other_id): (pk, count)
+        for pk, jewelry_id, other_id, count in CoPurchase.objects.filter(jewelry_id__in=touched)
+        .values_list('pk', 'jewelry_id', 'other_id', 'count')
+    }
+    created, updated = [], []
+    for (a, b), added in pairs.items():
+        if (a, b) in stored:
+            pk, count = stored[a, b]
+            updated.append(CoPurchase(pk=pk, count=count + added))
+            stored[a, b] = (pk, count + added)
+        else:
+            created.append(CoPurchase(jewelry_id=a, other_id=b, count=added))
+            stored[a, b] = (None, added)
+    CoPurchase.objects.bulk_create(created, batch_size=1000)
+    CoPurchase.objects.bulk_update(updated, ['count'], batch_size=1000)
+    rows = defaultdict(list)
+    for (a, b), (_, count) in stored.items():
+        rows[a].append((count, b))
+    return rows
+
+
+def _rank(rows, top_k):
+    """Rewrite the top-k neighbours of the products in `rows`"""
+    related = []
+    for jewelry_id, neighbours in rows.items():
+        # Most co-purchases first; ties go to the lower (older) product id
+        best = heapq.nsmallest(top_k, neighbours, key=lambda neighbour: (-neighbour[0], neighbour[1]))
+        related.extend(
+            RelatedProduct(jewelry_id=jewelry_id, related_id=other_id, rank=rank, score=count)
+            for rank, (count, other_id) in enumerate(best, start=1)
+        )
+    RelatedProduct.objects.filter(jewelry_id__in=rows).delete()
+    RelatedProduct.objects.bulk_create(related, batch_size=1000)
+    catalog_cache.publish(*(catalog_cache.tag(Jewelry, pk) for pk in rows))
+
+
+def refresh(full=False, top_k=TOP_K, settle_seconds=60):
+    """
+    Count orders placed since the last run (every order with `full`) and
+    update the recommendations. Returns the RecommenderRun, or None when
+    there was nothing new.
+
+    Orders from the last `settle_seconds` are left for the next run, so
+    orders still being written are not skipped by the cursor.
+    """
+    settled = timezone.now() - timedelta(seconds=settle_seconds)
+    with transaction.atomic():
+        # Serializes concurrent runs once a first run exists
+        last = RecommenderRun.objects.select_for_update().order_by('-order_cursor').first()
+        after = last.order_cursor if last and not full else 0
+        upto = Order.objects.filter(created_at__lte=settled).aggregate(cursor=Max('id'))['cursor']
+        if full:
+            # Rebuilt from the archive even when no live order has settled (all of them archived)
+            CoPurchase.objects.all().delete()
+            RelatedProduct.objects.all().delete()
+            RecommenderRun.objects.all().delete()
+            upto = upto or 0
+        elif upto is None or upto <= after:
+            return None
+
+        baskets = order_baskets(after, upto)
+        if full:
+            baskets = (basket for source in (archived_baskets(), baskets) for basket in source)
+        pairs, counted = count_pairs(baskets)
+        if pairs:
+            _rank(_merge(pairs), top_k)
+        return RecommenderRun.objects.create(order_cursor=upto, orders_counted=counted)
+
+
+def related_items(jewelry, limit=4):
+    """Active products most often bought with `jewelry`, best first"""
+    return [
+        row.related for row in
+        jewelry.related_products.filter(related__is_active=True).select_related('related')[:limit]
+    ]
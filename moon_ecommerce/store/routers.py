@@ -0,0 +1,110 @@
+"""
+Read-replica routing.
+
+Reads go to the primary unless code opts in with @replica_reads /
+use_replica(): catalog pages, order history and the admin reports. Writes,
+transactions and read-your-writes paths (cart, checkout, the order
+confirmation) always use the primary.
+
+After a request writes, ReplicaStickinessMiddleware sets a short-lived
+cookie. Until it expires, that visitor's reads stay on the primary too, so
+replication lag never hides their own changes.
+
+Replicas are listed in settings.DATABASE_REPLICAS. Without any, every
+query uses the primary.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+STICKY_COOKIE = 'db_primary_until'
+# Seconds a visitor keeps reading from the primary after a write; longer than replica lag
+STICKY_SECONDS = getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 10)
+
+_replica_ok = ContextVar('replica_ok', default=False)
+_pinned = ContextVar('pinned_to_primary', default=False)
+# None outside requests; the middleware tracks writes per request
+_wrote = ContextVar('wrote', default=None)
+
+
+@contextmanager
+def use_replica():
+    """Allow reads in this block to go to a replica"""
+    token = _replica_ok.set(True)
+    try:
+        yield
+    finally:
+        _replica_ok.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Force reads in this block onto the primary"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+def replica_reads(view):
+    """Serve a read-only view from a replica (unless the visitor just wrote)"""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        with use_replica():
+            return view(request, *args, **kwargs)
+    return wrapped
+
+
+class ReplicaRouter:
+    def __init__(self):
+        self.replicas = list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+    def db_for_read(self, model, **hints):
+        if not self.replicas or not _replica_ok.get() or _pinned.get() or _wrote.get():
+            return 'default'
+        if connections['default'].in_atomic_block:
+            return 'default'  # Reads inside a transaction must see its writes
+        return random.choice(self.replicas)
+
+    def db_for_write(self, model, **hints):
+        if _wrote.get() is not None:
+            _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in self.replicas
+
+
+class ReplicaStickinessMiddleware:
+    """Pin a visitor's reads to the primary for a few seconds after they write"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            sticky = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            sticky = False
+        pinned = _pinned.set(sticky)
+        wrote = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if _wrote.get():
+                response.set_cookie(
+                    STICKY_COOKIE, str(time.time() + STICKY_SECONDS), max_age=STICKY_SECONDS,
+                    secure=request.is_secure(), httponly=True, samesite='Lax',
+                )
+        finally:
+            _pinned.reset(pinned)
+            _wrote.reset(wrote)
+        return response
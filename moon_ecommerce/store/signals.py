@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent once after a set-based bulk UPDATE (see store/bulk.py), with
+# sender=<model class> and pks=<list of primary keys>. queryset.update() does
+# not fire post_save, so per-object caches and denormalized data should
+# listen to this as well.
+bulk_updated = Signal()
@@ -0,0 +1,117 @@
+"""
+Pre-rendered catalog snapshots for anonymous traffic.
+
+`manage.py build_static_catalog` renders the public pages (home, product
+list, every product, events) as an anonymous visitor would see them and
+writes them as HTML plus gzip files under CATALOG_SNAPSHOT_ROOT.
+store.middleware.CatalogSnapshotMiddleware serves those files to
+anonymous GETs without touching sessions or the database.
+
+Rebuilds are incremental. The manifest records each page's validator
+state (the same latest updated_at and row count used for HTTP caching),
+and a page is re-rendered only when that state has changed.
+"""
+import gzip
+import hashlib
+import json
+import os
+from importlib import import_module
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from .http_caching import catalog_state, events_state, product_state
+from .models import Jewelry
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def snapshot_root():
+    return Path(getattr(settings, 'CATALOG_SNAPSHOT_ROOT', settings.BASE_DIR / 'catalog_snapshot'))
+
+
+def snapshot_pages():
+    """(path, validator state) for every page that is snapshotted"""
+    yield reverse('home'), None
+    yield reverse('product_list'), catalog_state(None)
+    yield reverse('events'), events_state(None)
+    for pk in Jewelry.objects.values_list('pk', flat=True).order_by('pk'):
+        yield reverse('product_detail', args=[pk]), product_state(None, pk)
+
+
+def _state_key(state):
+    if state is None:
+        return None
+    updated, count = state
+    return [updated.isoformat() if updated else None, count]
+
+
+def file_for(path, root):
+    """Snapshot file of a URL path: /products/3/ -> products/3/index.html"""
+    return Path(root) / path.strip('/') / 'index.html'
+
+
+def load_manifest(root):
+    try:
+        with open(Path(root) / MANIFEST_NAME) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_atomic(target, content):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + '.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, target)
+
+
+def render(path):
+    """Render a page through its view as an anonymous visitor. Returns HTML bytes or None."""
+    request = RequestFactory().get(path, secure=True)
+    request.user = AnonymousUser()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore()
+    match = resolve(path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if response.status_code != 200:
+        return None
+    return response.content
+
+
+def build(root=None, full=False):
+    """
+    Render the pages whose state changed (every page with `full`) and drop
+    snapshots of products that no longer exist. Returns (rendered, removed).
+    """
+    root = Path(root or snapshot_root())
+    manifest = load_manifest(root)
+    pages = {}
+    rendered = 0
+    for path, state in snapshot_pages():
+        key = _state_key(state)
+        entry = manifest.get(path)
+        if not full and entry and entry['state'] == key and file_for(path, root).exists():
+            pages[path] = entry
+            continue
+        html = render(path)
+        if html is None:
+            continue
+        target = file_for(path, root)
+        _write_atomic(target, html)
+        _write_atomic(target.with_name('index.html.gz'), gzip.compress(html, mtime=0))
+        pages[path] = {'state': key, 'etag': hashlib.md5(html).hexdigest()}
+        rendered += 1
+
+    removed = 0
+    for path in set(manifest) - set(pages):
+        target = file_for(path, root)
+        target.unlink(missing_ok=True)
+        target.with_name('index.html.gz').unlink(missing_ok=True)
+        removed += 1
+
+    _write_atomic(root / MANIFEST_NAME, json.dumps(pages, indent=1).encode())
+    return rendered, removed
@@ -0,0 +1,118 @@
+"""
+Process startup cost.
+
+`manage.py importtime` runs a fresh interpreter with `python -X importtime`
+and reports the slowest imports of:
+
+    wsgi   what a web worker loads before its first request (the WSGI
+           application and the URLconf, which imports every view)
+    check  `manage.py check`, the floor for every management command
+
+StartupImportTests fails when web worker startup goes over
+STARTUP_BUDGET_MS or imports one of payments.LAZY_MODULES.
+
+warm_up() is what gunicorn.conf.py runs in the server's master process
+before forking workers, so each worker starts with the URLconf imported
+and the store templates compiled.
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+# Milliseconds of imports allowed before a web worker serves its first request
+STARTUP_BUDGET_MS = getattr(settings, 'STARTUP_BUDGET_MS', 1000)
+
+TARGETS = {
+    'wsgi': [
+        '-c',
+        'from moon_ecommerce.wsgi import application\n'
+        'from django.urls import get_resolver\n'
+        'get_resolver().url_patterns',
+    ],
+    'check': ['manage.py', 'check'],
+}
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+
+@dataclass
+class Import:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class Profile:
+    target: str
+    imports: list
+    wall_ms: float
+
+    @property
+    def total_ms(self):
+        """Time spent importing: the cumulative time of the top-level imports"""
+        return sum(item.cumulative_us for item in self.imports if item.depth == 0) / 1000
+
+    def modules(self):
+        return {item.module for item in self.imports}
+
+    def slowest(self, limit=20, key='cumulative'):
+        return sorted(self.imports, key=lambda item: getattr(item, f'{key}_us'), reverse=True)[:limit]
+
+
+def parse(output):
+    """Import records from `python -X importtime` stderr, in the order imports finished"""
+    imports = []
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            imports.append(Import(module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return imports
+
+
+def profile(target):
+    """Start a fresh interpreter on `target` (a TARGETS key) and profile its imports"""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *TARGETS[target]],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode:
+        raise RuntimeError(f"{target} startup failed:\n{result.stderr[-2000:]}")
+    return Profile(target, parse(result.stderr), wall_ms)
+
+
+# Warm-up before serving traffic
+
+def template_names(app_label='store'):
+    """Every template shipped in an app's templates directory, e.g. 'store/base.html'"""
+    root = Path(apps.get_app_config(app_label).path) / 'templates'
+    return sorted(path.relative_to(root).as_posix() for path in root.rglob('*.html'))
+
+
+def warm_up():
+    """
+    Do the work a fresh process would otherwise do on its first requests:
+    build the URL resolver (importing every view) and compile every store
+    template into the cached template loader. Touches no database, so it
+    is safe in a server's master process before it forks workers.
+    Returns the template names compiled.
+    """
+    get_resolver().reverse_dict  # Imports the URLconf and views and builds the reverse lookup
+    names = template_names()
+    for name in names:
+        get_template(name)
+    return names
@@ -0,0 +1,209 @@
+"""
+Lightweight database-backed task queue.
+
+Work that does not need to happen inside the customer's request (emails,
+notifications, syncs) is registered with @task and scheduled with enqueue().
+Tasks are written to the Task table once the surrounding transaction commits
+and are executed by `python manage.py run_worker`. Works on Postgres and
+SQLite, with no external broker.
+"""
+import datetime
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import mail_admins, send_mail
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task, Order
+from . import analytics, inventory, promotions, webhooks
+
+logger = logging.getLogger(__name__)
+
+# Seconds a claimed task stays invisible to other workers before it is
+# considered abandoned (worker crashed) and picked up again
+VISIBILITY_TIMEOUT = getattr(settings, 'TASK_VISIBILITY_TIMEOUT', 300)
+# First retry delay in seconds, doubled on every further attempt
+RETRY_BACKOFF = getattr(settings, 'TASK_RETRY_BACKOFF', 10)
+RETRY_BACKOFF_MAX = getattr(settings, 'TASK_RETRY_BACKOFF_MAX', 3600)
+
+_registry = {}
+
+
+def task(func=None, *, name=None):
+    """Register a function so it can be enqueued by name"""
+    def register(f):
+        _registry[name or f.__name__] = f
+        return f
+    if func is not None:
+        return register(func)
+    return register
+
+
+def enqueue(name, max_attempts=5, delay=0, **payload):
+    """
+    Schedule a registered task with JSON-serializable keyword arguments.
+
+    The row is only written once the current transaction commits, so a
+    worker never sees a task for data that was rolled back.
+    """
+    if name not in _registry:
+        raise KeyError(f"Unknown task: {name}")
+
+    def create():
+        Task.objects.create(
+            name=name,
+            payload=payload,
+            max_attempts=max_attempts,
+            run_after=timezone.now() + timedelta(seconds=delay),
+        )
+    transaction.on_commit(create)
+
+
+def _runnable(now):
+    # Queued tasks that are due, plus running tasks whose worker went away
+    return Q(status='queued', run_after__lte=now) | Q(status='running', locked_until__lt=now)
+
+
+def claim_tasks(limit=10, visibility_timeout=VISIBILITY_TIMEOUT):
+    """
+    Claim up to `limit` runnable tasks for this worker.
+
+    Each claim is a conditional UPDATE, so two workers racing for the same row
+    cannot both win it, on any database backend.
+    """
+    now = timezone.now()
+    candidate_ids = list(
+        Task.objects.filter(_runnable(now)).order_by('run_after').values_list('id', flat=True)[:limit]
+    )
+    claimed = []
+    for task_id in candidate_ids:
+        won = Task.objects.filter(_runnable(now), pk=task_id).update(
+            status='running',
+            attempts=F('attempts') + 1,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            updated_at=now,
+        )
+        if won:
+            claimed.append(task_id)
+    return list(Task.objects.filter(pk__in=claimed))
+
+
+def run_task(task_obj):
+    """Execute a claimed task and record the outcome"""
+    func = _registry.get(task_obj.name)
+    try:
+        if func is None:
+            raise KeyError(f"Unknown task: {task_obj.name}")
+        func(**task_obj.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if task_obj.attempts >= task_obj.max_attempts:
+            logger.error(f"Task {task_obj} failed permanently: {error}")
+            Task.objects.filter(pk=task_obj.pk).update(
+                status='failed', last_error=error, locked_until=None, updated_at=timezone.now()
+            )
+        else:
+            delay = min(RETRY_BACKOFF * 2 ** (task_obj.attempts - 1), RETRY_BACKOFF_MAX)
+            logger.warning(f"Task {task_obj} failed, retrying in {delay}s")
+            Task.objects.filter(pk=task_obj.pk).update(
+                status='queued',
+                last_error=error,
+                locked_until=None,
+                run_after=timezone.now() + timedelta(seconds=delay),
+                updated_at=timezone.now(),
+            )
+        return False
+    Task.objects.filter(pk=task_obj.pk).update(
+        status='done', last_error='', locked_until=None, updated_at=timezone.now()
+    )
+    return True
+
+
+def run_pending(limit=10, visibility_timeout=VISIBILITY_TIMEOUT):
+    """Claim and run one batch of tasks. Returns the number of tasks run."""
+    tasks = claim_tasks(limit, visibility_timeout)
+    for task_obj in tasks:
+        run_task(task_obj)
+    return len(tasks)
+
+
+def work(poll_interval=1.0, limit=10, visibility_timeout=VISIBILITY_TIMEOUT, once=False):
+    """Worker loop: run batches until the queue is empty, then sleep"""
+    while True:
+        # Apply CONN_MAX_AGE / health checks between batches, as Django does between requests
+        close_old_connections()
+        processed = run_pending(limit, visibility_timeout)
+        if once and not processed:
+            return
+        if not processed:
+            time.sleep(poll_interval)
+
+
+# Post-order side effects
+
+@task
+def send_order_confirmation(order_id):
+    """Email the customer a summary of their order"""
+    order = Order.objects.prefetch_related('items__jewelry').get(pk=order_id)
+    lines = [f"{item.quantity} x {item.jewelry.name} - ${item.total_price}" for item in order.items.all()]
+    send_mail(
+        subject=f"Moonwakewares order #{order.id} confirmed",
+        message=(
+            f"Hi {order.full_name},\n\n"
+            f"Thank you for your order!\n\n"
+            + "\n".join(lines)
+            + f"\n\nTotal: ${order.total_amount}\n"
+        ),
+        from_email=None,
+        recipient_list=[order.email],
+    )
+
+
+@task
+def notify_admins_of_order(order_id):
+    """Let the shop admins know a new order came in"""
+    order = Order.objects.select_related('user').get(pk=order_id)
+    mail_admins(
+        subject=f"New order #{order.id}",
+        message=f"{order.full_name} ({order.user.username}) placed an order for ${order.total_amount}.",
+    )
+
+
+@task
+def refresh_sales_rollups(day):
+    """Rebuild the analytics rollups for one day (ISO date string)"""
+    analytics.refresh_day(datetime.date.fromisoformat(day))
+
+
+@task
+def update_sales_rollups(order_ids):
+    """Add placed orders to the analytics rollups, or take out cancelled and refunded ones"""
+    analytics.update_orders(order_ids)
+
+
+@task
+def record_order_sales(order_id):
+    """Book the order's items out of the inventory ledger"""
+    inventory.record_sale(Order.objects.prefetch_related('items').get(pk=order_id))
+
+
+# Pricing
+
+@task
+def apply_promotions():
+    """Materialize effective prices and schedule the next promotion boundary"""
+    promotions.refresh_prices()
+    promotions.schedule_next_refresh()
+
+
+# Payment reconciliation
+
+@task
+def process_webhook_events():
+    """Apply queued Square webhook events to orders"""
+    webhooks.process_pending_events()
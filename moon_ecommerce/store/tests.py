@@ -1,3 +1,1264 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection
+from django.db.utils import ConnectionDoesNotExist
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analytics, archive, catalog_cache, db, events, feeds, inventory, payments, promotions, recommendations, routers,
+    snapshots, startup, tasks, webhooks,
+)
+from .models import (
+    Address, ArchivedOrder, Cart, CartItem, Category, CheckoutSession, CoPurchase, DailyProductSales, DailySales,
+    DailyVariationSales, Event, EventRSVP, HourlySales, InventoryMovement, InventorySnapshot, Jewelry, Order,
+    OrderItem, OrderItemOption, ProductVariation, Promotion, RelatedProduct, Task, UserProfile, VariationOption,
+    VariationType, WebhookEvent,
+)
+
+
+def make_jewelry(**kwargs):
+    defaults = {'name': 'Moon Ring', 'description': 'Silver ring', 'price': Decimal('40.00')}
+    defaults.update(kwargs)
+    return Jewelry.objects.create(**defaults)
+
+
+class CartItemUpsertTests(TestCase):
+    def setUp(self):
+        self.cart = Cart.objects.create(session_key='upsert')
+        self.jewelry = make_jewelry()
+
+    def test_repeated_adds_bump_quantity(self):
+        for _ in range(3):
+            CartItem.objects.add_item(self.cart, self.jewelry)
+        item = CartItem.objects.get(cart=self.cart, jewelry=self.jewelry)
+        self.assertEqual(item.quantity, 3)
+
+    def test_variation_lines_are_kept_separate(self):
+        variation = ProductVariation.objects.create(jewelry=self.jewelry)
+        CartItem.objects.add_item(self.cart, self.jewelry)
+        CartItem.objects.add_item(self.cart, self.jewelry, variation)
+        CartItem.objects.add_item(self.cart, self.jewelry, variation, quantity=2)
+        self.assertEqual(CartItem.objects.filter(cart=self.cart).count(), 2)
+        self.assertEqual(CartItem.objects.get(product_variation=variation).quantity, 3)
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_upsert_writes_to_the_managers_database(self):
+        with routers.use_replica():
+            CartItem.objects.add_item(self.cart, self.jewelry)  # Routed as a write, so not to the replica
+        self.assertEqual(CartItem.objects.get(cart=self.cart).quantity, 1)
+        with self.assertRaises(ConnectionDoesNotExist):
+            CartItem.objects.db_manager('archive').add_item(self.cart, self.jewelry)
+
+
+class CartItemConcurrencyTests(TransactionTestCase):
+    def test_concurrent_adds_create_one_line(self):
+        cart = Cart.objects.create(session_key='race')
+        jewelry = make_jewelry()
+        workers = 8
+        barrier = threading.Barrier(workers)
+        errors = []
+
+        def add():
+            try:
+                barrier.wait()
+                CartItem.objects.add_item(cart, jewelry)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        item = CartItem.objects.get(cart=cart, jewelry=jewelry)
+        self.assertEqual(item.quantity, workers)
+
+
+class UserProfileWriteTests(TestCase):
+    """Count profile writes per login and per checkout-style profile update"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('moon', password='wake-pass-123')
+
+    def profile_writes(self, queries):
+        table = UserProfile._meta.db_table
+        return [q['sql'] for q in queries if q['sql'].startswith('UPDATE') and table in q['sql']]
+
+    def test_login_does_not_touch_profile(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.login(username='moon', password='wake-pass-123')
+        self.assertEqual(self.profile_writes(ctx.captured_queries), [])
+        self.assertFalse(any(UserProfile._meta.db_table in q['sql'] for q in ctx.captured_queries))
+
+    def test_user_save_skips_unchanged_profile(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        self.assertEqual(self.profile_writes(ctx.captured_queries), [])
+
+    def test_user_save_skips_the_profile_created_with_it(self):
+        user = User.objects.create_user('tide', password='wake-pass-123')
+        self.assertTrue(User.profile.is_cached(user))
+        with CaptureQueriesContext(connection) as ctx:
+            user.save()
+        self.assertEqual(self.profile_writes(ctx.captured_queries), [])
+
+    def test_save_changes_writes_only_modified_fields(self):
+        profile = UserProfile.objects.get(user=self.user)
+        profile.same_billing_shipping = True
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertFalse(profile.save_changes())
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        profile.phone = '555-0100'
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(profile.save_changes())
+        [sql] = self.profile_writes(ctx.captured_queries)
+        self.assertIn('"phone"', sql)
+        self.assertNotIn('"shipping_address_id"', sql)
+        self.assertFalse(profile.is_dirty())
+
+
+
+class AddressTests(TestCase):
+    TIDE = {'street': '1 Tide Ln', 'city': 'Portland', 'state': 'OR', 'zip_code': '97201', 'country': 'USA'}
+
+    def test_same_address_is_stored_once(self):
+        first, second, blank = Address.objects.resolve(
+            self.TIDE, {**self.TIDE, 'street': ' 1  tide ln ', 'city': 'PORTLAND'}, {'country': 'USA'}
+        )
+        self.assertEqual(first, second)
+        self.assertIsNone(blank)
+        self.assertEqual(Address.objects.count(), 1)
+        with self.assertRaises(ValueError):
+            first.save()
+
+    def test_known_addresses_are_reused_without_queries(self):
+        [address] = Address.objects.resolve(self.TIDE)
+        with self.assertNumQueries(0):
+            self.assertEqual(Address.objects.resolve(self.TIDE, self.TIDE, known=[address]), [address, address])
+
+    def test_checkout_reuses_the_profile_address(self):
+        user = User.objects.create_user('luna', password='wake-pass-123')
+        self.client.login(username='luna', password='wake-pass-123')
+        form = {
+            'full_name': 'Luna', 'shipping_street': '1 Tide Ln', 'shipping_city': 'Portland',
+            'shipping_state': 'OR', 'shipping_zip': '97201', 'shipping_country': 'USA',
+        }
+        self.client.post(reverse('user_profile'), form, secure=True)
+        profile = UserProfile.objects.get(user=user)
+        self.assertEqual(profile.get_full_shipping_address(), '1 Tide Ln\nPortland, OR 97201\nUSA')
+        self.assertIsNone(profile.billing_address)
+
+        self.client.post(reverse('user_profile'), form, secure=True)
+        self.assertEqual(Address.objects.count(), 1)
+
+
+CHECKOUT_FORM = {
+    'full_name': 'Luna Wake', 'email': 'luna@example.com', 'phone': '555-0100',
+    'shipping_street': '1 Tide Ln', 'shipping_city': 'Portland', 'shipping_state': 'OR',
+    'shipping_zip': '97201', 'shipping_country': 'USA',
+    'billing_street': '1 Tide Ln', 'billing_city': 'Portland', 'billing_state': 'OR',
+    'billing_zip': '97201', 'billing_country': 'USA', 'source_id': 'cnon:card-nonce-ok',
+}
+
+
+class CheckoutIdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('luna', password='wake-pass-123')
+        self.client.login(username='luna', password='wake-pass-123')
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.add_item(cart, make_jewelry())
+
+    def submit(self, token):
+        return self.client.post(
+            reverse('process_payment'), {**CHECKOUT_FORM, 'checkout_token': token}, secure=True
+        )
+
+    def test_checkout_reuses_token_until_order_is_placed(self):
+        first = self.client.get(reverse('checkout'), secure=True).context['checkout_token']
+        second = self.client.get(reverse('checkout'), secure=True).context['checkout_token']
+        self.assertEqual(first, second)
+
+    @mock.patch('store.payments.client')
+    def test_resubmitting_a_token_returns_the_existing_order(self, client):
+        square = client.return_value.payments
+        square.create.return_value = SimpleNamespace(payment=SimpleNamespace(id='pay_1'), errors=None)
+        token = str(self.client.get(reverse('checkout'), secure=True).context['checkout_token'])
+
+        first = self.submit(token)
+        second = self.submit(token)
+
+        order = Order.objects.get()
+        self.assertEqual(order.checkout_session.token, CheckoutSession.objects.get().token)
+        confirmation = reverse('order_confirmation', args=[order.id])
+        self.assertRedirects(first, confirmation, fetch_redirect_response=False)
+        self.assertRedirects(second, confirmation, fetch_redirect_response=False)
+        square.create.assert_called_once()
+        self.assertEqual(square.create.call_args.kwargs['idempotency_key'], token)
+
+    @mock.patch('store.payments.client')
+    def test_retry_after_a_declined_payment_uses_a_new_token(self, client):
+        square = client.return_value.payments
+        square.create.side_effect = [
+            SimpleNamespace(payment=None, errors=['CARD_DECLINED']),
+            SimpleNamespace(payment=SimpleNamespace(id='pay_2'), errors=None),
+        ]
+        declined = str(self.client.get(reverse('checkout'), secure=True).context['checkout_token'])
+        with self.assertLogs('store.views', 'ERROR'):
+            self.assertRedirects(self.submit(declined), reverse('checkout'), fetch_redirect_response=False)
+        self.assertIsNotNone(CheckoutSession.objects.get(token=declined).failed_at)
+
+        retry = str(self.client.get(reverse('checkout'), secure=True).context['checkout_token'])
+        self.assertNotEqual(retry, declined)
+        self.submit(retry)
+        self.assertEqual(Order.objects.get().square_payment_id, 'pay_2')
+        self.assertEqual(square.create.call_args.kwargs['idempotency_key'], retry)
+
+    @mock.patch('store.payments.client')
+    def test_order_failure_after_charging_is_logged_and_raised(self, client):
+        client.return_value.payments.create.return_value = SimpleNamespace(payment=SimpleNamespace(id='pay_1'), errors=None)
+        token = str(self.client.get(reverse('checkout'), secure=True).context['checkout_token'])
+        with mock.patch('store.views.OrderItem.objects.create', side_effect=IntegrityError('price_not_null')):
+            with self.assertLogs('store.views', 'ERROR') as logs, self.assertRaises(IntegrityError):
+                self.submit(token)
+        self.assertIn('pay_1', logs.output[0])
+        self.assertFalse(Order.objects.exists())
+
+    @mock.patch('store.payments.client')
+    def test_retry_after_a_timeout_reuses_the_token(self, client):
+        square = client.return_value.payments
+        square.create.side_effect = [
+            TimeoutError('read timed out'),
+            SimpleNamespace(payment=SimpleNamespace(id='pay_1'), errors=None),
+        ]
+        token = str(self.client.get(reverse('checkout'), secure=True).context['checkout_token'])
+        with self.assertLogs('store.views', 'ERROR'):
+            self.assertRedirects(self.submit(token), reverse('checkout'), fetch_redirect_response=False)
+        self.assertIsNone(CheckoutSession.objects.get(token=token).failed_at)
+
+        retry = str(self.client.get(reverse('checkout'), secure=True).context['checkout_token'])
+        self.assertEqual(retry, token)
+        self.submit(retry)
+        self.assertEqual(Order.objects.get().square_payment_id, 'pay_1')
+        self.assertEqual([call.kwargs['idempotency_key'] for call in square.create.call_args_list], [token, token])
+
+    def test_only_card_errors_count_as_declines(self):
+        from square.core.api_error import ApiError
+
+        declined = ApiError(status_code=402, body={'errors': [{'category': 'PAYMENT_METHOD_ERROR', 'code': 'CARD_DECLINED'}]})
+        unavailable = ApiError(status_code=503, body={'errors': [{'category': 'API_ERROR', 'code': 'SERVICE_UNAVAILABLE'}]})
+        self.assertTrue(payments.is_declined(declined))
+        self.assertFalse(payments.is_declined(unavailable))
+        self.assertFalse(payments.is_declined(TimeoutError()))
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        tasks.task(name='test_record')(lambda **kwargs: self.calls.append(kwargs))
+
+        def flaky(**kwargs):
+            raise RuntimeError('boom')
+        tasks.task(name='test_flaky')(flaky)
+
+    def test_enqueue_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            tasks.enqueue('test_record', order_id=1)
+        self.assertFalse(Task.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(self.calls, [{'order_id': 1}])
+        self.assertEqual(Task.objects.get().status, 'done')
+
+    def test_failed_task_backs_off_then_fails(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.enqueue('test_flaky', max_attempts=2)
+        self.assertEqual(tasks.run_pending(), 1)
+        task_obj = Task.objects.get()
+        self.assertEqual(task_obj.status, 'queued')
+        self.assertGreater(task_obj.run_after, task_obj.updated_at)
+        self.assertEqual(tasks.run_pending(), 0)  # Not due yet
+
+        Task.objects.update(run_after=task_obj.updated_at)
+        tasks.run_pending()
+        self.assertEqual(Task.objects.get().status, 'failed')
+
+    def test_expired_claim_is_visible_again(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.enqueue('test_record')
+        self.assertEqual(len(tasks.claim_tasks(visibility_timeout=-1)), 1)
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(Task.objects.get().attempts, 2)
+
+
+def make_order(user, **kwargs):
+    [address] = Address.objects.resolve(
+        {'street': '1 Tide Ln', 'city': 'Portland', 'state': 'OR', 'zip_code': '97201', 'country': 'USA'}
+    )
+    fields = {key: CHECKOUT_FORM[key] for key in ('full_name', 'email', 'phone')}
+    fields.update({
+        'shipping_address': address, 'billing_address': address,
+        'total_amount': Decimal('40.00'), 'status': 'processing',
+    })
+    fields.update(kwargs)
+    return Order.objects.create(user=user, **fields)
+
+
+@override_settings(SQUARE_WEBHOOK_SIGNATURE_KEY='whsec-test', SQUARE_WEBHOOK_URL='https://shop.test/webhooks/square/')
+class SquareWebhookTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('tide')
+        self.paid = make_order(user, square_payment_id='pay_fixture_1', status='pending')
+        self.disputed = make_order(user, square_payment_id='pay_fixture_2', status='shipped')
+
+    def post_event(self, payload, key='whsec-test'):
+        body = json.dumps(payload).encode()
+        digest = hmac.new(key.encode(), b'https://shop.test/webhooks/square/' + body, hashlib.sha256).digest()
+        return self.client.post(
+            reverse('square_webhook'), body, content_type='application/json', secure=True,
+            headers={'x-square-hmacsha256-signature': base64.b64encode(digest).decode()},
+        )
+
+    def test_rejects_bad_signature(self):
+        response = self.post_event({'event_id': 'evt_1', 'type': 'payment.updated'}, key='wrong')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_redelivered_events_are_stored_once(self):
+        payload = {'event_id': 'evt_1', 'type': 'payment.updated', 'data': {}}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.post_event(payload).status_code, 200)
+            self.assertEqual(self.post_event(payload).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertTrue(Task.objects.filter(name='process_webhook_events').exists())
+
+    def test_replaying_fixtures_applies_latest_status_per_payment(self):
+        call_command('replay_webhooks', stdout=io.StringIO())
+        self.paid.refresh_from_db()
+        self.disputed.refresh_from_db()
+        # payment.updated (COMPLETED) then refund.updated for the same payment
+        self.assertEqual(self.paid.status, 'refunded')
+        self.assertEqual(self.disputed.status, 'disputed')
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_late_payment_completion_does_not_regress_status(self):
+        webhooks.record_event({
+            'event_id': 'evt_late', 'type': 'payment.updated', 'created_at': '2025-11-09T00:00:00Z',
+            'data': {'object': {'payment': {'id': 'pay_fixture_2', 'status': 'COMPLETED'}}},
+        })
+        webhooks.process_pending_events()
+        self.disputed.refresh_from_db()
+        self.assertEqual(self.disputed.status, 'shipped')
+
+    def test_refund_wins_over_a_later_completion_in_the_same_batch(self):
+        for event_id, created_at, event_type, obj in [
+            ('evt_refund', '2025-11-09T00:00:00Z', 'refund.updated',
+             {'refund': self.refund('ref_1', 4000)}),
+            ('evt_completed', '2025-11-09T00:05:00Z', 'payment.updated',
+             {'payment': {'id': 'pay_fixture_1', 'status': 'COMPLETED'}}),
+        ]:
+            webhooks.record_event({'event_id': event_id, 'type': event_type, 'created_at': created_at, 'data': {'object': obj}})
+        webhooks.process_pending_events()
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.status, 'refunded')
+
+    def refund(self, refund_id, cents, status='COMPLETED'):
+        return {
+            'id': refund_id, 'payment_id': 'pay_fixture_1', 'status': status,
+            'amount_money': {'amount': cents, 'currency': 'USD'},
+        }
+
+    def test_partial_refunds_keep_the_order_until_they_cover_its_total(self):
+        Order.objects.filter(pk=self.paid.pk).update(status='shipped')
+        for event_id, refund in [
+            ('evt_1', self.refund('ref_1', 500, status='PENDING')),
+            ('evt_2', self.refund('ref_1', 500)),
+            ('evt_3', self.refund('ref_1', 500)),  # Another update of the same refund
+        ]:
+            webhooks.record_event({'event_id': event_id, 'type': 'refund.updated', 'data': {'object': {'refund': refund}}})
+        webhooks.process_pending_events()
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.status, 'shipped')
+        self.assertEqual(webhooks.refunded_amounts(['pay_fixture_1']), {'pay_fixture_1': Decimal('5.00')})
+
+        webhooks.record_event({
+            'event_id': 'evt_4', 'type': 'refund.updated', 'data': {'object': {'refund': self.refund('ref_2', 3500)}},
+        })
+        webhooks.process_pending_events()
+        self.paid.refresh_from_db()
+        self.assertEqual(self.paid.status, 'refunded')
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_superuser('admin', password='wake-pass-123')
+        rings = Category.objects.create(name='Rings')
+        ring = make_jewelry(category=rings)
+        variation = ProductVariation.objects.create(jewelry=ring, sku='ring_7', price_adjustment=Decimal('5.00'))
+        self.day = date(2025, 11, 3)
+        for hour, status in [(9, 'processing'), (9, 'shipped'), (15, 'cancelled')]:
+            order = make_order(user, status=status, total_amount=Decimal('85.00'))
+            Order.objects.filter(pk=order.pk).update(
+                created_at=datetime(2025, 11, 3, hour, 30, tzinfo=dt_timezone.utc)
+            )
+            OrderItem.objects.create(order=order, jewelry=ring, quantity=1, price=Decimal('40.00'))
+            OrderItem.objects.create(order=order, jewelry=ring, product_variation=variation, quantity=1, price=Decimal('45.00'))
+
+    def test_refresh_day_builds_rollups_without_cancelled_orders(self):
+        analytics.refresh_day(self.day)
+        daily = DailySales.objects.get(date=self.day)
+        self.assertEqual((daily.orders, daily.items_sold, daily.revenue), (2, 4, Decimal('170.00')))
+        self.assertEqual(HourlySales.objects.get().orders, 2)
+        [top] = analytics.top_products(self.day, self.day)
+        self.assertEqual((top['quantity'], top['revenue']), (4, Decimal('170.00')))
+        [variation] = analytics.top_variations(self.day, self.day)
+        self.assertEqual(variation['product_variation__sku'], 'ring_7')
+        self.assertEqual(analytics.category_mix(self.day, self.day)[0]['category__name'], 'Rings')
+
+        # Re-running is idempotent
+        analytics.refresh_day(self.day)
+        self.assertEqual(DailySales.objects.count(), 1)
+
+    def rollups(self):
+        return (
+            list(DailySales.objects.values_list('date', 'orders', 'items_sold', 'revenue')),
+            list(HourlySales.objects.values_list('hour', 'orders', 'items_sold', 'revenue')),
+            list(DailyProductSales.objects.values_list('date', 'jewelry', 'category', 'quantity', 'revenue')),
+            list(DailyVariationSales.objects.values_list('date', 'product_variation', 'quantity', 'revenue')),
+        )
+
+    def test_order_updates_match_a_rebuild(self):
+        orders = list(Order.objects.order_by('pk'))
+        analytics.update_orders([order.pk for order in orders])
+        analytics.update_orders([order.pk for order in orders])  # A retried task changes nothing
+        incremental = self.rollups()
+        analytics.refresh_day(self.day)
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(DailySales.objects.get().orders, 2)
+
+        Order.objects.filter(pk=orders[0].pk).update(status='refunded')
+        with self.assertNumQueries(15):  # However many orders the day has
+            analytics.update_orders([orders[0].pk])
+        incremental = self.rollups()
+        analytics.refresh_day(self.day)
+        self.assertEqual(self.rollups(), incremental)
+        self.assertEqual(DailySales.objects.get().revenue, Decimal('85.00'))
+
+        Order.objects.filter(status__in=analytics.EXCLUDED_STATUSES).update(status='shipped')
+        Order.objects.exclude(pk=orders[2].pk).update(status='cancelled')
+        analytics.update_orders([order.pk for order in orders])
+        incremental = self.rollups()
+        analytics.refresh_day(self.day)
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_backfill_and_dashboard_read_rollups(self):
+        call_command('backfill_sales_rollups', stdout=io.StringIO())
+        self.assertTrue(DailySales.objects.filter(date=self.day).exists())
+
+        self.client.login(username='admin', password='wake-pass-123')
+        response = self.client.get(reverse('admin:store_dailysales_changelist'), {'days': 3650}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['summary']['orders'], 2)
+
+        response = self.client.get(
+            reverse('admin:store_dailysales_export'), {'report': 'categories', 'days': 3650}, secure=True
+        )
+        name, quantity, revenue = response.content.decode().splitlines()[1].split(',')
+        self.assertEqual((name, quantity, Decimal(revenue)), ('Rings', '4', Decimal('170.00')))
+
+    def test_rebuilding_a_day_counts_its_archived_orders(self):
+        user = User.objects.get(username='admin')
+        ring = Jewelry.objects.get()
+        day = date(2024, 3, 1)
+        placed = [make_order(user, status=status, total_amount=Decimal('40.00')) for status in ('completed', 'shipped')]
+        for order in placed:
+            OrderItem.objects.create(order=order, jewelry=ring, quantity=1, price=Decimal('40.00'))
+        Order.objects.filter(pk__in=[order.pk for order in placed]).update(
+            created_at=datetime(2024, 3, 1, 12, tzinfo=dt_timezone.utc)
+        )
+        archive.archive_orders(archive.cutoff(18))
+        self.assertEqual(ArchivedOrder.objects.get().pk, placed[0].pk)
+
+        analytics.refresh_day(day)
+        daily = DailySales.objects.get(date=day)
+        self.assertEqual((daily.orders, daily.items_sold, daily.revenue), (2, 2, Decimal('80.00')))
+        self.assertEqual(DailyProductSales.objects.get(date=day).quantity, 2)
+
+        # A refund of the live order still changes the day
+        Order.objects.filter(pk=placed[1].pk).update(status='refunded')
+        analytics.refresh_day(day)
+        daily = DailySales.objects.get(date=day)
+        self.assertEqual((daily.orders, daily.revenue), (1, Decimal('40.00')))
+
+
+
+class VariationSalesTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('tide')
+        self.ring = make_jewelry()
+        size, stone = VariationType.objects.create(name='Size'), VariationType.objects.create(name='Stone')
+        ruby = VariationOption.objects.create(variation_type=stone, value='Ruby')
+        order = make_order(user)
+        for sku, size_value, quantity in [('RING-7', '7', 2), ('RING-8', '8', 1)]:
+            variation = ProductVariation.objects.create(jewelry=self.ring, sku=sku)
+            variation.variation_options.set([VariationOption.objects.create(variation_type=size, value=size_value), ruby])
+            OrderItem.objects.create(
+                order=order, jewelry=self.ring, product_variation=variation, quantity=quantity, price=Decimal('50.00')
+            )
+        self.today = timezone.now().date()
+
+    def test_items_snapshot_their_options(self):
+        self.assertEqual(
+            sorted(OrderItemOption.objects.values_list('variation_type', 'value')),
+            [('Size', '7'), ('Size', '8'), ('Stone', 'Ruby'), ('Stone', 'Ruby')],
+        )
+
+    def test_variation_sales_queries(self):
+        sales = analytics.variation_sales(self.today, self.today, {'Size': '7', 'Stone': 'Ruby'}, jewelry=self.ring)
+        self.assertEqual(sales, {'quantity': 2, 'revenue': Decimal('100.00')})
+        self.assertEqual(analytics.variation_sales(self.today, self.today, {'Size': '9'})['quantity'], 0)
+        breakdown = analytics.variation_breakdown(self.today, self.today, 'Size', {'Stone': 'Ruby'})
+        self.assertEqual(
+            [(row['value'], row['quantity'], row['revenue']) for row in breakdown],
+            [('7', 2, Decimal('100.00')), ('8', 1, Decimal('50.00'))],
+        )
+
+    def test_backfill_restores_missing_options(self):
+        OrderItemOption.objects.all().delete()
+        call_command('backfill_order_item_options', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(OrderItemOption.objects.count(), 4)
+        self.assertEqual(analytics.variation_sales(self.today, self.today, {'Size': '8'})['quantity'], 1)
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', password='wake-pass-123')
+        ring = make_jewelry(sku='ring')
+        self.order = make_order(self.user)
+        OrderItem.objects.create(order=self.order, jewelry=ring, quantity=2, price=Decimal('40.00'))
+        make_order(self.user, status='cancelled')
+
+    def test_export_command_filters_and_streams_items(self):
+        out = io.StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--status', 'processing', '--chunk-size', '1', stdout=out)
+        [line] = out.getvalue().splitlines()
+        document = json.loads(line)
+        self.assertEqual(document['order_id'], self.order.id)
+        self.assertEqual(document['items'][0]['line_total'], '80.00')
+
+    def test_admin_action_returns_streaming_csv(self):
+        self.client.login(username='admin', password='wake-pass-123')
+        response = self.client.post(
+            reverse('admin:store_order_changelist'),
+            {'action': 'export_csv', '_selected_action': [self.order.pk]},
+            secure=True,
+        )
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertIn('ring', rows[1])
+
+    def test_archived_orders_are_exported_in_date_order(self):
+        old = make_order(self.user, status='completed')
+        OrderItem.objects.create(order=old, jewelry=Jewelry.objects.get(sku='ring'), quantity=1, price=Decimal('35.00'))
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=800))
+        archive.archive_orders(archive.cutoff(18))
+
+        out = io.StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--chunk-size', '1', stdout=out)
+        documents = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(documents[0]['order_id'], old.pk)
+        self.assertEqual(len(documents), 3)
+        self.assertEqual(documents[0]['username'], 'admin')
+        self.assertEqual(documents[0]['shipping_city'], 'Portland')
+        self.assertEqual(
+            [(item['sku'], item['quantity'], item['line_total']) for item in documents[0]['items']], [('ring', 1, '35.00')]
+        )
+
+        out = io.StringIO()
+        call_command('export_orders', '--status', 'processing', stdout=out)
+        self.assertNotIn(str(old.pk), [line.split(',')[0] for line in out.getvalue().splitlines()])
+
+        self.client.login(username='admin', password='wake-pass-123')
+        response = self.client.post(
+            reverse('admin:store_archivedorder_changelist'),
+            {'action': 'export_csv', '_selected_action': [old.pk]},
+            secure=True,
+        )
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 2)
+        self.assertTrue(rows[1].startswith(f'{old.pk},'))
+
+
+class BulkAdminActionTests(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', password='wake-pass-123')
+        self.client.login(username='admin', password='wake-pass-123')
+        self.rings = [make_jewelry(name=f'Ring {n}', stock_quantity=3) for n in range(3)]
+
+    def run_action(self, model, action, objects, **fields):
+        data = {'action': action, '_selected_action': [obj.pk for obj in objects], **fields}
+        return self.client.post(reverse(f'admin:store_{model}_changelist'), data, secure=True)
+
+    def test_actions_run_as_single_updates(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.run_action('jewelry', 'adjust_stock', self.rings, amount=-5)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "store_jewelry"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(Jewelry.objects.values_list('stock_quantity', flat=True)), {0})
+
+        self.run_action('jewelry', 'reprice', self.rings[:1], percent='-25')
+        self.assertEqual(Jewelry.objects.get(pk=self.rings[0].pk).price, Decimal('30.00'))
+
+        self.run_action('jewelry', 'deactivate', self.rings[1:])
+        self.assertEqual(Jewelry.objects.filter(is_active=True).count(), 1)
+
+    def test_stock_counters_are_not_editable(self):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(username='admin')
+        for model in (Jewelry, ProductVariation):
+            model_admin = admin.site._registry[model]
+            self.assertNotIn('stock_quantity', model_admin.list_editable)
+            self.assertNotIn('stock_quantity', model_admin.get_form(request, self.rings[0]).base_fields)
+
+    def test_set_order_status_updates_rollups_in_one_task(self):
+        user = User.objects.get(username='admin')
+        orders = [make_order(user) for _ in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_action('order', 'set_status', orders, status='completed')
+        self.assertEqual(Order.objects.filter(status='completed').count(), 3)
+        [task] = Task.objects.filter(name='update_sales_rollups')
+        self.assertEqual(sorted(task.payload['order_ids']), sorted(order.pk for order in orders))
+
+
+class PromotionTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.rings = Category.objects.create(name='Rings')
+        self.ring = make_jewelry(category=self.rings)
+        self.variation = ProductVariation.objects.create(jewelry=self.ring, price_adjustment=Decimal('10.00'))
+        self.sale = Promotion.objects.create(
+            name='Full moon sale', discount_type='percent', value=Decimal('25'),
+            starts_at=self.now - timedelta(hours=1), ends_at=self.now + timedelta(hours=1),
+        )
+        self.sale.categories.add(self.rings)
+
+    def test_effective_prices_follow_the_promotion_window(self):
+        promotions.refresh_prices(now=self.now)
+        self.ring.refresh_from_db()
+        self.variation.refresh_from_db()
+        self.assertEqual(self.ring.current_price, Decimal('30.00'))
+        self.assertEqual(self.variation.current_price, Decimal('37.50'))
+        self.assertTrue(self.ring.on_sale)
+
+        promotions.refresh_prices(now=self.now + timedelta(hours=2))
+        self.ring.refresh_from_db()
+        self.assertEqual(self.ring.current_price, Decimal('40.00'))
+
+    def test_cart_reads_precomputed_price(self):
+        promotions.refresh_prices(now=self.now)
+        cart = Cart.objects.create(session_key='sale')
+        CartItem.objects.add_item(cart, self.ring, quantity=2)
+        item = CartItem.objects.select_related('jewelry').get(cart=cart)
+        with self.assertNumQueries(0):
+            self.assertEqual(item.total_price, Decimal('60.00'))
+
+    def test_best_promotion_wins_and_sets_next_boundary(self):
+        fixed = Promotion.objects.create(
+            name='Fifteen off', discount_type='fixed', value=Decimal('15'),
+            starts_at=self.now - timedelta(hours=1), ends_at=self.now + timedelta(minutes=30),
+        )
+        fixed.products.add(self.ring)
+        promotions.refresh_prices(now=self.now)
+        self.ring.refresh_from_db()
+        self.assertEqual(self.ring.current_price, Decimal('25.00'))
+        self.assertEqual(promotions.next_boundary(self.now), fixed.ends_at)
+
+
+class InventoryLedgerTests(TestCase):
+    def setUp(self):
+        self.ring = make_jewelry()
+        self.pendant = make_jewelry(name='Tide Pendant')
+        self.variation = ProductVariation.objects.create(jewelry=self.pendant, sku='TIDE-S')
+
+    def test_movements_update_counters_and_levels(self):
+        inventory.receive([(self.ring.pk, None, 5), (self.pendant.pk, self.variation.pk, 2)])
+        user = User.objects.create_user('tide')
+        order = make_order(user)
+        OrderItem.objects.create(order=order, jewelry=self.ring, quantity=2, price=Decimal('40.00'))
+
+        self.assertEqual(inventory.record_sale(order), 1)
+        self.assertEqual(inventory.record_sale(order), 0)  # Booked once only
+        self.ring.refresh_from_db()
+        self.assertEqual(self.ring.stock_quantity, 3)
+        self.assertEqual(
+            inventory.current_levels(),
+            {(self.ring.pk, None): 3, (self.pendant.pk, self.variation.pk): 2},
+        )
+
+    def test_overselling_records_what_was_actually_removed(self):
+        inventory.receive([(self.ring.pk, None, 1)])
+        inventory.record_for_queryset(Jewelry.objects.filter(pk=self.ring.pk), 'adjustment', -3, note='Breakage')
+        self.ring.refresh_from_db()
+        self.assertEqual(self.ring.stock_quantity, 0)
+        self.assertEqual(inventory.current_levels()[(self.ring.pk, None)], 0)
+        self.assertEqual(InventoryMovement.objects.first().note, 'Breakage (requested -3, 1 in stock)')
+
+    def test_snapshot_plus_recent_movements(self):
+        inventory.receive([(self.ring.pk, None, 5)])
+        self.assertEqual(inventory.take_snapshot(settle_seconds=0), 1)
+        self.assertEqual(inventory.take_snapshot(settle_seconds=0), 0)
+        inventory.record_for_queryset(Jewelry.objects.filter(pk=self.ring.pk), 'adjustment', -4)
+
+        self.assertEqual(InventorySnapshot.objects.get().quantity, 5)
+        self.assertEqual(inventory.current_levels()[(self.ring.pk, None)], 1)
+        report = inventory.low_stock(threshold=1)
+        self.assertEqual([(row['variation'], row['level']) for row in report], [(self.variation, 0), (None, 1)])
+
+    def test_ledger_is_append_only(self):
+        inventory.receive([(self.ring.pk, None, 1)])
+        movement = InventoryMovement.objects.get()
+        with self.assertRaises(ValueError):
+            movement.save()
+        with self.assertRaises(ValueError):
+            movement.delete()
+
+    def test_receive_stock_command(self):
+        csv_path = Path(self.enterContext(tempfile.TemporaryDirectory())) / 'receipt.csv'
+        csv_path.write_text('sku,quantity\nTIDE-S,4\n')
+        call_command('receive_stock', str(csv_path), note='PO 17', stdout=io.StringIO())
+        self.variation.refresh_from_db()
+        self.assertEqual(self.variation.stock_quantity, 4)
+        self.assertEqual(InventoryMovement.objects.get().note, 'PO 17')
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tide', password='pw')
+        self.ring = make_jewelry()
+        self.old = make_order(self.user, status='completed', square_payment_id='pay_old')
+        OrderItem.objects.create(order=self.old, jewelry=self.ring, quantity=2, price=Decimal('20.00'))
+        self.open = make_order(self.user, status='shipped')
+        self.recent = make_order(self.user, status='completed')
+        long_ago = timezone.now() - timedelta(days=800)
+        Order.objects.filter(pk__in=[self.old.pk, self.open.pk]).update(created_at=long_ago)
+
+    def test_only_old_closed_orders_move(self):
+        moved = archive.archive_orders(archive.cutoff(18), batch_size=1)
+
+        self.assertEqual(moved, 1)
+        self.assertEqual(set(Order.objects.values_list('pk', flat=True)), {self.open.pk, self.recent.pk})
+        self.assertFalse(OrderItem.objects.filter(order_id=self.old.pk).exists())
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual((archived.pk, archived.square_payment_id), (self.old.pk, 'pay_old'))
+        order = archived.as_order()
+        self.assertEqual(order.shipping_address.city, 'Portland')
+        with self.assertNumQueries(0):
+            lines = [(item.jewelry.name, item.quantity, item.total_price) for item in order.items.all()]
+        self.assertEqual(lines, [('Moon Ring', 2, Decimal('40.00'))])
+
+    def test_history_and_confirmation_include_archived_orders(self):
+        archive.archive_orders(archive.cutoff(18))
+        self.client.login(username='tide', password='pw')
+
+        response = self.client.get(reverse('order_history'), secure=True)
+        self.assertEqual(
+            [order.pk for order in response.context['orders']], [self.recent.pk, self.open.pk, self.old.pk]
+        )
+        response = self.client.get(reverse('order_confirmation', args=[self.old.pk]), secure=True)
+        self.assertContains(response, 'Moon Ring')
+
+    def test_admin_redirects_to_archived_order(self):
+        archive.archive_orders(archive.cutoff(18))
+        User.objects.create_superuser('staff', password='pw')
+        self.client.login(username='staff', password='pw')
+
+        response = self.client.get(reverse('admin:store_order_change', args=[self.old.pk]), secure=True)
+        self.assertRedirects(
+            response, reverse('admin:store_archivedorder_change', args=[self.old.pk]), fetch_redirect_response=False
+        )
+        response = self.client.get(response['Location'], secure=True)
+        self.assertContains(response, 'pay_old')
+
+    def test_refuses_orders_still_inside_the_refund_window(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_orders', months=12)
+        with self.assertRaises(ValueError):
+            archive.archive_orders(archive.cutoff(6))
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tide')
+        self.a, self.b, self.c, self.d = (make_jewelry(name=name) for name in ('Moon', 'Tide', 'Ebb', 'Flow'))
+        for products, status in [((self.a, self.b), 'completed'), ((self.a, self.b, self.c), 'shipped'),
+                                 ((self.a, self.c), 'processing'), ((self.a, self.d), 'cancelled')]:
+            self.order(products, status)
+
+    def order(self, products, status='processing'):
+        order = make_order(self.user, status=status)
+        for jewelry in products:
+            OrderItem.objects.create(order=order, jewelry=jewelry, quantity=1, price=Decimal('40.00'))
+        return order
+
+    def neighbours(self, jewelry):
+        return [(row.related, row.score) for row in jewelry.related_products.all()]
+
+    def test_refresh_counts_only_new_orders(self):
+        run = recommendations.refresh(settle_seconds=0)
+        self.assertEqual(run.orders_counted, 3)
+        self.assertEqual(self.neighbours(self.a), [(self.b, 2), (self.c, 2)])
+        self.assertIsNone(recommendations.refresh(settle_seconds=0))
+
+        self.order((self.b, self.c))
+        self.assertEqual(recommendations.refresh(settle_seconds=0).orders_counted, 1)
+        self.assertEqual(self.neighbours(self.c), [(self.a, 2), (self.b, 2)])
+        self.assertEqual(self.neighbours(self.b), [(self.a, 2), (self.c, 2)])
+        self.assertEqual(CoPurchase.objects.get(jewelry=self.b, other=self.c).count, 2)
+
+        incremental = {(row.jewelry_id, row.related_id, row.score) for row in RelatedProduct.objects.all()}
+        recommendations.refresh(full=True, settle_seconds=0)
+        self.assertEqual(
+            {(row.jewelry_id, row.related_id, row.score) for row in RelatedProduct.objects.all()}, incremental
+        )
+
+    def test_full_refresh_counts_the_archive_when_every_order_is_archived(self):
+        recommendations.refresh(settle_seconds=0)
+        Order.objects.update(status='completed', created_at=timezone.now() - timedelta(days=800))
+        archive.archive_orders(archive.cutoff(18))
+        self.assertFalse(Order.objects.exists())
+
+        run = recommendations.refresh(full=True, settle_seconds=0)
+        self.assertEqual((run.order_cursor, run.orders_counted), (0, 4))
+        self.assertEqual(self.neighbours(self.a), [(self.b, 2), (self.c, 2), (self.d, 1)])
+
+        self.order((self.b, self.d))
+        self.assertEqual(recommendations.refresh(settle_seconds=0).orders_counted, 1)
+        self.assertEqual(self.neighbours(self.d), [(self.a, 1), (self.b, 1)])
+
+    def test_product_page_shows_active_recommendations(self):
+        call_command('refresh_recommendations', settle_seconds=0, stdout=io.StringIO())
+        Jewelry.objects.filter(pk=self.c.pk).update(is_active=False)
+
+        response = self.client.get(reverse('product_detail', args=[self.a.pk]), secure=True)
+        self.assertEqual(response.context['related_items'], [self.b])
+        self.assertContains(response, 'Customers Also Bought')
+
+
+class EventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.gathering = Event.objects.create(
+            title='Full Moon Gathering', description='Beach meetup', date=self.now + timedelta(days=3), max_attendees=1
+        )
+        self.users = [User.objects.create_user(f'guest{n}') for n in range(2)]
+
+    def test_rsvp_capacity_is_enforced(self):
+        events.rsvp(self.gathering, self.users[0])
+        with self.assertRaises(ValidationError):
+            events.rsvp(self.gathering, self.users[0])
+        with self.assertRaises(ValidationError):
+            events.rsvp(self.gathering, self.users[1])
+        self.gathering.refresh_from_db()
+        self.assertEqual(self.gathering.rsvp_count, 1)
+        self.assertEqual(EventRSVP.objects.count(), 1)
+
+        self.assertTrue(events.cancel_rsvp(self.gathering, self.users[0]))
+        events.rsvp(self.gathering, self.users[1])
+        self.gathering.refresh_from_db()
+        self.assertEqual(self.gathering.rsvp_count, 1)
+
+    def test_listing_is_paginated_and_cached_until_changed(self):
+        for n in range(events.PAST_EVENTS_PER_PAGE + 1):
+            Event.objects.create(title=f'Market {n}', description='', date=self.now - timedelta(days=n + 1))
+        data = events.listing(2, now=self.now)
+        self.assertEqual((data['page_number'], data['num_pages']), (2, 2))
+        self.assertEqual([event.title for event in data['past_events']], ['Market 12'])
+        events.listing(1, now=self.now)
+
+        with self.assertNumQueries(2):  # Only the version check per page
+            self.assertEqual(events.listing(1, now=self.now)['upcoming_events'], [self.gathering])
+            events.listing(2, now=self.now)
+
+        # As another process would see it: no invalidation reaches this cache
+        events.rsvp(self.gathering, self.users[0])
+        self.assertEqual(events.listing(1, now=self.now)['upcoming_events'][0].rsvp_count, 1)
+
+    def test_rsvp_view(self):
+        self.client.force_login(self.users[0])
+        response = self.client.post(reverse('rsvp_event', args=[self.gathering.pk]), secure=True)
+        self.assertRedirects(response, reverse('events'), fetch_redirect_response=False)
+        response = self.client.get(reverse('events'), secure=True)
+        self.assertEqual(response.context['rsvped_event_ids'], {self.gathering.pk})
+
+
+class CartBadgeTests(TestCase):
+    def setUp(self):
+        self.ring = make_jewelry()
+
+    def test_badge_reads_the_session_summary(self):
+        self.client.get(reverse('add_to_cart', args=[self.ring.pk]), secure=True)
+        self.client.get(reverse('add_to_cart', args=[self.ring.pk]), secure=True)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('cart_summary'), secure=True)
+        self.assertContains(response, '$80.00')
+        self.assertFalse([q for q in ctx.captured_queries if 'store_cart' in q['sql']])
+
+        cart_item = CartItem.objects.get()
+        self.client.post(reverse('update_cart', args=[cart_item.pk]), {'quantity': 0}, secure=True)
+        response = self.client.get(reverse('cart_summary'), secure=True)
+        self.assertNotContains(response, 'badge')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_badge_is_lazy_without_a_session(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('home'), secure=True)
+        self.assertNotIn('sessionid', response.cookies)
+
+
+class CatalogHttpCachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ring = make_jewelry()
+
+    def test_unchanged_product_answers_304_without_rendering(self):
+        url = reverse('product_detail', args=[self.ring.pk])
+        response = self.client.get(url, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('stale-while-revalidate=', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertIn('data-cart-summary-url', response.content.decode())
+
+        with self.assertNumQueries(3):  # The validator aggregates only
+            response = self.client.get(url, secure=True, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        etag = response['ETag']
+        ProductVariation.objects.create(jewelry=self.ring)
+        response = self.client.get(url, secure=True, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_signed_in_pages_are_private(self):
+        self.client.force_login(User.objects.create_user('tide'))
+        response = self.client.get(reverse('product_list'), secure=True)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_pages_with_flash_messages_are_not_stored(self):
+        self.client.get(reverse('add_to_cart', args=[self.ring.pk]), secure=True)
+        response = self.client.get(reverse('home'), secure=True)
+        self.assertContains(response, 'added to cart')
+        self.assertIn('no-store', response['Cache-Control'])
+
+
+class TemplateRenderingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ring = make_jewelry()
+
+    def test_pages_link_static_stylesheets(self):
+        response = self.client.get(reverse('product_list'), secure=True)
+        self.assertNotContains(response, '<style>')
+        self.assertContains(response, 'store/css/product_list.css')
+        self.assertContains(response, 'class="product-card"')
+
+    def test_benchmark_reports_every_page(self):
+        user = User.objects.create_user('tide')
+        order = make_order(user)
+        OrderItem.objects.create(order=order, jewelry=self.ring, quantity=1, price=Decimal('40.00'))
+        out = io.StringIO()
+        call_command('benchmark_templates', iterations=3, stdout=out)
+        rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[1:]}
+        self.assertEqual(
+            set(rows), {'home', 'product_list', 'product_detail', 'events', 'custom_orders', 'order_confirmation'}
+        )
+        # Rendering alone must not query the database
+        self.assertEqual(rows['product_list'][-1], '0.0')
+        self.assertEqual(rows['order_confirmation'][-1], '0.0')
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(CATALOG_SNAPSHOTS=True, CATALOG_SNAPSHOT_ROOT=self.root))
+        self.ring = make_jewelry()
+
+    def test_build_is_incremental(self):
+        self.assertEqual(snapshots.build(), (4, 0))  # home, products, events, one product
+        self.assertEqual(snapshots.build(), (0, 0))
+
+        Jewelry.objects.filter(pk=self.ring.pk).update(name='Tide Ring', updated_at=timezone.now())
+        self.assertEqual(snapshots.build(), (2, 0))  # The product and the product list
+        self.assertIn(b'Tide Ring', snapshots.file_for(f'/products/{self.ring.pk}/', self.root).read_bytes())
+
+        self.ring.delete()
+        self.assertEqual(snapshots.build(), (1, 1))
+
+    def test_middleware_serves_anonymous_visitors_only(self):
+        snapshots.build()
+        url = reverse('product_detail', args=[self.ring.pk])
+        with self.assertNumQueries(0):
+            response = self.client.get(url, secure=True, headers={'accept-encoding': 'gzip'})
+        self.assertEqual(response['X-Catalog-Snapshot'], '1')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        response = self.client.get(url + '?ref=mail', secure=True)
+        self.assertFalse(response.has_header('X-Catalog-Snapshot'))
+
+        self.client.force_login(User.objects.create_user('tide'))
+        response = self.client.get(url, secure=True)
+        self.assertFalse(response.has_header('X-Catalog-Snapshot'))
+
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        self.root = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(override_settings(FEEDS_ROOT=str(self.root), SITE_URL='https://shop.test'))
+        self.enterContext(mock.patch.object(feeds, 'SITEMAP_PAGE_SIZE', 1))
+        self.ring = make_jewelry(sku='RING')
+        self.pendant = make_jewelry(name='Tide Pendant & Chain', sku='PENDANT')
+        ProductVariation.objects.create(jewelry=self.pendant, sku='PENDANT-S', stock_quantity=2)
+
+    def read(self, name):
+        return gzip.decompress((self.root / name).read_bytes()).decode()
+
+    def test_build_is_incremental(self):
+        written, removed = feeds.build()
+        self.assertEqual(sorted(written), [
+            'product-feed.xml.gz', 'sitemap-pages.xml.gz', 'sitemap-products-1.xml.gz',
+            'sitemap-products-2.xml.gz', 'sitemap.xml.gz',
+        ])
+        self.assertEqual(feeds.build(), ([], []))
+        self.assertIn('<loc>https://shop.test/sitemap-products-2.xml</loc>', self.read('sitemap.xml.gz'))
+        self.assertIn(f'<loc>https://shop.test/products/{self.ring.pk}/</loc>', self.read('sitemap-products-1.xml.gz'))
+
+        feed = self.read('product-feed.xml.gz')
+        self.assertIn('<g:id>PENDANT-S</g:id><g:title>Tide Pendant &amp; Chain</g:title>', feed)
+        self.assertIn(f'<g:item_group_id>{self.pendant.pk}</g:item_group_id>', feed)
+        self.assertIn('<g:id>RING</g:id>', feed)
+
+        Jewelry.objects.filter(pk=self.ring.pk).update(is_active=False, updated_at=timezone.now())
+        written, removed = feeds.build()
+        self.assertEqual(sorted(written), ['product-feed.xml.gz', 'sitemap-pages.xml.gz', 'sitemap.xml.gz'])
+        self.assertEqual(removed, ['sitemap-products-1.xml.gz'])
+        self.assertFalse((self.root / 'sitemap-products-1.xml.gz').exists())
+
+    def test_middleware_serves_files_without_queries(self):
+        call_command('build_feeds', stdout=io.StringIO())
+        with self.assertNumQueries(0):
+            response = self.client.get('/sitemap.xml', secure=True, headers={'accept-encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'<sitemapindex', gzip.decompress(response.content))
+
+        response = self.client.get('/product-feed.xml', secure=True)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertContains(response, '<rss version="2.0"')
+        response = self.client.get('/product-feed.xml', secure=True, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_each_content_coding_has_its_own_etag(self):
+        call_command('build_feeds', stdout=io.StringIO())
+        compressed = self.client.get('/product-feed.xml', secure=True, headers={'accept-encoding': 'gzip'})
+        identity = self.client.get('/product-feed.xml', secure=True)
+        self.assertTrue(identity['ETag'].endswith('-identity"'))
+        self.assertNotEqual(compressed['ETag'], identity['ETag'])
+
+        response = self.client.get('/product-feed.xml', secure=True, headers={'if-none-match': compressed['ETag']})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(
+            '/product-feed.xml', secure=True,
+            headers={'if-none-match': identity['ETag'], 'accept-encoding': 'gzip'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+
+class DatabaseConnectionTests(TestCase):
+    def test_stats_and_benchmark(self):
+        out = io.StringIO()
+        call_command('db_connections', benchmark=5, stdout=out)
+        output = out.getvalue()
+        self.assertIn('conn_max_age', output)
+        self.assertIn('fresh', output)
+        self.assertIn('reused', output)
+        self.assertGreaterEqual(db.connection_stats()['opened_by_process'], 6)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def read_db(self, request, router):
+        """Run a fake view through the stickiness middleware, returning (db used, response)"""
+        used = {}
+
+        def view(request):
+            with routers.use_replica():
+                used['read'] = router.db_for_read(Jewelry)
+                if request.method == 'POST':
+                    router.db_for_write(Cart)
+            return HttpResponse()
+
+        response = routers.ReplicaStickinessMiddleware(view)(request)
+        return used['read'], response
+
+    def test_reads_use_replica_only_where_allowed(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Jewelry), 'default')
+        with routers.use_replica():
+            self.assertEqual(router.db_for_read(Jewelry), 'replica')
+            with routers.use_primary():
+                self.assertEqual(router.db_for_read(Jewelry), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'store'))
+
+    def test_visitor_sticks_to_primary_after_a_write(self):
+        router = routers.ReplicaRouter()
+        factory = RequestFactory()
+        db_alias, response = self.read_db(factory.post('/cart/'), router)
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+
+        request = factory.get('/products/')
+        self.assertEqual(self.read_db(request, router)[0], 'replica')
+        request.COOKIES[routers.STICKY_COOKIE] = response.cookies[routers.STICKY_COOKIE].value
+        self.assertEqual(self.read_db(request, router)[0], 'default')
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_parse_importtime_output(self):
+        imports = startup.parse(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   store.payments\n"
+            "import time:      1300 |       1420 | store.views\n"
+        )
+        self.assertEqual(
+            [(item.module, item.self_us, item.cumulative_us, item.depth) for item in imports],
+            [('store.payments', 120, 120, 1), ('store.views', 1300, 1420, 0)],
+        )
+
+    def test_web_worker_starts_within_budget_without_the_payment_sdk(self):
+        profile = startup.profile('wsgi')
+        self.assertIn('store.views', profile.modules())
+        self.assertFalse(profile.modules() & set(payments.LAZY_MODULES))
+        self.assertLessEqual(profile.total_ms, startup.STARTUP_BUDGET_MS)
+
+
+class ServerWarmUpTests(SimpleTestCase):
+    def test_warm_up_compiles_every_store_template_without_queries(self):
+        names = startup.warm_up()  # SimpleTestCase fails on any query
+        self.assertIn('store/base.html', names)
+        self.assertIn('store/includes/cart_badge.html', names)
+
+    @mock.patch('store.management.commands.serve.os')
+    def test_serve_runs_gunicorn_with_the_project_config(self, os_module):
+        call_command('serve', bind='0.0.0.0:9000', workers=3)
+        executable, argv = os_module.execv.call_args.args
+        self.assertEqual(argv[1:3], ['-m', 'gunicorn'])
+        self.assertEqual(Path(argv[argv.index('--config') + 1]).name, 'gunicorn.conf.py')
+        self.assertEqual(argv[-5:], ['--bind', '0.0.0.0:9000', '--workers', '3', 'moon_ecommerce.wsgi:application'])
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        # The local tier needs a LISTEN connection, which SQLite has not; pretend it is connected
+        patcher = mock.patch.object(catalog_cache, 'enabled', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        catalog_cache.clear()
+        self.addCleanup(catalog_cache.clear)
+        self.ring = make_jewelry(price=Decimal('40.00'))
+        self.url = reverse('product_detail', args=[self.ring.pk])
+
+    def test_product_page_is_cached_until_the_product_is_saved(self):
+        self.client.get(self.url, secure=True)
+        with CaptureQueriesContext(connection) as cached:
+            self.client.get(self.url, secure=True)
+        self.assertFalse(any('store_variationoption' in query['sql'] for query in cached.captured_queries))
+
+        self.ring.price = Decimal('55.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ring.save()
+        self.assertContains(self.client.get(self.url, secure=True), '$55.00')
+
+    def build_count(self, key='ring'):
+        """Builds of a cache entry tagged with the ring so far"""
+        catalog_cache.get_or_set(key, lambda: (self.builds.append(key), [catalog_cache.tag(self.ring)]))
+        return len(self.builds)
+
+    def test_changing_a_variations_options_evicts_its_product(self):
+        self.builds = []
+        variation = ProductVariation.objects.create(jewelry=self.ring, sku='ring-7')
+        option = VariationOption.objects.create(variation_type=VariationType.objects.create(name='Size'), value='7')
+        self.assertEqual(self.build_count(), 1)
+        self.assertEqual(self.build_count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            variation.variation_options.add(option)
+        self.assertEqual(self.build_count(), 2)
+
+    def test_renaming_a_variation_type_evicts_its_products(self):
+        self.builds = []
+        size = VariationType.objects.create(name='Size')
+        self.ring.variation_types.add(size)
+        self.assertEqual(self.build_count(), 1)
+        size.name = 'Ring size'
+        with self.captureOnCommitCallbacks(execute=True):
+            size.save()
+        self.assertEqual(self.build_count(), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            size.delete()
+        self.assertEqual(self.build_count(), 3)
+
+    def test_promotion_price_refresh_evicts_the_product(self):
+        self.builds = []
+        now = timezone.now()
+        promotion = Promotion.objects.create(
+            name='Full moon', value=Decimal('10'), starts_at=now - timedelta(hours=1), ends_at=now + timedelta(hours=1),
+        )
+        promotion.products.add(self.ring)
+        self.assertEqual(self.build_count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            promotions.refresh_prices()  # bulk_update(), no signals
+        self.assertEqual(self.build_count(), 2)
+
+    def test_value_built_during_an_eviction_is_not_stored(self):
+        def build():
+            catalog_cache.evict(['jewelry:999'])  # An invalidation arrives while building
+            return 'stale?', [catalog_cache.tag(self.ring)]
+        catalog_cache.get_or_set('ring', build)
+        self.assertEqual(catalog_cache.get_or_set('ring', lambda: ('fresh', [])), 'fresh')
+
+    def test_notify_payloads_stay_under_the_limit(self):
+        tags = [catalog_cache.tag(Jewelry, pk) for pk in range(3000)]
+        payloads = list(catalog_cache._payloads(tags))
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(payload) <= catalog_cache.MAX_PAYLOAD for payload in payloads))
+        self.assertEqual(' '.join(payloads).split(), tags)
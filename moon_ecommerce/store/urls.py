@@ -8,8 +8,11 @@ urlpatterns = [
     path('products/', views.product_list, name='product_list'),
     path('products/<int:pk>/', views.product_detail, name='product_detail'),
     path('events/', views.events, name='events'),
+    path('events/<int:event_id>/rsvp/', views.rsvp_event, name='rsvp_event'),
+    path('events/<int:event_id>/rsvp/cancel/', views.cancel_rsvp, name='cancel_rsvp'),
     path('custom-orders/', views.custom_orders, name='custom_orders'),
     path('cart/', views.cart_detail, name='cart_detail'),
+    path('cart/summary/', views.cart_summary, name='cart_summary'),
     path('cart/add/<int:jewelry_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/update/<int:cart_item_id>/', views.update_cart, name='update_cart'),
     path('cart/remove/<int:cart_item_id>/', views.remove_from_cart, name='remove_from_cart'),
@@ -19,6 +22,7 @@ urlpatterns = [
     path('checkout/process/', views.process_payment, name='process_payment'),
     path('order/<int:order_id>/confirmation/', views.order_confirmation, name='order_confirmation'),
     path('orders/history/', views.order_history, name='order_history'),
+    path('webhooks/square/', views.square_webhook, name='square_webhook'),
 
     # Authentication URLs
     path('accounts/login/', LoginView.as_view(template_name='registration/login.html'), name='login'),
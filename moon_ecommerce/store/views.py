@@ -3,44 +3,78 @@ from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate
 from django.contrib.auth.forms import UserCreationForm
-from .models import Jewelry, Cart, CartItem, Order, OrderItem, Event, VariationOption, ProductVariation
+from .models import (
+    Address, Category, Jewelry, Cart, CartItem, Order, OrderItem, Event, VariationOption, ProductVariation,
+    CheckoutSession, UserProfile,
+)
 from django.contrib import messages
 from django.conf import settings
-from square import Square
-from square.environment import SquareEnvironment
-import uuid
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_POST
+from . import archive, catalog_cache, events as event_service, payments, recommendations, tasks, webhooks
+from .http_caching import cacheable_page, catalog_state, events_state, product_state
+from .routers import replica_reads, use_primary
+from .context_processors import remember_cart
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Existing views (home, product_list, product_detail)
+@cacheable_page()
 def home(request):
     return render(request, 'store/home.html')
 
+@replica_reads
+@cacheable_page(catalog_state)
 def product_list(request):
     jewelry_items = Jewelry.objects.all()
     return render(request, 'store/product_list.html', {'jewelry_items': jewelry_items})
 
+def product_page(pk):
+    """
+    Product page data and the catalog rows it was built from. Read from the
+    primary: a replica could still return the rows an invalidation was for.
+    """
+    with use_primary():
+        jewelry = get_object_or_404(Jewelry, pk=pk)
+
+        # Get available variations and organize by variation type
+        variations_by_type = {}
+        if jewelry.has_variations:
+            for variation_type in jewelry.variation_types.all():
+                # Get all unique options for this variation type across all product variations
+                options = VariationOption.objects.filter(
+                    variation_type=variation_type,
+                    product_variations__jewelry=jewelry,
+                    product_variations__is_available=True
+                ).distinct()
+                variations_by_type[variation_type] = list(options)
+
+        data = {
+            'jewelry': jewelry,
+            'variations_by_type': variations_by_type,
+            'product_variations': list(
+                jewelry.product_variations.filter(is_available=True).prefetch_related('variation_options')
+            ),
+            'related_items': recommendations.related_items(jewelry),
+        }
+    tags = [catalog_cache.tag(jewelry)]
+    tags += [catalog_cache.tag(item) for item in data['related_items']]
+    tags += [catalog_cache.tag(option) for options in variations_by_type.values() for option in options]
+    if jewelry.category_id:
+        tags.append(catalog_cache.tag(Category, jewelry.category_id))
+    return data, tags
+
+@replica_reads
+@cacheable_page(product_state)
 def product_detail(request, pk):
-    jewelry = get_object_or_404(Jewelry, pk=pk)
-
-    # Get available variations and organize by variation type
-    variations_by_type = {}
-    if jewelry.has_variations:
-        for variation_type in jewelry.variation_types.all():
-            # Get all unique options for this variation type across all product variations
-            options = VariationOption.objects.filter(
-                variation_type=variation_type,
-                product_variations__jewelry=jewelry,
-                product_variations__is_available=True
-            ).distinct()
-            variations_by_type[variation_type] = options
-
-    context = {
-        'jewelry': jewelry,
-        'variations_by_type': variations_by_type,
-        'product_variations': jewelry.product_variations.filter(is_available=True).prefetch_related('variation_options')
-    }
+    # Kept in this process until an edit to any of its rows is published
+    context = catalog_cache.get_or_set(f'product:{pk}', lambda: product_page(pk))
     return render(request, 'store/product_detail.html', context)
 
 # Helper function to get or create a cart
@@ -72,25 +106,13 @@ def add_to_cart(request, jewelry_id):
 
     if variation_id:
         product_variation = get_object_or_404(ProductVariation, id=variation_id, jewelry=jewelry)
-        # Check if the item with this variation is already in the cart
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            jewelry=jewelry,
-            product_variation=product_variation
-        )
         variation_info = f" ({product_variation})"
     else:
-        # Check if the item is already in the cart (without variation)
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            jewelry=jewelry,
-            product_variation=None
-        )
         variation_info = ""
 
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    # Insert the line or bump its quantity in one statement (safe under double-clicks)
+    CartItem.objects.add_item(cart, jewelry, product_variation)
+    remember_cart(request, cart)
 
     messages.success(request, f"{jewelry.name}{variation_info} added to cart!")
     return redirect('cart_detail')
@@ -98,7 +120,8 @@ def add_to_cart(request, jewelry_id):
 # Update cart item quantity
 def update_cart(request, cart_item_id):
     if request.method == 'POST':
-        cart_item = get_object_or_404(CartItem, id=cart_item_id, cart=get_cart(request))
+        cart = get_cart(request)
+        cart_item = get_object_or_404(CartItem, id=cart_item_id, cart=cart)
         quantity = int(request.POST.get('quantity', 1))
         if quantity > 0:
             cart_item.quantity = quantity
@@ -107,16 +130,38 @@ def update_cart(request, cart_item_id):
         else:
             cart_item.delete()
             messages.success(request, f"Removed {cart_item.jewelry.name} from cart.")
+        remember_cart(request, cart)
     return redirect('cart_detail')
 
 # Remove item from cart
 def remove_from_cart(request, cart_item_id):
-    cart_item = get_object_or_404(CartItem, id=cart_item_id, cart=get_cart(request))
+    cart = get_cart(request)
+    cart_item = get_object_or_404(CartItem, id=cart_item_id, cart=cart)
     cart_item.delete()
+    remember_cart(request, cart)
     messages.success(request, f"Removed {cart_item.jewelry.name} from cart.")
     return redirect('cart_detail')
 
+# Cart badge for pages served from a shared cache
+@never_cache
+def cart_summary(request):
+    return render(request, 'store/includes/cart_badge.html')
+
 # Checkout views
+def get_profile(user):
+    """The user's profile with both addresses, in one query"""
+    return UserProfile.objects.select_related('shipping_address', 'billing_address').get(user=user)
+
+def address_from_post(data, prefix):
+    """Address values from the <prefix>_street, <prefix>_city, ... inputs of the checkout and profile forms"""
+    return {
+        'street': data.get(f'{prefix}_street'),
+        'city': data.get(f'{prefix}_city'),
+        'state': data.get(f'{prefix}_state'),
+        'zip_code': data.get(f'{prefix}_zip'),
+        'country': data.get(f'{prefix}_country'),
+    }
+
 @login_required
 def checkout(request):
     """Display checkout form"""
@@ -128,9 +173,11 @@ def checkout(request):
         return redirect('cart_detail')
 
     # Pre-fill form with user's profile data
-    profile = request.user.profile
+    profile = get_profile(request.user)
+    checkout_session = CheckoutSession.for_cart(request.user, cart)
     context = {
         'cart': cart,
+        'checkout_token': checkout_session.token,
         'user_email': request.user.email,
         'profile': profile,
         'SQUARE_APPLICATION_ID': settings.SQUARE_APPLICATION_ID,
@@ -145,6 +192,20 @@ def process_payment(request):
     if request.method != 'POST':
         return redirect('checkout')
 
+    # The token issued when the checkout page rendered
+    try:
+        checkout_session = CheckoutSession.objects.get(
+            token=request.POST.get('checkout_token'), user=request.user, failed_at__isnull=True
+        )
+    except (CheckoutSession.DoesNotExist, ValidationError):
+        messages.error(request, "Your checkout session has expired. Please review your order and try again.")
+        return redirect('checkout')
+
+    # Retries and double submits return the order already placed for this token
+    existing_order = Order.objects.filter(checkout_session=checkout_session).first()
+    if existing_order:
+        return redirect('order_confirmation', order_id=existing_order.id)
+
     cart = get_cart(request)
     cart_items = cart.cartitem_set.all()
 
@@ -157,81 +218,63 @@ def process_payment(request):
     email = request.POST.get('email')
     phone = request.POST.get('phone')
 
-    shipping_street = request.POST.get('shipping_street')
-    shipping_city = request.POST.get('shipping_city')
-    shipping_state = request.POST.get('shipping_state')
-    shipping_zip = request.POST.get('shipping_zip')
-    shipping_country = request.POST.get('shipping_country', 'USA')
-
-    billing_street = request.POST.get('billing_street')
-    billing_city = request.POST.get('billing_city')
-    billing_state = request.POST.get('billing_state')
-    billing_zip = request.POST.get('billing_zip')
-    billing_country = request.POST.get('billing_country', 'USA')
-
-    # Save/update user profile
-    profile = request.user.profile
+    # Save/update user profile; an unchanged address reuses the profile's rows without a query
+    profile = get_profile(request.user)
+    shipping_address, billing_address = Address.objects.resolve(
+        address_from_post(request.POST, 'shipping'), address_from_post(request.POST, 'billing'),
+        known=[profile.shipping_address, profile.billing_address],
+    )
     profile.full_name = full_name
     profile.phone = phone
-    profile.shipping_street = shipping_street
-    profile.shipping_city = shipping_city
-    profile.shipping_state = shipping_state
-    profile.shipping_zip = shipping_zip
-    profile.shipping_country = shipping_country
-    profile.billing_street = billing_street
-    profile.billing_city = billing_city
-    profile.billing_state = billing_state
-    profile.billing_zip = billing_zip
-    profile.billing_country = billing_country
-    profile.save()
+    profile.shipping_address = shipping_address
+    profile.billing_address = billing_address
+    profile.save_changes()
 
     source_id = request.POST.get('source_id')  # This comes from Square Web Payments SDK
 
     # Calculate total
     total_amount = cart.total_price
-
-    # Initialize Square client
-    client = Square(
-           environment=SquareEnvironment.SANDBOX,
-        token=settings.SQUARE_ACCESS_TOKEN,
-    )
+    if total_amount != checkout_session.amount:
+        # Square rejects a reused idempotency key with a different amount
+        messages.warning(request, "Your cart changed. Please review your order and try again.")
+        return redirect('checkout')
 
     try:
         # Create payment with Square
-        result = client.payments.create(
-       
-                source_id= source_id,
-                idempotency_key= str(uuid.uuid4()),
-                amount_money= {
-                    "amount": int(total_amount * 100),  # Square uses cents
-                    "currency": "USD"
-                },
-                location_id= settings.SQUARE_LOCATION_ID,
-          
-        )
+        result = payments.create_payment(source_id, str(checkout_session.token), total_amount)
+    except Exception as e:
+        logger.error(f"Error processing payment: {str(e)}")
+        if payments.is_declined(e):
+            # Square keeps the outcome under this key; a retry with another card needs a new one
+            checkout_session.mark_failed()
+            messages.error(request, "Payment failed. Please try again or use a different payment method.")
+        else:
+            # The card may have been charged; a retry reuses the key and gets Square's original outcome
+            messages.error(request, "An error occurred while processing your payment. Please try again.")
+        return redirect('checkout')
 
-        if result.payment:
-            payment_response = result.payment
-            payment_id = payment_response.id
+    if not result.payment:
+        # Payment failed
+        logger.error(f"Square payment failed: {result.errors}")
+        if result.errors:
+            checkout_session.mark_failed()
+        messages.error(request, "Payment failed. Please try again or use a different payment method.")
+        return redirect('checkout')
 
+    payment_id = result.payment.id
+    try:
+        with transaction.atomic():
             # Create order
             order = Order.objects.create(
                 user=request.user,
                 full_name=full_name,
                 email=email,
                 phone=phone,
-                shipping_street=shipping_street,
-                shipping_city=shipping_city,
-                shipping_state=shipping_state,
-                shipping_zip=shipping_zip,
-                shipping_country=shipping_country,
-                billing_street=billing_street,
-                billing_city=billing_city,
-                billing_state=billing_state,
-                billing_zip=billing_zip,
-                billing_country=billing_country,
+                shipping_address=shipping_address,
+                billing_address=billing_address,
                 total_amount=total_amount,
                 square_payment_id=payment_id,
+                checkout_session=checkout_session,
                 status='processing'
             )
 
@@ -248,34 +291,61 @@ def process_payment(request):
             # Clear cart
             cart_items.delete()
 
-            messages.success(request, f"Payment successful! Order #{order.id} has been placed.")
-            return redirect('order_confirmation', order_id=order.id)
-
-        else:
-            # Payment failed
-            errors = result.errors
-            logger.error(f"Square payment failed: {errors}")
-            messages.error(request, "Payment failed. Please try again or use a different payment method.")
-            return redirect('checkout')
-
+            # Side effects run in the background once the order commits
+            tasks.enqueue('send_order_confirmation', order_id=order.id)
+            tasks.enqueue('notify_admins_of_order', order_id=order.id)
+            tasks.enqueue('update_sales_rollups', order_ids=[order.id])
+            tasks.enqueue('record_order_sales', order_id=order.id)
     except Exception as e:
-        logger.error(f"Error processing payment: {str(e)}")
-        messages.error(request, "An error occurred while processing your payment. Please try again.")
-        return redirect('checkout')
+        # A concurrent submit with the same token may have created the order first
+        order = Order.objects.filter(checkout_session=checkout_session).first()
+        if not isinstance(e, IntegrityError) or order is None:
+            # The card was charged: keep what reconciliation needs
+            logger.exception(
+                f"Payment {payment_id} was charged but no order was saved "
+                f"(checkout {checkout_session.token}, user {request.user.pk})"
+            )
+            raise
+        return redirect('order_confirmation', order_id=order.id)
+
+    remember_cart(request, None)  # The cart was emptied into the order
+    messages.success(request, f"Payment successful! Order #{order.id} has been placed.")
+    return redirect('order_confirmation', order_id=order.id)
+
+@csrf_exempt
+@require_POST
+def square_webhook(request):
+    """Verify and store a Square webhook event; processing happens in the worker"""
+    signature = request.headers.get('x-square-hmacsha256-signature')
+    if not webhooks.verify_signature(request.body, signature):
+        return HttpResponseForbidden()
+    try:
+        payload = json.loads(request.body)
+        payload['event_id']
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest()
+
+    webhooks.record_event(payload)
+    tasks.enqueue('process_webhook_events')
+    return HttpResponse(status=200)
 
 @login_required
 def order_confirmation(request, order_id):
     """Display order confirmation page"""
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = archive.find_order(order_id, request.user)
+    if order is None:
+        raise Http404("No such order")
     return render(request, 'store/order_confirmation.html', {'order': order})
 
 @login_required
+@replica_reads
 def order_history(request):
     """Display user's order history"""
-    orders = Order.objects.filter(user=request.user).prefetch_related('items__jewelry')
+    orders = archive.orders_for(request.user)
     return render(request, 'store/order_history.html', {'orders': orders})
 
 # Custom orders view
+@cacheable_page()
 def custom_orders(request):
     """Display custom orders page with link to JotForm"""
     return render(request, 'store/custom_orders.html')
@@ -286,27 +356,21 @@ def user_profile(request):
     """User profile management"""
     if request.method == 'POST':
         # Update user profile
-        profile = request.user.profile
+        profile = get_profile(request.user)
         profile.full_name = request.POST.get('full_name', '')
         profile.phone = request.POST.get('phone', '')
-        profile.shipping_street = request.POST.get('shipping_street', '')
-        profile.shipping_city = request.POST.get('shipping_city', '')
-        profile.shipping_state = request.POST.get('shipping_state', '')
-        profile.shipping_zip = request.POST.get('shipping_zip', '')
-        profile.shipping_country = request.POST.get('shipping_country', 'USA')
-        profile.billing_street = request.POST.get('billing_street', '')
-        profile.billing_city = request.POST.get('billing_city', '')
-        profile.billing_state = request.POST.get('billing_state', '')
-        profile.billing_zip = request.POST.get('billing_zip', '')
-        profile.billing_country = request.POST.get('billing_country', 'USA')
+        profile.shipping_address, profile.billing_address = Address.objects.resolve(
+            address_from_post(request.POST, 'shipping'), address_from_post(request.POST, 'billing'),
+            known=[profile.shipping_address, profile.billing_address],
+        )
         profile.same_billing_shipping = request.POST.get('same_billing_shipping') == 'on'
-        profile.save()
+        profile.save_changes()
 
         messages.success(request, 'Your profile has been updated successfully!')
         return redirect('user_profile')
 
     return render(request, 'store/user_profile.html', {
-        'profile': request.user.profile
+        'profile': get_profile(request.user)
     })
 
 # User registration view
@@ -331,15 +395,36 @@ def signup(request):
     return render(request, 'registration/signup.html', {'form': form})
 
 # Events view
+@replica_reads
+@cacheable_page(events_state)
 def events(request):
-    """Display all active events"""
-    from django.utils import timezone
-    events_list = Event.objects.filter(is_active=True).order_by('date')
-    upcoming_events = events_list.filter(date__gte=timezone.now())
-    past_events = events_list.filter(date__lt=timezone.now())
+    """Upcoming events and a paginated archive of past events"""
+    data = event_service.listing(request.GET.get('page', 1))
+    rsvped = set()
+    if request.user.is_authenticated and data['upcoming_events']:
+        rsvped = set(request.user.event_rsvps.filter(
+            event_id__in=[event.pk for event in data['upcoming_events']]
+        ).values_list('event_id', flat=True))
 
-    context = {
-        'upcoming_events': upcoming_events,
-        'past_events': past_events,
-    }
-    return render(request, 'store/events.html', context)
\ No newline at end of file
+    context = {**data, 'rsvped_event_ids': rsvped}
+    return render(request, 'store/events.html', context)
+
+@login_required
+@require_POST
+def rsvp_event(request, event_id):
+    event = get_object_or_404(Event, pk=event_id, is_active=True)
+    try:
+        event_service.rsvp(event, request.user)
+    except ValidationError as e:
+        messages.error(request, e.messages[0])
+    else:
+        messages.success(request, f"You're on the list for {event.title}!")
+    return redirect('events')
+
+@login_required
+@require_POST
+def cancel_rsvp(request, event_id):
+    event = get_object_or_404(Event, pk=event_id)
+    if event_service.cancel_rsvp(event, request.user):
+        messages.success(request, f"Your RSVP for {event.title} has been cancelled.")
+    return redirect('events')
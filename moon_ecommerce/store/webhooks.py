@@ -0,0 +1,164 @@
+"""
+Square webhook ingestion.
+
+The webhook view verifies the signature and appends the raw event to the
+WebhookEvent inbox. process_pending_events() later folds a batch of inbox
+events into one target status per payment and applies them with a handful
+of set-based UPDATEs keyed on Order.square_payment_id.
+
+Each allowed transition only moves an order up STATUS_PRECEDENCE, so
+applying a batch's events one by one ends on the highest-ranked status
+among them (if that one is allowed from the order's current status). The
+fold keeps that status, whatever order the events arrived in.
+
+A completed refund only marks the order refunded once the completed refunds
+received for its payment add up to the order total; partial refunds are
+logged and leave the status (and the order's revenue) as it is.
+"""
+import base64
+import hashlib
+import hmac
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import analytics
+from .models import Order, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+ALL_STATUSES = [code for code, _ in Order.STATUS_CHOICES]
+
+# Which current statuses each webhook-driven status may overwrite, so a late
+# "payment completed" never drags a shipped order back to processing
+ALLOWED_TRANSITIONS = {
+    'processing': ['pending'],
+    'cancelled': ['pending', 'processing'],
+    'refunded': [status for status in ALL_STATUSES if status != 'refunded'],
+    'disputed': [status for status in ALL_STATUSES if status not in ('refunded', 'disputed')],
+}
+
+# Webhook-driven statuses, lowest first; a refund or dispute outranks a later "completed"
+STATUS_PRECEDENCE = ['processing', 'cancelled', 'disputed', 'refunded']
+
+REFUND_EVENTS = ('refund.created', 'refund.updated')
+
+
+def verify_signature(body, signature, url=None):
+    """Check Square's HMAC-SHA256 signature of notification URL + raw body"""
+    key = settings.SQUARE_WEBHOOK_SIGNATURE_KEY
+    if not key or not signature:
+        return False
+    url = url or settings.SQUARE_WEBHOOK_URL
+    digest = hmac.new(key.encode(), url.encode() + body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature)
+
+
+def record_event(payload):
+    """
+    Append an event to the inbox. Redeliveries of the same event_id are
+    dropped by the unique constraint, without a lookup first.
+    """
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(event_id=payload['event_id'], event_type=payload.get('type', ''), payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+def status_change(payload):
+    """Map a Square event to (payment_id, new order status), or None if irrelevant"""
+    event_type = payload.get('type', '')
+    obj = payload.get('data', {}).get('object', {})
+
+    if event_type in ('payment.created', 'payment.updated'):
+        payment = obj.get('payment', {})
+        status = {
+            'COMPLETED': 'processing',
+            'FAILED': 'cancelled',
+            'CANCELED': 'cancelled',
+        }.get(payment.get('status'))
+        return (payment.get('id'), status) if status else None
+
+    if event_type in REFUND_EVENTS:
+        refund = obj.get('refund', {})
+        if refund.get('status') == 'COMPLETED':
+            return refund.get('payment_id'), 'refunded'
+        return None
+
+    if event_type == 'dispute.created':
+        dispute = obj.get('dispute', {})
+        return dispute.get('disputed_payment', {}).get('payment_id'), 'disputed'
+
+    return None
+
+
+def refunded_amounts(payment_ids):
+    """Dollars refunded per payment, from the completed refunds in the inbox (each refund counted once)"""
+    refunds = {}
+    events = WebhookEvent.objects.filter(
+        event_type__in=REFUND_EVENTS, payload__data__object__refund__payment_id__in=list(payment_ids),
+    )
+    for payload in events.values_list('payload', flat=True):
+        refund = payload['data']['object']['refund']
+        if refund.get('status') == 'COMPLETED':
+            cents = refund.get('amount_money', {}).get('amount', 0)
+            refunds[refund.get('id') or payload['event_id']] = (refund['payment_id'], cents)
+    amounts = {}
+    for payment_id, cents in refunds.values():
+        amounts[payment_id] = amounts.get(payment_id, 0) + Decimal(cents) / 100  # Square uses cents
+    return amounts
+
+
+def fully_refunded(payment_ids):
+    """The payments whose completed refunds cover their order's total"""
+    amounts = refunded_amounts(payment_ids)
+    totals = Order.objects.filter(square_payment_id__in=payment_ids).values_list('square_payment_id', 'total_amount')
+    return {payment_id for payment_id, total in totals if amounts.get(payment_id, 0) >= total}
+
+
+def process_pending_events(batch_size=500):
+    """
+    Apply unprocessed inbox events to orders, one batch at a time.
+    Returns the number of events processed.
+    """
+    processed = 0
+    while True:
+        events = list(WebhookEvent.objects.filter(processed_at__isnull=True).order_by('received_at', 'id')[:batch_size])
+        if not events:
+            return processed
+
+        changes = [status_change(event.payload) for event in events]
+        changes = [change for change in changes if change and change[0]]
+        refunded = fully_refunded({payment_id for payment_id, status in changes if status == 'refunded'})
+
+        # Keep the highest-ranked change per payment
+        target = {}
+        for payment_id, status in changes:
+            if status == 'refunded' and payment_id not in refunded:
+                logger.info(f"Partial refund of payment {payment_id}; order status unchanged")
+                continue
+            if payment_id not in target or STATUS_PRECEDENCE.index(status) > STATUS_PRECEDENCE.index(target[payment_id]):
+                target[payment_id] = status
+
+        # One UPDATE per target status
+        payments_by_status = {}
+        for payment_id, status in target.items():
+            payments_by_status.setdefault(status, []).append(payment_id)
+        changed = set()
+        for status, payment_ids in payments_by_status.items():
+            orders = Order.objects.filter(
+                square_payment_id__in=payment_ids,
+                status__in=ALLOWED_TRANSITIONS[status],
+            )
+            pks = list(orders.values_list('pk', flat=True))
+            updated = orders.filter(pk__in=pks).update(status=status, updated_at=timezone.now())
+            changed.update(pks)
+            logger.info(f"Webhooks set {updated} order(s) to {status}")
+
+        # Refunds and cancellations take the orders out of the revenue rollups
+        analytics.update_orders(changed)
+
+        WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(processed_at=timezone.now())
+        processed += len(events)